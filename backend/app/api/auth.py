@@ -1,16 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.core.security import verify_password, get_password_hash, create_access_token, decode_access_token
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.core.security import (
+    verify_password_async, get_password_hash_async, create_access_token, decode_access_token, token_cache
+)
+from app.core.throttle import LoginThrottle
 from app.models.models import Usuario
 from app.schemas.schemas import UsuarioCreate, UsuarioResponse, Token, UsuarioLogin
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Usuarios autenticados por id. Se invalida al crear, activar/desactivar o
+# cambiar la contraseña de un usuario; en otros workers expira por TTL.
+usuario_cache = TTLCache(settings.AUTH_CACHE_MAX_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+
+# Intentos fallidos de login por cuenta y por IP
+throttle_cuenta = LoginThrottle(
+    settings.LOGIN_MAX_INTENTOS_CUENTA, settings.LOGIN_VENTANA_SEGUNDOS, settings.LOGIN_MAX_CLAVES
+)
+throttle_ip = LoginThrottle(settings.LOGIN_MAX_INTENTOS_IP, settings.LOGIN_VENTANA_SEGUNDOS, settings.LOGIN_MAX_CLAVES)
+
+
+def invalidar_usuario(user_id: int):
+    usuario_cache.invalidate(user_id)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
@@ -31,9 +52,14 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except (ValueError, TypeError):
         raise credentials_exception
     
-    user = db.query(Usuario).filter(Usuario.id == user_id).first()
+    user = usuario_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        user = await db.get(Usuario, user_id)
+        if user is None:
+            raise credentials_exception
+        # Separar de la sesión para que el objeto sobreviva a la petición
+        db.expunge(user)
+        usuario_cache.set(user_id, user)
     
     if user.activo == 0:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
@@ -41,7 +67,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     return user
 
 
-def get_current_admin(current_user: Usuario = Depends(get_current_user)):
+async def get_current_admin(current_user: Usuario = Depends(get_current_user)):
     if current_user.rol != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -51,14 +77,14 @@ def get_current_admin(current_user: Usuario = Depends(get_current_user)):
 
 
 @router.post("/register", response_model=UsuarioResponse)
-def register(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+async def register(usuario: UsuarioCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar si el email ya existe
-    db_user = db.query(Usuario).filter(Usuario.email == usuario.email).first()
+    db_user = await db.scalar(select(Usuario).where(Usuario.email == usuario.email))
     if db_user:
         raise HTTPException(status_code=400, detail="El email ya está registrado")
     
     # Crear nuevo usuario
-    hashed_password = get_password_hash(usuario.password)
+    hashed_password = await get_password_hash_async(usuario.password)
     db_user = Usuario(
         email=usuario.email,
         nombre_completo=usuario.nombre_completo,
@@ -66,21 +92,37 @@ def register(usuario: UsuarioCreate, db: Session = Depends(get_db)):
         rol=usuario.rol
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    invalidar_usuario(db_user.id)
     return db_user
 
 
 @router.post("/login", response_model=Token)
-def login(usuario: UsuarioLogin, db: Session = Depends(get_db)):
+async def login(usuario: UsuarioLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    # Rechazar antes de gastar bcrypt si la cuenta o la IP superaron los intentos
+    clave_cuenta = usuario.email.lower()
+    clave_ip = request.client.host if request.client else "desconocida"
+    retry_after = throttle_cuenta.retry_after(clave_cuenta) or throttle_ip.retry_after(clave_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos fallidos. Intenta más tarde",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
     # Buscar usuario
-    db_user = db.query(Usuario).filter(Usuario.email == usuario.email).first()
-    if not db_user or not verify_password(usuario.password, db_user.hashed_password):
+    db_user = await db.scalar(select(Usuario).where(Usuario.email == usuario.email))
+    if not db_user or not await verify_password_async(usuario.password, db_user.hashed_password):
+        throttle_cuenta.registrar_fallo(clave_cuenta)
+        throttle_ip.registrar_fallo(clave_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos"
         )
     
+    throttle_cuenta.reiniciar(clave_cuenta)
+    
     if db_user.activo == 0:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
     
@@ -95,5 +137,17 @@ def login(usuario: UsuarioLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UsuarioResponse)
-def get_me(current_user: Usuario = Depends(get_current_user)):
+async def get_me(current_user: Usuario = Depends(get_current_user)):
     return current_user
+
+
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: Usuario = Depends(get_current_admin)):
+    """
+    Aciertos y fallos de la caché de autenticación de este worker.
+    Solo para administradores.
+    """
+    return {
+        "usuarios": usuario_cache.stats(),
+        "tokens": token_cache.stats()
+    }
@@ -1,26 +1,97 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.models import Bolsa, Usuario
-from app.schemas.schemas import BolsaResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import datetime, date, time, timedelta
+from app.core.database import get_async_read_db
+from app.core.cache_respuestas import respuesta_cacheada, serializar
+from app.core.pagination import encode_cursor, decode_cursor, keyset_after
+from app.models.models import Bolsa, MovimientoBolsa, Usuario, TipoMovimientoEnum
+from app.schemas.schemas import BolsaResponse, MovimientoBolsaResponse, SaldoFechaResponse
 from app.api.auth import get_current_user
+from app.services.bolsa import saldo_a_fecha
 
 router = APIRouter()
 
 
 @router.get("/saldo", response_model=BolsaResponse)
-def get_saldo(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_saldo(
+    request: Request,
+    current_user: Usuario = Depends(get_current_user)
+):
     """
     Obtener el saldo actual de la bolsa.
     Disponible para admin y cliente.
+    La respuesta se guarda en caché hasta el siguiente movimiento de la bolsa.
     """
-    bolsa = db.query(Bolsa).first()
+    async def generar(db: AsyncSession):
+        bolsa = await db.scalar(select(Bolsa).order_by(Bolsa.id).limit(1))
+        
+        if not bolsa:
+            # Inicializar bolsa si no existe
+            bolsa = Bolsa(saldo_actual=0)
+            db.add(bolsa)
+            await db.commit()
+            await db.refresh(bolsa)
+        
+        return serializar(BolsaResponse, bolsa), {}
     
-    if not bolsa:
-        # Inicializar bolsa si no existe
-        bolsa = Bolsa(saldo_actual=0)
-        db.add(bolsa)
-        db.commit()
-        db.refresh(bolsa)
+    return await respuesta_cacheada(request, ["bolsa"], generar, solo_principal=True)
+
+
+@router.get("/saldo-historico", response_model=SaldoFechaResponse)
+async def get_saldo_historico(
+    fecha: datetime,
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Obtener el saldo que tenía la bolsa en una fecha y hora.
+    Disponible para admin y cliente.
+    """
+    return {"fecha": fecha, "saldo": await db.run_sync(saldo_a_fecha, fecha)}
+
+
+@router.get("/movimientos", response_model=List[MovimientoBolsaResponse])
+async def listar_movimientos(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    tipo: Optional[TipoMovimientoEnum] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Extracto de movimientos de la bolsa, del más reciente al más antiguo.
+    Disponible para admin y cliente.
+    El cursor de la siguiente página se devuelve en el header X-Next-Cursor.
+    """
+    query = select(MovimientoBolsa)
+    
+    if tipo:
+        query = query.filter(MovimientoBolsa.tipo == tipo)
+    if fecha_desde:
+        query = query.filter(MovimientoBolsa.fecha >= datetime.combine(fecha_desde, time.min))
+    if fecha_hasta:
+        query = query.filter(
+            MovimientoBolsa.fecha < datetime.combine(fecha_hasta + timedelta(days=1), time.min)
+        )
+    
+    if cursor:
+        posicion = decode_cursor(cursor)
+        if posicion is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.filter(keyset_after(MovimientoBolsa.fecha, MovimientoBolsa.id, *posicion))
+    
+    movimientos = (await db.scalars(query.order_by(
+        MovimientoBolsa.fecha.desc(), MovimientoBolsa.id.desc()
+    ).limit(limit + 1))).all()
+    
+    if len(movimientos) > limit:
+        movimientos = movimientos[:limit]
+        ultimo = movimientos[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(ultimo.fecha, ultimo.id)
     
-    return bolsa
+    return movimientos
@@ -1,47 +1,49 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, date
-from app.core.database import get_db
-from app.models.models import Bolsa, SoatExpedido, Recarga, Usuario
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, case, select
+from app.core.cache_respuestas import respuesta_cacheada, serializar
+from app.models.models import Bolsa, ResumenDiario, Usuario
 from app.schemas.schemas import DashboardStats
+from app.services.resumen import dia_resumen
 from app.api.auth import get_current_admin
 
 router = APIRouter()
 
 
 @router.get("/stats", response_model=DashboardStats)
-def get_dashboard_stats(
-    current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+async def get_dashboard_stats(
+    request: Request,
+    current_user: Usuario = Depends(get_current_admin)
 ):
     """
     Obtener estadísticas del dashboard.
     Solo para administradores.
+    Los totales se leen de resumen_diario en una sola consulta y la respuesta
+    se guarda en caché hasta el siguiente cambio de bolsa, SOATs o recargas,
+    o hasta que cambia el día.
     """
-    # Saldo actual
-    bolsa = db.query(Bolsa).first()
-    saldo_actual = bolsa.saldo_actual if bolsa else 0
+    # El mismo día con el que registrar_expedicion acumula soats_expedidos
+    hoy = dia_resumen(None)
     
-    # Total SOATs expedidos
-    total_soats_expedidos = db.query(func.count(SoatExpedido.id)).scalar()
+    async def generar(db: AsyncSession):
+        saldo_actual = select(Bolsa.saldo_actual).order_by(Bolsa.id).limit(1).scalar_subquery()
+        
+        stats = (await db.execute(select(
+            saldo_actual,
+            func.sum(ResumenDiario.soats_expedidos),
+            func.sum(ResumenDiario.total_comisiones),
+            func.sum(ResumenDiario.total_recargas),
+            func.sum(case((ResumenDiario.fecha == hoy, ResumenDiario.soats_expedidos), else_=0))
+        ))).one()
+        
+        return serializar(DashboardStats, {
+            "saldo_actual": stats[0] or 0,
+            "total_soats_expedidos": stats[1] or 0,
+            "total_comisiones_generadas": stats[2] or 0,
+            "total_recargas": stats[3] or 0,
+            "soats_hoy": stats[4] or 0
+        }), {}
     
-    # Total comisiones generadas
-    total_comisiones = db.query(func.sum(SoatExpedido.comision)).scalar() or 0
-    
-    # Total recargas (monto)
-    total_recargas = db.query(func.sum(Recarga.monto)).scalar() or 0
-    
-    # SOATs expedidos hoy
-    hoy = date.today()
-    soats_hoy = db.query(func.count(SoatExpedido.id)).filter(
-        func.date(SoatExpedido.fecha_expedicion) == hoy
-    ).scalar()
-    
-    return {
-        "saldo_actual": saldo_actual,
-        "total_soats_expedidos": total_soats_expedidos or 0,
-        "total_comisiones_generadas": total_comisiones,
-        "total_recargas": total_recargas,
-        "soats_hoy": soats_hoy or 0
-    }
+    return await respuesta_cacheada(
+        request, ["bolsa", "soats", "recargas"], generar, variante=hoy.isoformat()
+    )
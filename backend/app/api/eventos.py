@@ -0,0 +1,48 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.eventos import difusor
+from app.api.auth import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/")
+async def recibir_eventos(token: str = None):
+    """
+    Canal Server-Sent Events con los cambios de la bolsa y los SOATs y recargas nuevos.
+    Disponible para admin y cliente.
+    El token va en la URL porque EventSource no envía headers. Eventos:
+    `saldo` ({"saldo_actual"}), `soat_expedido`, `soat_actualizado` y `recarga`
+    (con el mismo contenido de las respuestas de la API). Cada
+    EVENTOS_PING_SEGUNDOS se envía un comentario para mantener viva la conexión.
+    """
+    if not token:
+        raise HTTPException(status_code=401, detail="Token requerido")
+
+    # Solo se valida al conectar; mientras no haya eventos no se consulta la base
+    async with AsyncSessionLocal() as db:
+        await get_current_user(token, db)
+
+    cola = difusor.suscribir()
+
+    async def transmitir():
+        try:
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(cola.get(), settings.EVENTOS_PING_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    mensaje = ": ping\n\n"
+                if mensaje is None:
+                    break
+                yield mensaje
+        finally:
+            difusor.desuscribir(cola)
+
+    return StreamingResponse(
+        transmitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Header, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime
-import os
-import shutil
-from pathlib import Path
-from app.core.database import get_db
-from app.models.models import Recarga, Bolsa, Usuario
+from datetime import datetime, date, time, timedelta
+from app.core.database import get_async_db, get_async_read_db
+from app.core.export import FormatoExportEnum, stream_export
+from app.core.downloads import respuesta_documento
+from app.core.eventos import publicar
+from app.core.cache_respuestas import respuesta_cacheada, serializar, invalidar
+from app.core.storage import eliminar_documento
+from app.core.validacion import ClaseDocumento, recibir_documento_validado
+from app.models.models import Recarga, Usuario, TipoMovimientoEnum
 from app.schemas.schemas import RecargaCreate, RecargaResponse
 from app.api.auth import get_current_admin, get_current_user
+from app.services.bolsa import acreditar_bolsa
+from app.services.documentos import almacenar_documento, reemplazar_documento
+from app.services.resumen import registrar_recarga
+from app.services.idempotencia import hash_solicitud, reclamar_clave, guardar_respuesta
 
 router = APIRouter()
 
@@ -20,79 +27,110 @@ async def crear_recarga(
     referencia: Optional[str] = Form(None),
     observaciones: Optional[str] = Form(None),
     documento_comprobante: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Registrar una nueva recarga de bolsa con comprobante opcional.
     Solo para administradores.
+    Con el header Idempotency-Key un reintento devuelve la respuesta original
+    sin volver a acreditar.
     """
-    # Validar archivo si se proporcionó
-    documento_path = None
+    # Recibir y validar el archivo si se proporcionó (PDF o imágenes, por su contenido)
+    comprobante = None
     if documento_comprobante:
-        # Validar tipo de archivo (PDF o imágenes)
-        allowed_types = ["application/pdf", "image/jpeg", "image/jpg", "image/png"]
-        if documento_comprobante.content_type not in allowed_types:
-            raise HTTPException(status_code=400, detail="El archivo debe ser PDF, JPG o PNG")
+        comprobante = await recibir_documento_validado(documento_comprobante, ClaseDocumento.COMPROBANTE)
+    
+    try:
+        # Un reintento con la misma Idempotency-Key repite la respuesta original
+        if idempotency_key:
+            repetida = await db.run_sync(reclamar_clave, current_user.id, idempotency_key, hash_solicitud(
+                monto=monto, referencia=referencia, observaciones=observaciones,
+                documento_comprobante=comprobante.sha256 if comprobante else None
+            ))
+            if repetida is not None:
+                return repetida
         
-        # Validar tamaño (10MB max)
-        if documento_comprobante.size and documento_comprobante.size > 10 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="El archivo no debe superar 10MB")
-    
-    # Obtener o crear bolsa
-    bolsa = db.query(Bolsa).first()
-    if not bolsa:
-        bolsa = Bolsa(saldo_actual=0)
-        db.add(bolsa)
-        db.commit()
-        db.refresh(bolsa)
-    
-    # Actualizar saldo de la bolsa
-    bolsa.saldo_actual += monto
-    
-    # Crear registro de recarga
-    db_recarga = Recarga(
-        monto=monto,
-        referencia=referencia,
-        observaciones=observaciones,
-        usuario_registro_id=current_user.id
-    )
-    
-    db.add(db_recarga)
-    db.commit()
-    db.refresh(db_recarga)
-    
-    # Guardar archivo si existe
-    if documento_comprobante:
-        upload_dir = Path("uploads/recargas")
-        upload_dir.mkdir(parents=True, exist_ok=True)
+        # Crear registro de recarga
+        db_recarga = Recarga(
+            monto=monto,
+            referencia=referencia,
+            observaciones=observaciones,
+            usuario_registro_id=current_user.id
+        )
+        
+        db.add(db_recarga)
+        await db.flush()
         
-        timestamp = int(datetime.now().timestamp())
-        extension = documento_comprobante.filename.split('.')[-1]
-        filename = f"{db_recarga.id}_comprobante_{timestamp}.{extension}"
-        file_path = upload_dir / filename
+        # Actualizar saldo de la bolsa (se inicializa si no existe)
+        saldo = await db.run_sync(
+            acreditar_bolsa, monto, TipoMovimientoEnum.RECARGA, current_user.id, recarga_id=db_recarga.id
+        )
+        await db.run_sync(registrar_recarga, monto)
         
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(documento_comprobante.file, buffer)
+        # Registrar el comprobante (ya publicado) por contenido
+        if comprobante:
+            db_recarga.documento_comprobante = await almacenar_documento(db, comprobante, comprobante.extension)
         
-        db_recarga.documento_comprobante = str(file_path)
-        db.commit()
-        db.refresh(db_recarga)
+        if idempotency_key:
+            await db.run_sync(
+                guardar_respuesta, current_user.id, idempotency_key,
+                RecargaResponse.model_validate(db_recarga).model_dump(mode="json")
+            )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    
+    await db.refresh(db_recarga)
+    
+    await invalidar("recargas", "bolsa")
+    await publicar("recarga", RecargaResponse.model_validate(db_recarga).model_dump(mode="json"))
+    await publicar("saldo", {"saldo_actual": saldo})
     
     return db_recarga
 
 
 @router.get("/", response_model=List[RecargaResponse])
-def listar_recargas(
-    current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def listar_recargas(
+    request: Request,
+    current_user: Usuario = Depends(get_current_user)
 ):
     """
     Listar todas las recargas.
     Disponible para admin y cliente.
+    La respuesta se guarda en caché hasta la siguiente modificación de recargas.
     """
-    recargas = db.query(Recarga).order_by(Recarga.fecha_recarga.desc()).all()
-    return recargas
+    async def generar(db: AsyncSession):
+        recargas = (await db.scalars(select(Recarga).order_by(Recarga.fecha_recarga.desc()))).all()
+        return serializar(List[RecargaResponse], recargas), {}
+    
+    return await respuesta_cacheada(request, ["recargas"], generar)
+
+
+@router.get("/export")
+async def exportar_recargas(
+    formato: FormatoExportEnum = FormatoExportEnum.NDJSON,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Exportar las recargas en NDJSON o CSV, transmitiendo fila por fila.
+    Disponible para admin y cliente.
+    """
+    def query_factory():
+        query = select(Recarga)
+        if fecha_desde:
+            query = query.filter(Recarga.fecha_recarga >= datetime.combine(fecha_desde, time.min))
+        if fecha_hasta:
+            query = query.filter(
+                Recarga.fecha_recarga < datetime.combine(fecha_hasta + timedelta(days=1), time.min)
+            )
+        return query.order_by(Recarga.fecha_recarga, Recarga.id)
+    
+    return stream_export(query_factory, RecargaResponse, formato, "recargas")
 
 
 @router.post("/{recarga_id}/upload-comprobante", response_model=RecargaResponse)
@@ -100,58 +138,42 @@ async def upload_comprobante(
     recarga_id: int,
     documento_comprobante: UploadFile = File(...),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Subir/actualizar comprobante de una recarga existente.
     Solo para administradores.
     """
     # Buscar recarga
-    recarga = db.query(Recarga).filter(Recarga.id == recarga_id).first()
+    recarga = await db.get(Recarga, recarga_id)
     if not recarga:
         raise HTTPException(status_code=404, detail="Recarga no encontrada")
     
-    # Validar tipo de archivo
-    allowed_types = ["application/pdf", "image/jpeg", "image/jpg", "image/png"]
-    if documento_comprobante.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="El archivo debe ser PDF, JPG o PNG")
-    
-    # Validar tamaño (10MB max)
-    if documento_comprobante.size and documento_comprobante.size > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="El archivo no debe superar 10MB")
-    
-    # Eliminar archivo anterior si existe
-    if recarga.documento_comprobante and os.path.exists(recarga.documento_comprobante):
-        try:
-            os.remove(recarga.documento_comprobante)
-        except Exception:
-            pass  # Si no se puede eliminar, continuar
-    
-    # Guardar nuevo archivo
-    upload_dir = Path("uploads/recargas")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    timestamp = int(datetime.now().timestamp())
-    extension = documento_comprobante.filename.split('.')[-1]
-    filename = f"{recarga_id}_comprobante_{timestamp}.{extension}"
-    file_path = upload_dir / filename
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_comprobante.file, buffer)
-    
-    # Actualizar BD
-    recarga.documento_comprobante = str(file_path)
-    db.commit()
-    db.refresh(recarga)
+    # Recibir y validar el nuevo archivo (PDF o imágenes, por su contenido)
+    recibido = await recibir_documento_validado(documento_comprobante, ClaseDocumento.COMPROBANTE)
+    try:
+        recarga.documento_comprobante, por_eliminar = await reemplazar_documento(
+            db, recarga.documento_comprobante, recibido, recibido.extension
+        )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await db.refresh(recarga)
+    await invalidar("recargas")
+    
+    # Eliminar el archivo anterior si ya nadie lo usa
+    await eliminar_documento(por_eliminar)
     
     return recarga
 
 
 @router.get("/{recarga_id}/documento-comprobante")
-def descargar_comprobante(
+async def descargar_comprobante(
     recarga_id: int,
+    request: Request,
     token: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Descargar/visualizar comprobante de una recarga.
@@ -166,11 +188,11 @@ def descargar_comprobante(
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    recarga = db.query(Recarga).filter(Recarga.id == recarga_id).first()
+    recarga = await db.get(Recarga, recarga_id)
     if not recarga:
         raise HTTPException(status_code=404, detail="Recarga no encontrada")
     
-    if not recarga.documento_comprobante or not os.path.exists(recarga.documento_comprobante):
+    if not recarga.documento_comprobante:
         raise HTTPException(status_code=404, detail="Comprobante no encontrado")
     
     # Determinar tipo de archivo
@@ -184,10 +206,10 @@ def descargar_comprobante(
     else:
         media_type = "application/octet-stream"
     
-    return FileResponse(
-        path=recarga.documento_comprobante,
-        media_type=media_type,
-        headers={
-            "Content-Disposition": f"inline; filename=comprobante_recarga_{recarga_id}.{extension}"
-        }
+    return respuesta_documento(
+        request,
+        recarga.documento_comprobante,
+        media_type,
+        f"comprobante_recarga_{recarga_id}.{extension}",
+        "Comprobante no encontrado"
     )
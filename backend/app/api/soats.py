@@ -1,20 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+import asyncio
+import json
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Header, Query, Request
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
 from typing import List, Optional
-from datetime import datetime
-import os
-import shutil
-from pathlib import Path
-from app.core.database import get_db
+from datetime import datetime, date, time, timedelta, timezone
+from app.core.database import get_async_db, get_async_read_db
 from app.core.config import settings
-from app.models.models import SoatExpedido, Bolsa, Usuario, TipoMotoCCEnum
-from app.schemas.schemas import SoatExpedidoCreate, SoatExpedidoResponse, SoatExpedidoUpdate
+from app.core.export import FormatoExportEnum, stream_export
+from app.core.downloads import respuesta_documento
+from app.core.eventos import publicar
+from app.core.cache_respuestas import respuesta_cacheada, serializar, invalidar
+from app.core.storage import eliminar_documento
+from app.core.validacion import ClaseDocumento, recibir_documento_validado
+from app.core.pagination import encode_cursor, decode_cursor, keyset_after
+from app.core.busqueda import CampoBusquedaEnum, clave_busqueda, escapar_like, trigramas_disponibles
+from app.models.models import SoatExpedido, Usuario, TipoMotoCCEnum, TipoMovimientoEnum
+from app.schemas.schemas import (
+    SoatExpedidoCreate, SoatExpedidoResponse, SoatExpedidoUpdate, SoatLoteItem, SoatLoteResponse
+)
 from app.api.auth import get_current_user, get_current_admin
+from app.services.bolsa import debitar_bolsa, debitar_bolsa_lote, ajustar_bolsa
+from app.services.documentos import almacenar_documento, reemplazar_documento
+from app.services.resumen import registrar_expedicion, registrar_ajuste_soat
+from app.services.tarifas import tarifa_soat
+from app.services.idempotencia import hash_solicitud, reclamar_clave, guardar_respuesta
 
 router = APIRouter()
 
 
+async def _soats_vigentes(db: AsyncSession, claves: List[str], excluir_ids: List[int] = ()):
+    """
+    SOATs todavía vigentes para las placas dadas (por clave de búsqueda).
+    Usa el índice (placa_busqueda, fecha_expedicion).
+    """
+    desde = datetime.now(timezone.utc) - timedelta(days=settings.SOAT_VIGENCIA_DIAS)
+    query = select(SoatExpedido).where(
+        SoatExpedido.placa_busqueda.in_(claves),
+        SoatExpedido.fecha_expedicion > desde
+    )
+    if excluir_ids:
+        query = query.where(SoatExpedido.id.notin_(excluir_ids))
+    return (await db.scalars(
+        query.order_by(SoatExpedido.fecha_expedicion.desc(), SoatExpedido.id.desc())
+    )).all()
+
+
+def _mensaje_vigente(soat: SoatExpedido) -> str:
+    return (
+        f"La placa {soat.placa} ya tiene un SOAT vigente (#{soat.id}, expedido el "
+        f"{soat.fecha_expedicion:%Y-%m-%d}). Envíe forzar=true para expedir otro"
+    )
+
+
 @router.post("/", response_model=SoatExpedidoResponse)
 async def expedir_soat(
     placa: str = Form(...),
@@ -22,169 +63,505 @@ async def expedir_soat(
     nombre_propietario: Optional[str] = Form(None),
     tipo_moto: TipoMotoCCEnum = Form(...),
     observaciones: Optional[str] = Form(None),
+    forzar: bool = Form(False),
     documento_factura: UploadFile = File(...),
     documento_soat: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Expedir un nuevo SOAT con documentos PDF.
     Solo para administradores.
+    Rechaza con 409 la placa que ya tiene un SOAT vigente, salvo con forzar=true.
+    Con el header Idempotency-Key un reintento devuelve la respuesta original
+    sin volver a cobrar.
     """
-    # Validar que los archivos sean PDFs
-    if documento_factura.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="El documento de factura debe ser un PDF")
-    if documento_soat.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="El documento SOAT debe ser un PDF")
+    clave_placa = clave_busqueda(placa)
+    if not clave_placa:
+        raise HTTPException(status_code=400, detail="Placa inválida")
     
     # Determinar valor del SOAT según tipo
-    if tipo_moto == TipoMotoCCEnum.HASTA_99CC:
-        valor_soat = settings.TARIFA_MOTO_HASTA_99CC
-    elif tipo_moto == TipoMotoCCEnum.DE_100_200CC:
-        valor_soat = settings.TARIFA_MOTO_100_200CC
-    else:
-        raise HTTPException(status_code=400, detail="Tipo de moto inválido")
-    
+    valor_soat = tarifa_soat(tipo_moto)
     comision = settings.COMISION_FIJA
     total = valor_soat + comision
     
-    # Verificar saldo en bolsa
-    bolsa = db.query(Bolsa).first()
-    if not bolsa:
-        raise HTTPException(status_code=400, detail="No hay bolsa inicializada")
+    # Recibir, validar y publicar los PDFs antes de tocar la bolsa: si alguno falla no se
+    # cobra nada, y con S3 la subida no ocurre con la bolsa bloqueada
+    factura = await recibir_documento_validado(documento_factura, ClaseDocumento.FACTURA)
+    soat_pdf = await recibir_documento_validado(documento_soat, ClaseDocumento.SOAT)
+    
+    try:
+        # Un reintento con la misma Idempotency-Key repite la respuesta original
+        if idempotency_key:
+            repetida = await db.run_sync(reclamar_clave, current_user.id, idempotency_key, hash_solicitud(
+                placa=placa, cedula=cedula, nombre_propietario=nombre_propietario, tipo_moto=tipo_moto,
+                observaciones=observaciones, forzar=forzar,
+                documento_factura=factura.sha256, documento_soat=soat_pdf.sha256
+            ))
+            if repetida is not None:
+                return repetida
+        
+        # Crear registro de SOAT expedido
+        db_soat = SoatExpedido(
+            placa=placa.upper(),
+            cedula=cedula.upper() if cedula else None,
+            nombre_propietario=nombre_propietario.upper() if nombre_propietario else None,
+            tipo_moto=tipo_moto,
+            valor_soat=valor_soat,
+            comision=comision,
+            total=total,
+            observaciones=observaciones,
+            usuario_registro_id=current_user.id
+        )
+        
+        db.add(db_soat)
+        await db.flush()
+        
+        # Descontar de la bolsa (falla si el saldo no alcanza)
+        saldo = await db.run_sync(
+            debitar_bolsa, total, TipoMovimientoEnum.EXPEDICION, current_user.id, soat_id=db_soat.id
+        )
+        await db.run_sync(registrar_expedicion, valor_soat, comision)
+        
+        # Con la bolsa bloqueada por el débito las expediciones se serializan:
+        # esta consulta ya ve cualquier SOAT confirmado para la misma placa
+        if not forzar:
+            vigentes = await _soats_vigentes(db, [clave_placa], [db_soat.id])
+            if vigentes:
+                raise HTTPException(status_code=409, detail=_mensaje_vigente(vigentes[0]))
+        
+        # Registrar los PDFs (ya publicados) por contenido
+        db_soat.documento_factura = await almacenar_documento(db, factura, "pdf")
+        db_soat.documento_soat = await almacenar_documento(db, soat_pdf, "pdf")
+        
+        if idempotency_key:
+            await db.run_sync(
+                guardar_respuesta, current_user.id, idempotency_key,
+                SoatExpedidoResponse.model_validate(db_soat).model_dump(mode="json")
+            )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    
+    await db.refresh(db_soat)
+    
+    await invalidar("soats", "bolsa")
+    await publicar("soat_expedido", SoatExpedidoResponse.model_validate(db_soat).model_dump(mode="json"))
+    await publicar("saldo", {"saldo_actual": saldo})
     
-    if bolsa.saldo_actual < total:
+    return db_soat
+
+
+@router.post("/lote", response_model=SoatLoteResponse)
+async def expedir_lote(
+    registros: str = Form(..., description="Lista JSON de SOATs con archivo_factura y archivo_soat"),
+    forzar: bool = Form(False),
+    documentos: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: Usuario = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Expedir varios SOATs en una sola operación.
+    Solo para administradores.
+    `registros` es una lista JSON donde cada elemento trae los datos del SOAT y
+    los nombres de sus PDFs (archivo_factura, archivo_soat) dentro de `documentos`.
+    Es todo o nada: se valida el lote completo, se descuenta el total de la bolsa
+    una sola vez y si algo falla no se expide ninguno. Sin forzar=true se rechaza
+    el lote si alguna placa se repite o ya tiene un SOAT vigente.
+    Acepta el header Idempotency-Key.
+    """
+    # Validar los registros
+    try:
+        datos = json.loads(registros)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="registros debe ser una lista JSON")
+    if not isinstance(datos, list) or not datos:
+        raise HTTPException(status_code=400, detail="registros debe ser una lista JSON no vacía")
+    if len(datos) > settings.MAX_SOATS_POR_LOTE:
         raise HTTPException(
             status_code=400,
-            detail=f"Saldo insuficiente. Saldo actual: ${bolsa.saldo_actual:,}, Requerido: ${total:,}"
+            detail=f"El lote no debe superar {settings.MAX_SOATS_POR_LOTE} SOATs"
         )
     
-    # Descontar de la bolsa
-    bolsa.saldo_actual -= total
-    
-    # Crear registro de SOAT expedido (sin documentos aún)
-    db_soat = SoatExpedido(
-        placa=placa.upper(),
-        cedula=cedula.upper() if cedula else None,
-        nombre_propietario=nombre_propietario.upper() if nombre_propietario else None,
-        tipo_moto=tipo_moto,
-        valor_soat=valor_soat,
-        comision=comision,
-        total=total,
-        observaciones=observaciones,
-        usuario_registro_id=current_user.id
+    items = []
+    errores = []
+    for indice, dato in enumerate(datos):
+        try:
+            items.append(SoatLoteItem.model_validate(dato))
+        except ValidationError as e:
+            errores.append({"indice": indice, "error": e.errors(include_url=False, include_context=False)})
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+    
+    # Placas repetidas dentro del lote
+    claves = [clave_busqueda(item.placa) for item in items]
+    for indice, clave in enumerate(claves):
+        if not clave:
+            errores.append({"indice": indice, "error": "Placa inválida"})
+        elif not forzar and claves.index(clave) != indice:
+            errores.append({"indice": indice, "error": f"Placa repetida en el lote: {items[indice].placa}"})
+    if errores:
+        raise HTTPException(status_code=400, detail=errores)
+    
+    # Validar los documentos referenciados
+    archivos = {}
+    for documento in documentos:
+        if documento.filename in archivos:
+            raise HTTPException(status_code=400, detail=f"Documento repetido: {documento.filename}")
+        archivos[documento.filename] = documento
+    
+    referencias = Counter()
+    clases = {}
+    for indice, item in enumerate(items):
+        for nombre, clase in (
+            (item.archivo_factura, ClaseDocumento.FACTURA),
+            (item.archivo_soat, ClaseDocumento.SOAT)
+        ):
+            if nombre not in archivos:
+                errores.append({"indice": indice, "error": f"Falta el documento {nombre}"})
+            referencias[nombre] += 1
+            clases.setdefault(nombre, set()).add(clase)
+    if errores:
+        raise HTTPException(status_code=400, detail=errores)
+    
+    # Recibir, validar y publicar en paralelo los PDFs referenciados antes de tocar la bolsa
+    nombres = list(referencias)
+    resultados = await asyncio.gather(
+        *(recibir_documento_validado(archivos[nombre], *clases[nombre]) for nombre in nombres),
+        return_exceptions=True
     )
+    fallo = next((r for r in resultados if isinstance(r, BaseException)), None)
+    if fallo is not None:
+        raise fallo
+    recibidos = dict(zip(nombres, resultados))
     
-    db.add(db_soat)
-    db.commit()
-    db.refresh(db_soat)
-    
-    # Guardar archivos PDF
-    upload_dir = Path("uploads/soats")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    timestamp = int(datetime.now().timestamp())
-    
-    # Guardar factura
-    factura_filename = f"{db_soat.id}_factura_{timestamp}.pdf"
-    factura_path = upload_dir / factura_filename
-    with factura_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_factura.file, buffer)
-    
-    # Guardar SOAT
-    soat_filename = f"{db_soat.id}_soat_{timestamp}.pdf"
-    soat_path = upload_dir / soat_filename
-    with soat_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_soat.file, buffer)
+    comision = settings.COMISION_FIJA
+    try:
+        # Un reintento con la misma Idempotency-Key repite la respuesta original
+        if idempotency_key:
+            repetida = await db.run_sync(reclamar_clave, current_user.id, idempotency_key, hash_solicitud(
+                registros=datos, forzar=forzar,
+                documentos={nombre: recibido.sha256 for nombre, recibido in recibidos.items()}
+            ))
+            if repetida is not None:
+                return repetida
+        
+        # Insertar todos los SOATs
+        db_soats = []
+        for item in items:
+            valor_soat = tarifa_soat(item.tipo_moto)
+            db_soats.append(SoatExpedido(
+                placa=item.placa.upper(),
+                cedula=item.cedula.upper() if item.cedula else None,
+                nombre_propietario=item.nombre_propietario.upper() if item.nombre_propietario else None,
+                tipo_moto=item.tipo_moto,
+                valor_soat=valor_soat,
+                comision=comision,
+                total=valor_soat + comision,
+                observaciones=item.observaciones,
+                usuario_registro_id=current_user.id
+            ))
+        db.add_all(db_soats)
+        await db.flush()
+        
+        # Un solo descuento de la bolsa por el total del lote
+        saldo = await db.run_sync(
+            debitar_bolsa_lote,
+            [(soat.id, soat.total) for soat in db_soats],
+            TipoMovimientoEnum.EXPEDICION,
+            current_user.id,
+            detalle="Saldo insuficiente para el lote"
+        )
+        if not forzar:
+            vigentes = await _soats_vigentes(db, claves, [soat.id for soat in db_soats])
+            if vigentes:
+                # El más reciente de cada placa
+                por_placa = {}
+                for soat in vigentes:
+                    por_placa.setdefault(soat.placa_busqueda, soat)
+                raise HTTPException(
+                    status_code=409,
+                    detail=[_mensaje_vigente(soat) for soat in por_placa.values()]
+                )
+        await db.run_sync(
+            registrar_expedicion,
+            sum(soat.valor_soat for soat in db_soats),
+            comision * len(db_soats),
+            cantidad=len(db_soats)
+        )
+        
+        # Registrar los PDFs (ya publicados) por contenido
+        rutas = {}
+        for nombre, recibido in recibidos.items():
+            rutas[nombre] = await almacenar_documento(db, recibido, "pdf", referencias[nombre])
+        for soat, item in zip(db_soats, items):
+            soat.documento_factura = rutas[item.archivo_factura]
+            soat.documento_soat = rutas[item.archivo_soat]
+        
+        # La respuesta se arma antes del commit, mientras los objetos están cargados
+        respuesta = SoatLoteResponse(
+            cantidad=len(db_soats),
+            total=sum(soat.total for soat in db_soats),
+            soats=db_soats
+        )
+        if idempotency_key:
+            await db.run_sync(
+                guardar_respuesta, current_user.id, idempotency_key, respuesta.model_dump(mode="json")
+            )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    
+    await invalidar("soats", "bolsa")
+    for soat in respuesta.soats:
+        await publicar("soat_expedido", soat.model_dump(mode="json"))
+    await publicar("saldo", {"saldo_actual": saldo})
+    
+    return respuesta
+
+
+def _filtrar_soats(
+    query,
+    placa: Optional[str],
+    cedula: Optional[str],
+    tipo_moto: Optional[TipoMotoCCEnum],
+    fecha_desde: Optional[date],
+    fecha_hasta: Optional[date],
+    prefijo: bool = False
+):
+    """
+    Aplicar los filtros del listado de SOATs a una consulta.
+    Con prefijo=true la placa se busca por prefijo de la clave (mientras se escribe).
+    """
+    if placa:
+        clave = clave_busqueda(placa)
+        if prefijo:
+            # La clave solo tiene letras y números: no hay comodines que escapar
+            query = query.filter(SoatExpedido.placa_busqueda.like(f"{clave}%"))
+        else:
+            query = query.filter(SoatExpedido.placa_busqueda == clave)
+    if cedula:
+        query = query.filter(SoatExpedido.cedula_busqueda == clave_busqueda(cedula))
+    if tipo_moto:
+        query = query.filter(SoatExpedido.tipo_moto == tipo_moto)
+    if fecha_desde:
+        query = query.filter(SoatExpedido.fecha_expedicion >= datetime.combine(fecha_desde, time.min))
+    if fecha_hasta:
+        query = query.filter(
+            SoatExpedido.fecha_expedicion < datetime.combine(fecha_hasta + timedelta(days=1), time.min)
+        )
+    return query
+
+
+@router.get("/", response_model=List[SoatExpedidoResponse])
+async def listar_soats(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    placa: Optional[str] = None,
+    cedula: Optional[str] = None,
+    tipo_moto: Optional[TipoMotoCCEnum] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    prefijo: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Listar los SOATs expedidos, del más reciente al más antiguo.
+    Disponible para admin y cliente.
+    Se pagina por cursor sobre (fecha_expedicion, id), `limit` registros por
+    página: el cursor de la siguiente se devuelve en el header X-Next-Cursor.
+    Para obtener todos los registros usar /export.
+    La respuesta se guarda en caché hasta la siguiente modificación de SOATs.
+    """
+    async def generar(db: AsyncSession):
+        query = _filtrar_soats(
+            select(SoatExpedido), placa, cedula, tipo_moto, fecha_desde, fecha_hasta, prefijo
+        )
+        
+        # Posición del cursor
+        if cursor:
+            posicion = decode_cursor(cursor)
+            if posicion is None:
+                raise HTTPException(status_code=400, detail="Cursor inválido")
+            query = query.filter(
+                keyset_after(SoatExpedido.fecha_expedicion, SoatExpedido.id, *posicion)
+            )
+        
+        query = query.order_by(SoatExpedido.fecha_expedicion.desc(), SoatExpedido.id.desc())
+        
+        # Pedir un registro extra para saber si hay página siguiente
+        headers = {}
+        soats = (await db.scalars(query.limit(limit + 1))).all()
+        if len(soats) > limit:
+            soats = soats[:limit]
+            ultimo = soats[-1]
+            headers["X-Next-Cursor"] = encode_cursor(ultimo.fecha_expedicion, ultimo.id)
+        
+        return serializar(List[SoatExpedidoResponse], soats), headers
     
-    # Actualizar rutas en BD
-    db_soat.documento_factura = str(factura_path)
-    db_soat.documento_soat = str(soat_path)
-    db.commit()
-    db.refresh(db_soat)
+    return await respuesta_cacheada(request, ["soats"], generar)
+
+
+@router.get("/export")
+async def exportar_soats(
+    formato: FormatoExportEnum = FormatoExportEnum.NDJSON,
+    placa: Optional[str] = None,
+    cedula: Optional[str] = None,
+    tipo_moto: Optional[TipoMotoCCEnum] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    prefijo: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Exportar los SOATs expedidos en NDJSON o CSV, transmitiendo fila por fila.
+    Disponible para admin y cliente.
+    """
+    def query_factory():
+        query = _filtrar_soats(
+            select(SoatExpedido), placa, cedula, tipo_moto, fecha_desde, fecha_hasta, prefijo
+        )
+        return query.order_by(SoatExpedido.fecha_expedicion, SoatExpedido.id)
     
-    return db_soat
+    return stream_export(query_factory, SoatExpedidoResponse, formato, "soats_expedidos")
 
 
-@router.get("/", response_model=List[SoatExpedidoResponse])
-def listar_soats(
+@router.get("/vigente", response_model=SoatExpedidoResponse)
+async def obtener_soat_vigente(
+    placa: str,
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Listar todos los SOATs expedidos.
+    Obtener el SOAT vigente de una placa, para verificar antes de expedir.
     Disponible para admin y cliente.
     """
-    soats = db.query(SoatExpedido).order_by(SoatExpedido.fecha_expedicion.desc()).all()
-    return soats
+    clave = clave_busqueda(placa)
+    vigentes = await _soats_vigentes(db, [clave]) if clave else []
+    if not vigentes:
+        raise HTTPException(status_code=404, detail="La placa no tiene un SOAT vigente")
+    return vigentes[0]
+
+
+@router.get("/buscar", response_model=List[SoatExpedidoResponse])
+async def buscar_soats(
+    q: str = Query(..., min_length=1, max_length=100),
+    campo: CampoBusquedaEnum = CampoBusquedaEnum.PLACA,
+    prefijo: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Buscar SOATs por placa, cédula o nombre del propietario.
+    Disponible para admin y cliente.
+    Placa y cédula se comparan sin espacios ni guiones ("abc-12 3" = "ABC123"),
+    exactas o por prefijo. El nombre se busca por contenido y, si PostgreSQL
+    tiene pg_trgm, también por similitud, ordenando por parecido.
+    """
+    query = select(SoatExpedido)
+    
+    if campo == CampoBusquedaEnum.NOMBRE:
+        termino = q.strip()
+        if not termino:
+            raise HTTPException(status_code=400, detail="Término de búsqueda inválido")
+        patron = f"{escapar_like(termino)}%" if prefijo else f"%{escapar_like(termino)}%"
+        condicion = SoatExpedido.nombre_propietario.ilike(patron, escape="\\")
+        
+        if await db.run_sync(trigramas_disponibles):
+            if not prefijo:
+                condicion = condicion | SoatExpedido.nombre_propietario.op("%")(termino)
+            query = query.filter(condicion).order_by(
+                func.similarity(SoatExpedido.nombre_propietario, termino).desc(),
+                SoatExpedido.id.desc()
+            )
+        else:
+            query = query.filter(condicion).order_by(
+                SoatExpedido.fecha_expedicion.desc(), SoatExpedido.id.desc()
+            )
+        return (await db.scalars(query.limit(limit))).all()
+    
+    clave = clave_busqueda(q)
+    if not clave:
+        raise HTTPException(status_code=400, detail="Término de búsqueda inválido")
+    columna = SoatExpedido.placa_busqueda if campo == CampoBusquedaEnum.PLACA else SoatExpedido.cedula_busqueda
+    
+    if prefijo:
+        # La clave solo tiene letras y números: no hay comodines que escapar
+        query = query.filter(columna.like(f"{clave}%")).order_by(
+            columna, SoatExpedido.fecha_expedicion.desc(), SoatExpedido.id.desc()
+        )
+    else:
+        query = query.filter(columna == clave).order_by(
+            SoatExpedido.fecha_expedicion.desc(), SoatExpedido.id.desc()
+        )
+    return (await db.scalars(query.limit(limit))).all()
 
 
 @router.get("/{soat_id}", response_model=SoatExpedidoResponse)
-def obtener_soat(
+async def obtener_soat(
     soat_id: int,
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Obtener un SOAT específico por ID.
     Disponible para admin y cliente.
     """
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     return soat
 
 
 @router.put("/{soat_id}", response_model=SoatExpedidoResponse)
-def actualizar_soat(
+async def actualizar_soat(
     soat_id: int,
     soat_data: SoatExpedidoUpdate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Actualizar datos de un SOAT expedido.
     Solo para administradores.
     Ajusta automáticamente el saldo de la bolsa si cambia el tipo de moto.
+    Acepta el header Idempotency-Key.
     """
-    # Buscar SOAT
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    if idempotency_key:
+        repetida = await db.run_sync(reclamar_clave, current_user.id, idempotency_key, hash_solicitud(
+            soat_id=soat_id, **soat_data.model_dump()
+        ))
+        if repetida is not None:
+            return repetida
+    
+    # Buscar SOAT (bloqueado para que dos ediciones no ajusten la bolsa dos veces)
+    soat = await db.scalar(select(SoatExpedido).where(SoatExpedido.id == soat_id).with_for_update())
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    # Obtener bolsa
-    bolsa = db.query(Bolsa).first()
-    if not bolsa:
-        raise HTTPException(status_code=400, detail="No hay bolsa inicializada")
-    
     # Si cambia el tipo de moto, recalcular valores y ajustar bolsa
+    saldo = None
     if soat_data.tipo_moto and soat_data.tipo_moto != soat.tipo_moto:
         # Calcular nuevo valor según tipo
-        if soat_data.tipo_moto == TipoMotoCCEnum.HASTA_99CC:
-            nuevo_valor_soat = settings.TARIFA_MOTO_HASTA_99CC
-        elif soat_data.tipo_moto == TipoMotoCCEnum.DE_100_200CC:
-            nuevo_valor_soat = settings.TARIFA_MOTO_100_200CC
-        else:
-            raise HTTPException(status_code=400, detail="Tipo de moto inválido")
-        
+        nuevo_valor_soat = tarifa_soat(soat_data.tipo_moto)
         comision = settings.COMISION_FIJA
         nuevo_total = nuevo_valor_soat + comision
         
         # Calcular diferencia
         diferencia = nuevo_total - soat.total
         
-        # Ajustar bolsa
-        if diferencia > 0:
-            # Se necesita descontar más de la bolsa
-            if bolsa.saldo_actual < diferencia:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Saldo insuficiente para el cambio. Diferencia: ${diferencia:,}, Saldo: ${bolsa.saldo_actual:,}"
-                )
-            bolsa.saldo_actual -= diferencia
-        else:
-            # Se devuelve dinero a la bolsa
-            bolsa.saldo_actual += abs(diferencia)
+        # Ajustar bolsa: si la diferencia es positiva se descuenta, si no se devuelve
+        if diferencia != 0:
+            saldo = await db.run_sync(
+                ajustar_bolsa, diferencia, current_user.id, soat.id, "Saldo insuficiente para el cambio"
+            )
+        await db.run_sync(registrar_ajuste_soat, soat.fecha_expedicion, nuevo_valor_soat - soat.valor_soat)
         
         # Actualizar valores del SOAT
         soat.tipo_moto = soat_data.tipo_moto
@@ -201,8 +578,18 @@ def actualizar_soat(
     if soat_data.observaciones is not None:
         soat.observaciones = soat_data.observaciones
     
-    db.commit()
-    db.refresh(soat)
+    if idempotency_key:
+        await db.run_sync(
+            guardar_respuesta, current_user.id, idempotency_key,
+            SoatExpedidoResponse.model_validate(soat).model_dump(mode="json")
+        )
+    await db.commit()
+    await db.refresh(soat)
+    
+    await invalidar("soats", "bolsa")
+    await publicar("soat_actualizado", SoatExpedidoResponse.model_validate(soat).model_dump(mode="json"))
+    if saldo is not None:
+        await publicar("saldo", {"saldo_actual": saldo})
     
     return soat
 
@@ -212,44 +599,33 @@ async def reemplazar_factura(
     soat_id: int,
     documento_factura: UploadFile = File(...),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Reemplazar documento de factura de un SOAT expedido.
     Solo para administradores.
-    Elimina el archivo anterior y guarda el nuevo.
+    Guarda el nuevo archivo y elimina el anterior si ya nadie lo usa.
     """
     # Buscar SOAT
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    # Validar que sea PDF
-    if documento_factura.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="El documento debe ser un PDF")
-    
-    # Eliminar archivo anterior si existe
-    if soat.documento_factura and os.path.exists(soat.documento_factura):
-        try:
-            os.remove(soat.documento_factura)
-        except Exception:
-            pass  # Si no se puede eliminar, continuar
-    
-    # Guardar nuevo archivo
-    upload_dir = Path("uploads/soats")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    timestamp = int(datetime.now().timestamp())
-    factura_filename = f"{soat_id}_factura_{timestamp}.pdf"
-    factura_path = upload_dir / factura_filename
-    
-    with factura_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_factura.file, buffer)
+    # Guardar nuevo archivo y actualizar BD
+    recibido = await recibir_documento_validado(documento_factura, ClaseDocumento.FACTURA)
+    try:
+        soat.documento_factura, por_eliminar = await reemplazar_documento(
+            db, soat.documento_factura, recibido, "pdf"
+        )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await db.refresh(soat)
+    await invalidar("soats")
     
-    # Actualizar BD
-    soat.documento_factura = str(factura_path)
-    db.commit()
-    db.refresh(soat)
+    # Eliminar el archivo anterior si ya nadie lo usa
+    await eliminar_documento(por_eliminar)
     
     return soat
 
@@ -259,44 +635,33 @@ async def reemplazar_soat(
     soat_id: int,
     documento_soat: UploadFile = File(...),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Reemplazar documento SOAT de un SOAT expedido.
     Solo para administradores.
-    Elimina el archivo anterior y guarda el nuevo.
+    Guarda el nuevo archivo y elimina el anterior si ya nadie lo usa.
     """
     # Buscar SOAT
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    # Validar que sea PDF
-    if documento_soat.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="El documento debe ser un PDF")
-    
-    # Eliminar archivo anterior si existe
-    if soat.documento_soat and os.path.exists(soat.documento_soat):
-        try:
-            os.remove(soat.documento_soat)
-        except Exception:
-            pass  # Si no se puede eliminar, continuar
-    
-    # Guardar nuevo archivo
-    upload_dir = Path("uploads/soats")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    timestamp = int(datetime.now().timestamp())
-    soat_filename = f"{soat_id}_soat_{timestamp}.pdf"
-    soat_path = upload_dir / soat_filename
-    
-    with soat_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_soat.file, buffer)
+    # Guardar nuevo archivo y actualizar BD
+    recibido = await recibir_documento_validado(documento_soat, ClaseDocumento.SOAT)
+    try:
+        soat.documento_soat, por_eliminar = await reemplazar_documento(
+            db, soat.documento_soat, recibido, "pdf"
+        )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await db.refresh(soat)
+    await invalidar("soats")
     
-    # Actualizar BD
-    soat.documento_soat = str(soat_path)
-    db.commit()
-    db.refresh(soat)
+    # Eliminar el archivo anterior si ya nadie lo usa
+    await eliminar_documento(por_eliminar)
     
     return soat
 
@@ -306,45 +671,40 @@ async def upload_poliza(
     soat_id: int,
     documento_poliza: UploadFile = File(...),
     current_user: Usuario = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Subir PDF de póliza a un SOAT expedido.
     Solo para administradores.
     """
     # Buscar SOAT
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    # Validar que sea PDF
-    if documento_poliza.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="El documento debe ser un PDF")
-    
-    # Guardar archivo
-    upload_dir = Path("uploads/soats")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    timestamp = int(datetime.now().timestamp())
-    poliza_filename = f"{soat_id}_poliza_{timestamp}.pdf"
-    poliza_path = upload_dir / poliza_filename
-    
-    with poliza_path.open("wb") as buffer:
-        shutil.copyfileobj(documento_poliza.file, buffer)
-    
-    # Actualizar BD
-    soat.documento_poliza = str(poliza_path)
-    db.commit()
-    db.refresh(soat)
+    # Guardar archivo y actualizar BD
+    recibido = await recibir_documento_validado(documento_poliza, ClaseDocumento.POLIZA)
+    try:
+        soat.documento_poliza, por_eliminar = await reemplazar_documento(
+            db, soat.documento_poliza, recibido, "pdf"
+        )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    await db.refresh(soat)
+    await invalidar("soats")
+    await eliminar_documento(por_eliminar)
     
     return soat
 
 
 @router.get("/{soat_id}/documento-factura")
-def descargar_factura(
+async def descargar_factura(
     soat_id: int,
+    request: Request,
     token: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Descargar PDF de factura de un SOAT.
@@ -359,27 +719,25 @@ def descargar_factura(
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    if not soat.documento_factura or not os.path.exists(soat.documento_factura):
-        raise HTTPException(status_code=404, detail="Documento de factura no encontrado")
-    
-    return FileResponse(
-        path=soat.documento_factura,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"inline; filename=factura_soat_{soat_id}.pdf"
-        }
+    return respuesta_documento(
+        request,
+        soat.documento_factura,
+        "application/pdf",
+        f"factura_soat_{soat_id}.pdf",
+        "Documento de factura no encontrado"
     )
 
 
 @router.get("/{soat_id}/documento-soat")
-def descargar_soat(
+async def descargar_soat(
     soat_id: int,
+    request: Request,
     token: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Descargar PDF del SOAT expedido.
@@ -394,27 +752,25 @@ def descargar_soat(
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    if not soat.documento_soat or not os.path.exists(soat.documento_soat):
-        raise HTTPException(status_code=404, detail="Documento SOAT no encontrado")
-    
-    return FileResponse(
-        path=soat.documento_soat,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"inline; filename=soat_{soat_id}.pdf"
-        }
+    return respuesta_documento(
+        request,
+        soat.documento_soat,
+        "application/pdf",
+        f"soat_{soat_id}.pdf",
+        "Documento SOAT no encontrado"
     )
 
 
 @router.get("/{soat_id}/documento-poliza")
-def descargar_poliza(
+async def descargar_poliza(
     soat_id: int,
+    request: Request,
     token: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Descargar PDF de póliza de un SOAT.
@@ -429,17 +785,14 @@ def descargar_poliza(
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    soat = db.query(SoatExpedido).filter(SoatExpedido.id == soat_id).first()
+    soat = await db.get(SoatExpedido, soat_id)
     if not soat:
         raise HTTPException(status_code=404, detail="SOAT no encontrado")
     
-    if not soat.documento_poliza or not os.path.exists(soat.documento_poliza):
-        raise HTTPException(status_code=404, detail="Documento de póliza no encontrado")
-    
-    return FileResponse(
-        path=soat.documento_poliza,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"inline; filename=poliza_soat_{soat_id}.pdf"
-        }
+    return respuesta_documento(
+        request,
+        soat.documento_poliza,
+        "application/pdf",
+        f"poliza_soat_{soat_id}.pdf",
+        "Documento de póliza no encontrado"
     )
@@ -0,0 +1,48 @@
+import enum
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Las columnas placa_busqueda y cedula_busqueda son columnas generadas por la base
+# de datos con upper(regexp_replace(valor, '[^0-9A-Za-z]', '', 'g')). Para buscar,
+# el término se normaliza igual en Python.
+#
+# La búsqueda por similitud de nombres usa pg_trgm si la extensión y su índice
+# están instalados (migrations/add_soats_busqueda.sql); si no, solo por contenido.
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9A-Za-z]")
+
+
+class CampoBusquedaEnum(str, enum.Enum):
+    PLACA = "placa"
+    CEDULA = "cedula"
+    NOMBRE = "nombre"
+
+
+def clave_busqueda(valor: str) -> str:
+    """
+    Normalizar una placa o cédula: sin espacios, guiones ni otros separadores, en mayúsculas.
+    """
+    return _NO_ALFANUMERICO.sub("", valor).upper()
+
+
+def escapar_like(valor: str) -> str:
+    """
+    Escapar los comodines de LIKE (%, _) para buscar el texto tal cual, con escape "\\".
+    """
+    return valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_trigramas = None
+
+
+def trigramas_disponibles(db: Session) -> bool:
+    """
+    Si la base de datos tiene pg_trgm instalado. Se consulta una vez por proceso.
+    """
+    global _trigramas
+    if _trigramas is None:
+        _trigramas = db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trigramas
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import Request, Response
+from prometheus_client import Counter
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import TTLCache
+from .config import settings
+from .database import AsyncSessionLocal, AsyncReadSessionLocal
+from .downloads import CACHE_REVALIDAR, coincide_etag
+
+# Caché de respuestas ya serializadas para los listados y estadísticas, que se
+# leen mucho más de lo que cambian. Cada entidad (soats, recargas, bolsa) tiene
+# un contador de generación que las rutas que la modifican incrementan después
+# del commit; la clave de una respuesta incluye las generaciones de las entidades
+# de las que depende, así que una escritura deja obsoletas sus respuestas sin
+# tener que buscarlas. Las entradas viejas salen por LRU o por TTL.
+#
+# Una respuesta que se va a guardar se genera desde la base principal: con una
+# réplica atrasada se guardarían datos anteriores a la escritura bajo la nueva
+# generación. Sin caché (o si la respuesta no se puede guardar) se lee de la réplica.
+#
+# RESPUESTAS_CACHE_BACKEND=redis comparte generaciones y respuestas entre workers;
+# es el valor por defecto si hay REDIS_URL y, si no, la caché queda desactivada.
+# RESPUESTAS_CACHE_BACKEND=memoria guarda todo en el worker: las escrituras hechas
+# en otro worker (o por los scripts) se ven al vencer el TTL, así que solo sirve
+# con un único worker.
+
+logger = logging.getLogger("app.cache")
+
+CONSULTAS_CACHE = Counter(
+    "respuestas_cache_total",
+    "Consultas a la caché de respuestas por resultado",
+    ["resultado"]
+)
+
+
+@dataclass
+class RespuestaGuardada:
+    cuerpo: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class CacheMemoria:
+    def __init__(self):
+        self._respuestas = TTLCache(settings.RESPUESTAS_CACHE_MAX_SIZE, settings.RESPUESTAS_CACHE_TTL_SECONDS)
+        self._generaciones: Dict[str, int] = defaultdict(int)
+
+    async def generaciones(self, entidades: Sequence[str]) -> List[int]:
+        return [self._generaciones[entidad] for entidad in entidades]
+
+    async def incrementar(self, entidades: Sequence[str]):
+        for entidad in entidades:
+            self._generaciones[entidad] += 1
+
+    async def obtener(self, clave: str) -> Optional[RespuestaGuardada]:
+        return self._respuestas.get(clave)
+
+    async def guardar(self, clave: str, respuesta: RespuestaGuardada):
+        self._respuestas.set(clave, respuesta)
+
+
+class CacheRedis:
+    PREFIJO = "soat:cache:"
+
+    def __init__(self):
+        import redis.asyncio as redis
+
+        self.cliente = redis.from_url(settings.REDIS_URL)
+
+    async def generaciones(self, entidades: Sequence[str]) -> List[int]:
+        valores = await self.cliente.mget([f"{self.PREFIJO}gen:{entidad}" for entidad in entidades])
+        return [int(valor or 0) for valor in valores]
+
+    async def incrementar(self, entidades: Sequence[str]):
+        async with self.cliente.pipeline(transaction=False) as pipe:
+            for entidad in entidades:
+                pipe.incr(f"{self.PREFIJO}gen:{entidad}")
+            await pipe.execute()
+
+    async def obtener(self, clave: str) -> Optional[RespuestaGuardada]:
+        valor = await self.cliente.get(f"{self.PREFIJO}resp:{clave}")
+        if valor is None:
+            return None
+        encabezado, _, cuerpo = valor.partition(b"\n")
+        datos = json.loads(encabezado)
+        return RespuestaGuardada(cuerpo=cuerpo, etag=datos["etag"], headers=datos["headers"])
+
+    async def guardar(self, clave: str, respuesta: RespuestaGuardada):
+        encabezado = json.dumps({"etag": respuesta.etag, "headers": respuesta.headers}).encode()
+        await self.cliente.set(
+            f"{self.PREFIJO}resp:{clave}",
+            encabezado + b"\n" + respuesta.cuerpo,
+            ex=settings.RESPUESTAS_CACHE_TTL_SECONDS
+        )
+
+
+@lru_cache
+def get_cache():
+    backend = settings.RESPUESTAS_CACHE_BACKEND or ("redis" if settings.REDIS_URL else "ninguna")
+    if backend == "redis":
+        return CacheRedis()
+    if backend == "memoria":
+        return CacheMemoria()
+    return None
+
+
+async def invalidar(*entidades: str):
+    """
+    Incrementar la generación de las entidades modificadas. Se llama después del
+    commit; si falla solo se registra, las respuestas viejas vencen por TTL.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        await cache.incrementar(entidades)
+    except Exception:
+        logger.exception("No se pudo invalidar la caché de respuestas (%s)", ", ".join(entidades))
+
+
+def serializar(tipo, valor) -> bytes:
+    """
+    JSON de un valor (objetos ORM o dicts) validado con el schema de la respuesta,
+    p. ej. List[SoatExpedidoResponse], como lo haría response_model.
+    """
+    adaptador = _adaptador(tipo)
+    return adaptador.dump_json(adaptador.validate_python(valor, from_attributes=True))
+
+
+@lru_cache
+def _adaptador(tipo) -> TypeAdapter:
+    return TypeAdapter(tipo)
+
+
+def _clave(request: Request, generaciones: List[int], variante: Optional[str] = None) -> str:
+    parametros = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    version = ".".join(str(generacion) for generacion in generaciones)
+    clave = f"{request.url.path}?{parametros}@{version}"
+    return f"{clave}#{variante}" if variante else clave
+
+
+async def respuesta_cacheada(
+    request: Request,
+    entidades: Sequence[str],
+    generar: Callable[[AsyncSession], Awaitable[Tuple[bytes, Dict[str, str]]]],
+    solo_principal: bool = False,
+    variante: Optional[str] = None
+) -> Response:
+    """
+    Responder desde la caché o con `generar`, que recibe una sesión y retorna
+    el cuerpo JSON y los headers propios de la respuesta. La sesión es de la
+    base principal si la respuesta se va a guardar (o con solo_principal) y de
+    la réplica si no. Agrega ETag y responde 304 si el cliente ya tiene esa versión.
+    `variante` se agrega a la clave para respuestas que dependen de algo más que
+    la URL y las entidades (el día actual, por ejemplo).
+    """
+    cache = get_cache()
+    guardada = None
+    clave = None
+    if cache is not None:
+        try:
+            clave = _clave(request, await cache.generaciones(entidades), variante)
+            guardada = await cache.obtener(clave)
+        except Exception:
+            logger.exception("No se pudo leer la caché de respuestas")
+            clave = None
+
+    if cache is not None:
+        CONSULTAS_CACHE.labels("acierto" if guardada is not None else "fallo").inc()
+    if guardada is None:
+        sesion = AsyncSessionLocal if clave is not None or solo_principal else AsyncReadSessionLocal
+        async with sesion() as db:
+            cuerpo, headers = await generar(db)
+        guardada = RespuestaGuardada(
+            cuerpo=cuerpo,
+            etag=f'"{hashlib.sha256(cuerpo).hexdigest()[:32]}"',
+            headers=headers
+        )
+        if clave is not None and len(cuerpo) <= settings.RESPUESTAS_CACHE_MAX_KB * 1024:
+            try:
+                await cache.guardar(clave, guardada)
+            except Exception:
+                logger.exception("No se pudo guardar en la caché de respuestas")
+
+    headers = {**guardada.headers, "ETag": guardada.etag, "Cache-Control": CACHE_REVALIDAR}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and coincide_etag(if_none_match, guardada.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=guardada.cuerpo, media_type="application/json", headers=headers)
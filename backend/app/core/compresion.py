@@ -0,0 +1,101 @@
+import logging
+import os
+import uuid
+from typing import Optional, Tuple
+from .storage import TMP_ROOT, calcular_sha256
+
+# Recompresión opcional de los documentos al recibirlos (COMPRESION_DOCUMENTOS),
+# en el mismo pool de procesos de la validación. Las fotos de los comprobantes se
+# reducen a COMPRESION_IMAGEN_MAX_PX y se recodifican en JPEG (PNG si tienen
+# transparencia); en los PDFs se comprimen los streams de contenido y se
+# recodifican las imágenes escaneadas sin comprimir o más grandes que el límite. El resultado es determinista: el mismo archivo produce
+# siempre los mismos bytes, así que la deduplicación por contenido y los
+# reintentos con Idempotency-Key siguen funcionando.
+
+logger = logging.getLogger("app.compresion")
+
+
+def _errores_de_archivo() -> tuple:
+    """
+    Errores de un archivo que no se puede recomprimir (dañado, cifrado, formato
+    que Pillow o pypdf no manejan). Los de programación, como AttributeError o
+    TypeError, no están aquí: se propagan en vez de desactivar la compresión.
+    """
+    # UnidentifiedImageError de Pillow hereda de OSError
+    errores = [OSError, ValueError, NotImplementedError]
+    try:
+        from PIL import Image
+        errores.append(Image.DecompressionBombError)
+    except ImportError:
+        pass
+    try:
+        from pypdf.errors import PyPdfError
+        errores.append(PyPdfError)
+    except ImportError:
+        pass
+    return tuple(errores)
+
+
+def _comprimir_imagen(ruta: str, destino: str, max_px: int, calidad: int) -> str:
+    from PIL import Image, ImageOps
+
+    with Image.open(ruta) as imagen:
+        # Las fotos de celular vienen rotadas con EXIF, que se pierde al recodificar
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.thumbnail((max_px, max_px))
+        if imagen.mode in ("RGBA", "LA") or "transparency" in imagen.info:
+            imagen.save(destino, "PNG", optimize=True)
+            return "png"
+        imagen.convert("RGB").save(destino, "JPEG", quality=calidad, optimize=True)
+        return "jpg"
+
+
+def _comprimir_pdf(ruta: str, destino: str, max_px: int, calidad: int) -> str:
+    from pypdf import PdfReader, PdfWriter
+
+    escritor = PdfWriter(clone_from=PdfReader(ruta))
+    for pagina in escritor.pages:
+        for imagen in pagina.images:
+            if imagen.indirect_reference is None:
+                # Imagen en línea en el stream de contenido: no se puede reemplazar
+                continue
+            try:
+                filtro = imagen.indirect_reference.get_object().get("/Filter")
+                contenido = imagen.image
+                if contenido.mode not in ("RGB", "L"):
+                    continue
+                if filtro == "/DCTDecode" and max(contenido.size) <= max_px:
+                    continue
+                contenido.thumbnail((max_px, max_px))
+                imagen.replace(contenido, quality=calidad)
+            except _errores_de_archivo():
+                # Formatos que Pillow no lee: se dejan como están
+                continue
+        pagina.compress_content_streams()
+    escritor.write(destino)
+    return "pdf"
+
+
+def comprimir(ruta: str, tipo: str, max_px: int, calidad: int) -> Optional[Tuple[str, str, str, int]]:
+    """
+    Recomprimir un archivo recibido (ya validado). Retorna la ruta del temporal
+    nuevo, su tipo, SHA-256 y tamaño, o None si no quedó más pequeño o no se
+    pudo comprimir (sin Pillow o pypdf, por ejemplo).
+    """
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    destino = str(TMP_ROOT / uuid.uuid4().hex)
+    try:
+        if tipo == "pdf":
+            nuevo_tipo = _comprimir_pdf(ruta, destino, max_px, calidad)
+        else:
+            nuevo_tipo = _comprimir_imagen(ruta, destino, max_px, calidad)
+        tamano = os.path.getsize(destino)
+        if tamano < os.path.getsize(ruta):
+            return destino, nuevo_tipo, calcular_sha256(destino), tamano
+    except ImportError:
+        pass
+    except _errores_de_archivo():
+        logger.exception("No se pudo recomprimir %s", ruta)
+    if os.path.exists(destino):
+        os.unlink(destino)
+    return None
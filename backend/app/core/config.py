@@ -1,16 +1,36 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
+    # Réplica de solo lectura opcional para listados, exportaciones, dashboard y descargas
+    DATABASE_READ_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # Segundos esperando una conexión libre
+    DB_POOL_RECYCLE: int = 1800  # Segundos antes de renovar una conexión
+    DB_POOL_PRE_PING: bool = True
     
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 43200  # 30 días
     
+    # Caché en memoria de tokens decodificados y usuarios autenticados
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_SIZE: int = 1024
+    
+    # Hilos dedicados a bcrypt, para que el hashing no ocupe el threadpool de la API
+    PASSWORD_HASH_WORKERS: int = 2
+    
+    # Intentos fallidos de login permitidos por cuenta y por IP dentro de la ventana
+    LOGIN_MAX_INTENTOS_CUENTA: int = 5
+    LOGIN_MAX_INTENTOS_IP: int = 20
+    LOGIN_VENTANA_SEGUNDOS: int = 300
+    LOGIN_MAX_CLAVES: int = 100000  # Cuentas e IPs con fallos recordadas por worker
+    
     # CORS
     ALLOWED_ORIGINS: str = "http://localhost:5173"
     
@@ -18,11 +38,78 @@ class Settings(BaseSettings):
     APP_NAME: str = "SOAT Manager Hero"
     DEBUG: bool = False
     
+    # Instrumentación de consultas
+    DB_CONSULTA_LENTA_MS: int = 200  # Se registran en el log las consultas más lentas que esto
+    DB_N_MAS_1_REPETICIONES: int = 10  # Misma sentencia repetida en una solicitud: posible N+1
+    
+    # Documentos
+    MAX_DOCUMENTO_MB: int = 10
+    # Límites por clase de documento, revisados al recibirlo
+    DOCUMENTO_FACTURA_MAX_MB: int = 10
+    DOCUMENTO_FACTURA_MAX_PAGINAS: int = 10
+    DOCUMENTO_SOAT_MAX_MB: int = 10
+    DOCUMENTO_SOAT_MAX_PAGINAS: int = 10
+    DOCUMENTO_POLIZA_MAX_MB: int = 10
+    DOCUMENTO_POLIZA_MAX_PAGINAS: int = 50
+    DOCUMENTO_COMPROBANTE_MAX_MB: int = 10
+    DOCUMENTO_COMPROBANTE_MAX_PAGINAS: int = 5
+    DOCUMENTO_MAX_MEGAPIXELES: int = 50  # Imágenes más grandes se rechazan
+    VALIDACION_WORKERS: int = 2  # Procesos que revisan los PDFs e imágenes recibidos
+    # Recompresión al recibir: imágenes reducidas y recodificadas, PDFs con streams e
+    # imágenes comprimidos. Solo se usa el resultado si es más pequeño que el original
+    COMPRESION_DOCUMENTOS: bool = False
+    COMPRESION_CONSERVAR_ORIGINAL: bool = False  # Guardar también el original en uploads/originales
+    COMPRESION_IMAGEN_MAX_PX: int = 2000  # Lado mayor de las imágenes, también dentro de los PDFs
+    COMPRESION_JPEG_CALIDAD: int = 80
+    STORAGE_BACKEND: str = "local"  # "local" o "s3"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None  # Para MinIO u otro servicio compatible
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_MULTIPART_MB: int = 8
+    S3_PRESIGN_EXPIRE_SECONDS: int = 300
+    
+    # Cola de trabajos sobre documentos (procesar_documentos.py)
+    TRABAJOS_MAX_INTENTOS: int = 5
+    TRABAJOS_VISIBILIDAD_SEGUNDOS: int = 300  # Si el worker no termina en este plazo, otro lo retoma
+    TRABAJOS_REINTENTO_SEGUNDOS: int = 30  # Espera del primer reintento; se duplica en cada fallo
+    TRABAJOS_RETENCION_DIAS: int = 7  # Los trabajos completados se eliminan después de esto
+    MINIATURA_PX: int = 256
+    
     # Tarifas SOAT Holding Group Hero - 2026
     TARIFA_MOTO_HASTA_99CC: int = 256200
     TARIFA_MOTO_100_200CC: int = 343300
     COMISION_FIJA: int = 30000
     
+    # Vigencia de un SOAT: no se expide otro para la misma placa en este plazo
+    SOAT_VIGENCIA_DIAS: int = 365
+    
+    # Expedición por lotes: máximo de SOATs por solicitud
+    MAX_SOATS_POR_LOTE: int = 100
+    
+    # Idempotency-Key: cuánto se guarda la respuesta de una operación para repetirla
+    IDEMPOTENCIA_TTL_HORAS: int = 24
+    
+    # Libro de movimientos de la bolsa: cada cuántos movimientos se guarda un corte de saldo
+    BOLSA_CORTE_CADA_MOVIMIENTOS: int = 500
+    
+    # Caché de respuestas de listados y estadísticas: "redis" (compartida entre
+    # workers, REDIS_URL), "memoria" (por worker, solo con un único worker) o
+    # "ninguna". Por defecto "redis" si hay REDIS_URL y si no "ninguna"
+    RESPUESTAS_CACHE_BACKEND: Optional[str] = None
+    RESPUESTAS_CACHE_MAX_SIZE: int = 256
+    RESPUESTAS_CACHE_TTL_SECONDS: int = 300
+    RESPUESTAS_CACHE_MAX_KB: int = 1024  # Las respuestas más grandes no se guardan
+    REDIS_URL: Optional[str] = None
+    
+    # Eventos en vivo (GET /api/eventos): con EVENTOS_NOTIFY se reparten entre
+    # workers con LISTEN/NOTIFY de PostgreSQL; sin él solo llegan a los clientes
+    # conectados al mismo worker
+    EVENTOS_NOTIFY: bool = False
+    EVENTOS_PING_SEGUNDOS: int = 15
+    EVENTOS_COLA_MAX: int = 100  # Eventos pendientes por cliente antes de desconectarlo
+    
     @property
     def allowed_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
@@ -1,10 +1,73 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .instrumentacion import instrumentar_engine
 
-engine = create_engine(settings.DATABASE_URL)
+# La aplicación requiere PostgreSQL (ON CONFLICT, FOR UPDATE SKIP LOCKED,
+# LISTEN/NOTIFY, clock_timestamp() e índices con collation "C").
+# Las rutas de la API usan sesiones asíncronas (asyncpg) para no bloquear el
+# event loop mientras esperan a la base de datos. Los engines síncronos quedan
+# para los scripts (init_db.py, importar_historico.py, mantener_documentos.py),
+# create_all y las métricas.
+# Los servicios (bolsa, resumen, idempotencia) son síncronos y se llaman
+# desde las rutas con AsyncSession.run_sync, sin pasar por el threadpool.
+
+def _opciones_pool() -> dict:
+    return {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def _url_asincrona(url: str):
+    """
+    La misma URL con el driver asíncrono (postgresql://, postgresql+psycopg2://
+    -> postgresql+asyncpg://).
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        raise RuntimeError(f"DATABASE_URL debe ser de PostgreSQL, no {url.get_backend_name()}")
+    url = url.set(drivername="postgresql+asyncpg")
+    # asyncpg recibe el modo SSL como ssl, no como sslmode
+    if "sslmode" in url.query:
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": url.query["sslmode"]})
+    return url
+
+
+def _crear_engine(url: str):
+    nuevo = create_engine(url, **_opciones_pool())
+    instrumentar_engine(nuevo)
+    return nuevo
+
+
+def _crear_engine_asincrono(url: str):
+    nuevo = create_async_engine(_url_asincrona(url), **_opciones_pool())
+    instrumentar_engine(nuevo.sync_engine)
+    return nuevo
+
+
+engine = _crear_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = _crear_engine_asincrono(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Las lecturas que toleran unos segundos de retraso (listados, exportaciones,
+# dashboard, descargas) van a la réplica si hay una; todo lo que mueve saldo
+# usa siempre el primario. Sin DATABASE_READ_URL ambos son el mismo engine.
+if settings.DATABASE_READ_URL:
+    read_engine = _crear_engine(settings.DATABASE_READ_URL)
+    async_read_engine = _crear_engine_asincrono(settings.DATABASE_READ_URL)
+else:
+    read_engine = engine
+    async_read_engine = async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -15,3 +78,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
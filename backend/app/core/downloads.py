@@ -0,0 +1,149 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from .storage import CHUNK_SIZE, es_blob, get_storage
+
+# Descargas de documentos con validación condicional y rangos.
+# El ETag de un blob es su SHA-256 (está en el nombre), así que se puede
+# responder 304 sin tocar el disco. Si la URL trae ?v=<sha256> la versión es
+# inmutable y se permite cachearla indefinidamente.
+
+CACHE_INMUTABLE = "private, max-age=31536000, immutable"
+CACHE_REVALIDAR = "private, no-cache"
+
+
+def _etag(ruta: str, stat: Optional[os.stat_result]) -> str:
+    if es_blob(ruta):
+        return f'"{Path(ruta).name.split(".")[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def coincide_etag(encabezado: str, etag: str) -> bool:
+    if encabezado.strip() == "*":
+        return True
+    etiquetas = [e.strip().removeprefix("W/") for e in encabezado.split(",")]
+    return etag in etiquetas
+
+
+def _no_modificado(request: Request, etag: str, mtime: Optional[float]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return coincide_etag(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _rango(request: Request, etag: str, tamano: int) -> Optional[Tuple[int, int]]:
+    """
+    Rango de bytes pedido (inicio, fin inclusive), o None para enviar todo.
+    Solo se atiende un rango; con varios se envía el archivo completo.
+    """
+    encabezado = request.headers.get("range")
+    if not encabezado or not encabezado.startswith("bytes=") or "," in encabezado:
+        return None
+
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        return None
+
+    inicio_str, _, fin_str = encabezado[len("bytes="):].strip().partition("-")
+    try:
+        if inicio_str:
+            inicio = int(inicio_str)
+            fin = int(fin_str) if fin_str else tamano - 1
+        else:
+            # bytes=-N: los últimos N bytes
+            inicio = max(tamano - int(fin_str), 0)
+            fin = tamano - 1
+    except ValueError:
+        return None
+
+    fin = min(fin, tamano - 1)
+    if inicio > fin or inicio >= tamano:
+        raise HTTPException(
+            status_code=416,
+            detail="Rango no satisfacible",
+            headers={"Content-Range": f"bytes */{tamano}"}
+        )
+    return inicio, fin
+
+
+def _leer(ruta: str, inicio: int, fin: int) -> Iterator[bytes]:
+    with open(ruta, "rb") as archivo:
+        archivo.seek(inicio)
+        pendientes = fin - inicio + 1
+        while pendientes > 0:
+            chunk = archivo.read(min(CHUNK_SIZE, pendientes))
+            if not chunk:
+                break
+            pendientes -= len(chunk)
+            yield chunk
+
+
+def respuesta_documento(
+    request: Request,
+    ruta: Optional[str],
+    media_type: str,
+    filename: str,
+    detalle_404: str
+) -> Response:
+    """
+    Respuesta de descarga de un documento con ETag, 304, Range y Cache-Control.
+    Si el backend ofrece URLs prefirmadas se redirige a ellas.
+    """
+    if not ruta:
+        raise HTTPException(status_code=404, detail=detalle_404)
+
+    url = get_storage().url_descarga(ruta, filename, media_type) if es_blob(ruta) else None
+    stat = None
+    if url is None:
+        try:
+            stat = os.stat(ruta)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=detalle_404)
+
+    etag = _etag(ruta, stat)
+    version_fija = es_blob(ruta) and f'"{request.query_params.get("v")}"' == etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_INMUTABLE if version_fija else CACHE_REVALIDAR,
+    }
+    if stat is not None:
+        headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+
+    if _no_modificado(request, etag, stat.st_mtime if stat else None):
+        return Response(status_code=304, headers=headers)
+
+    if url is not None:
+        return RedirectResponse(
+            url,
+            status_code=307,
+            headers={"Cache-Control": CACHE_REVALIDAR}
+        )
+
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Disposition"] = f"inline; filename={filename}"
+    rango = _rango(request, etag, stat.st_size)
+    if rango is None:
+        inicio, fin, status_code = 0, stat.st_size - 1, 200
+    else:
+        inicio, fin = rango
+        status_code = 206
+        headers["Content-Range"] = f"bytes {inicio}-{fin}/{stat.st_size}"
+    headers["Content-Length"] = str(fin - inicio + 1)
+
+    return StreamingResponse(
+        _leer(ruta, inicio, fin),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+from typing import Any, Optional, Set
+from sqlalchemy import func, select
+from .config import settings
+from .database import async_engine
+
+# Eventos en vivo para los clientes conectados a GET /api/eventos (Server-Sent
+# Events), para que el frontend no tenga que consultar el saldo y los listados
+# cada tantos segundos. Las rutas publican después del commit de la operación.
+#
+# Sin EVENTOS_NOTIFY el evento se reparte directamente a los clientes de este
+# worker. Con EVENTOS_NOTIFY se envía con pg_notify y cada worker lo recibe por
+# una conexión con LISTEN, así llega a los clientes de todos los workers.
+
+logger = logging.getLogger("app.eventos")
+
+CANAL = "soat_eventos"
+REINTENTO_SEGUNDOS = 5
+
+
+class Difusor:
+    """
+    Reparte los eventos entre las colas de los clientes conectados a este worker.
+    """
+
+    def __init__(self, cola_max: int):
+        self.cola_max = cola_max
+        self._colas: Set[asyncio.Queue] = set()
+
+    def suscribir(self) -> asyncio.Queue:
+        cola = asyncio.Queue(maxsize=self.cola_max)
+        self._colas.add(cola)
+        return cola
+
+    def desuscribir(self, cola: asyncio.Queue):
+        self._colas.discard(cola)
+
+    def repartir(self, payload: str):
+        """
+        Entregar un evento ({"tipo": ..., "datos": ...} en JSON) ya formateado como SSE.
+        """
+        evento = json.loads(payload)
+        mensaje = f"event: {evento['tipo']}\ndata: {json.dumps(evento['datos'])}\n\n"
+        for cola in list(self._colas):
+            try:
+                cola.put_nowait(mensaje)
+            except asyncio.QueueFull:
+                # El cliente no alcanza a leer: se cierra su conexión (None) y
+                # EventSource se reconecta solo
+                self._colas.discard(cola)
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(None)
+
+    @property
+    def conectados(self) -> int:
+        return len(self._colas)
+
+
+difusor = Difusor(settings.EVENTOS_COLA_MAX)
+
+
+async def publicar(tipo: str, datos: Any):
+    """
+    Publicar un evento. Se llama después del commit: si falla solo se registra
+    en el log, la operación ya quedó confirmada.
+    """
+    payload = json.dumps({"tipo": tipo, "datos": datos}, default=str)
+    if not settings.EVENTOS_NOTIFY:
+        difusor.repartir(payload)
+        return
+    try:
+        async with async_engine.begin() as conexion:
+            await conexion.execute(select(func.pg_notify(CANAL, payload)))
+    except Exception:
+        logger.exception("No se pudo publicar el evento %s", tipo)
+
+
+async def escuchar_notificaciones():
+    """
+    Mantener una conexión con LISTEN en el canal de eventos y repartir lo que
+    llegue a los clientes de este worker. Se reconecta si la conexión se cae.
+    """
+    while True:
+        conexion = None
+        try:
+            conexion = await async_engine.connect()
+            cruda = (await conexion.get_raw_connection()).driver_connection
+            cerrada = asyncio.Event()
+            cruda.add_termination_listener(lambda _conexion: cerrada.set())
+            await cruda.add_listener(CANAL, lambda _conexion, _pid, _canal, payload: difusor.repartir(payload))
+            await cerrada.wait()
+            logger.warning("Se cerró la conexión LISTEN de eventos, reconectando")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error en la conexión LISTEN de eventos, reconectando")
+        finally:
+            # La conexión queda con LISTEN activo: se descarta en lugar de volver al pool
+            if conexion is not None:
+                await asyncio.shield(conexion.invalidate())
+        await asyncio.sleep(REINTENTO_SEGUNDOS)
+
+
+def iniciar_escucha() -> Optional[asyncio.Task]:
+    if not settings.EVENTOS_NOTIFY:
+        return None
+    return asyncio.create_task(escuchar_notificaciones())
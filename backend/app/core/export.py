@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+from enum import Enum
+from typing import AsyncIterator, Type
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from .database import AsyncReadSessionLocal
+
+EXPORT_BATCH_SIZE = 1000
+
+
+class FormatoExportEnum(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    FormatoExportEnum.NDJSON: "application/x-ndjson",
+    FormatoExportEnum.CSV: "text/csv",
+}
+
+
+async def _iter_rows(query_factory, schema: Type[BaseModel]) -> AsyncIterator[dict]:
+    """
+    Recorrer la consulta con un cursor del lado del servidor.
+    La sesión es propia del generador porque la de la ruta se cierra
+    antes de que termine de enviarse la respuesta. Lee de la réplica si hay una.
+    """
+    async with AsyncReadSessionLocal() as db:
+        filas = await db.stream_scalars(
+            query_factory().execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for row in filas:
+            yield schema.model_validate(row).model_dump(mode="json")
+
+
+async def _iter_ndjson(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def _iter_csv(rows: AsyncIterator[dict], schema: Type[BaseModel]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(schema.model_fields.keys()))
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    pendientes = 0
+    async for row in rows:
+        writer.writerow(row)
+        pendientes += 1
+        if pendientes >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pendientes = 0
+
+    if pendientes:
+        yield buffer.getvalue()
+
+
+def stream_export(
+    query_factory,
+    schema: Type[BaseModel],
+    formato: FormatoExportEnum,
+    filename: str
+) -> StreamingResponse:
+    """
+    Construir una respuesta que transmite los registros de la consulta
+    en NDJSON o CSV sin cargarlos todos en memoria.
+    query_factory retorna el select() a exportar.
+    """
+    rows = _iter_rows(query_factory, schema)
+    if formato == FormatoExportEnum.CSV:
+        content = _iter_csv(rows, schema)
+    else:
+        content = _iter_ndjson(rows)
+
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[formato],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}.{formato.value}"
+        }
+    )
@@ -0,0 +1,156 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from prometheus_client import Counter as ContadorPrometheus, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+# Instrumentación de las consultas SQL por solicitud. Los eventos del engine suman
+# cada consulta a las estadísticas de la solicitud en curso (una ContextVar que
+# abre el middleware). Al terminar la solicitud se agregan los headers
+# Server-Timing, se alimentan las métricas de Prometheus, se registran las
+# consultas lentas y se avisa de posibles N+1 (la misma sentencia repetida
+# muchas veces en una solicitud).
+
+logger = logging.getLogger("app.db")
+
+CONSULTAS_POR_SOLICITUD = Histogram(
+    "db_queries_per_request",
+    "Consultas SQL por solicitud HTTP",
+    ["route"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200)
+)
+TIEMPO_DB_POR_SOLICITUD = Histogram(
+    "db_time_per_request_seconds",
+    "Tiempo total en la base de datos por solicitud HTTP",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+CONSULTAS_LENTAS = ContadorPrometheus(
+    "db_slow_queries_total",
+    "Consultas SQL más lentas que DB_CONSULTA_LENTA_MS",
+    ["route"]
+)
+POSIBLES_N_MAS_1 = ContadorPrometheus(
+    "db_n_plus_one_total",
+    "Solicitudes que repitieron una misma sentencia al menos DB_N_MAS_1_REPETICIONES veces",
+    ["route"]
+)
+
+
+@dataclass
+class EstadisticasConsultas:
+    cantidad: int = 0
+    tiempo: float = 0.0
+    mas_lenta: float = 0.0
+    sentencia_mas_lenta: Optional[str] = None
+    lentas: int = 0
+    por_sentencia: Counter = field(default_factory=Counter)
+
+    def registrar(self, sentencia: str, duracion: float):
+        self.cantidad += 1
+        self.tiempo += duracion
+        self.por_sentencia[sentencia] += 1
+        if duracion > self.mas_lenta:
+            self.mas_lenta = duracion
+            self.sentencia_mas_lenta = sentencia
+
+
+_estadisticas: ContextVar[Optional[EstadisticasConsultas]] = ContextVar("estadisticas_db", default=None)
+
+
+def _resumir(sentencia: str, largo: int = 300) -> str:
+    sentencia = " ".join(sentencia.split())
+    return sentencia if len(sentencia) <= largo else sentencia[:largo] + "..."
+
+
+def instrumentar_engine(engine: Engine):
+    """
+    Registrar los eventos que miden cada consulta del engine.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        duracion = time.perf_counter() - conn.info["inicio_consulta"].pop()
+        estadisticas = _estadisticas.get()
+        if estadisticas is not None:
+            estadisticas.registrar(statement, duracion)
+
+        if duracion * 1000 >= settings.DB_CONSULTA_LENTA_MS:
+            if estadisticas is not None:
+                estadisticas.lentas += 1
+            # Sin parámetros: pueden traer datos personales o hashes
+            logger.warning("Consulta lenta (%.1f ms): %s", duracion * 1000, _resumir(statement))
+
+
+def _ruta(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "sin_ruta"
+
+
+class InstrumentacionDBMiddleware:
+    """
+    Middleware ASGI que abre las estadísticas de consultas de cada solicitud y
+    agrega el header Server-Timing con la cantidad y el tiempo de las consultas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estadisticas = EstadisticasConsultas()
+        token = _estadisticas.set(estadisticas)
+
+        async def enviar(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(estadisticas).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _estadisticas.reset(token)
+            _cerrar(scope, estadisticas)
+
+
+def _server_timing(estadisticas: EstadisticasConsultas) -> str:
+    return (
+        f'db;desc="{estadisticas.cantidad} consultas";dur={estadisticas.tiempo * 1000:.1f}, '
+        f'db-max;dur={estadisticas.mas_lenta * 1000:.1f}'
+    )
+
+
+def _cerrar(scope, estadisticas: EstadisticasConsultas):
+    if estadisticas.cantidad == 0:
+        return
+    ruta = _ruta(scope)
+    logger.debug(
+        "%s %s: %d consultas en %.1f ms, la más lenta %.1f ms: %s",
+        scope["method"], ruta, estadisticas.cantidad, estadisticas.tiempo * 1000,
+        estadisticas.mas_lenta * 1000, _resumir(estadisticas.sentencia_mas_lenta)
+    )
+    CONSULTAS_POR_SOLICITUD.labels(ruta).observe(estadisticas.cantidad)
+    TIEMPO_DB_POR_SOLICITUD.labels(ruta).observe(estadisticas.tiempo)
+    if estadisticas.lentas:
+        CONSULTAS_LENTAS.labels(ruta).inc(estadisticas.lentas)
+
+    sentencia, repeticiones = estadisticas.por_sentencia.most_common(1)[0]
+    if repeticiones >= settings.DB_N_MAS_1_REPETICIONES:
+        POSIBLES_N_MAS_1.labels(ruta).inc()
+        logger.warning(
+            "Posible N+1 en %s %s: %d veces la misma consulta: %s",
+            scope["method"], ruta, repeticiones, _resumir(sentencia)
+        )
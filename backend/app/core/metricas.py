@@ -0,0 +1,89 @@
+import time
+from typing import Dict
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.engine import Engine
+
+# Métricas HTTP y del pool de conexiones para Prometheus (GET /metrics).
+# La ruta se etiqueta con su plantilla (/api/soats/{soat_id}), no con la URL
+# concreta, para que la cantidad de series no crezca con los ids.
+
+DURACION_SOLICITUDES = Histogram(
+    "http_request_duration_seconds",
+    "Duración de las solicitudes HTTP hasta enviar el último byte",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+SOLICITUDES_EN_CURSO = Gauge(
+    "http_requests_in_progress",
+    "Solicitudes HTTP en curso",
+    ["method"]
+)
+BYTES_RECIBIDOS = Counter(
+    "http_request_body_bytes_total",
+    "Bytes recibidos en el cuerpo de las solicitudes (subidas de documentos incluidas)",
+    ["route"]
+)
+
+
+def _ruta(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "sin_ruta"
+
+
+class MetricasHTTPMiddleware:
+    """
+    Middleware ASGI que mide duración, solicitudes en curso y bytes recibidos por ruta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = {"status": 500, "bytes": 0}
+
+        async def recibir():
+            message = await receive()
+            if message["type"] == "http.request":
+                estado["bytes"] += len(message.get("body", b""))
+            return message
+
+        async def enviar(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+            await send(message)
+
+        en_curso = SOLICITUDES_EN_CURSO.labels(scope["method"])
+        en_curso.inc()
+        try:
+            await self.app(scope, recibir, enviar)
+        finally:
+            en_curso.dec()
+            ruta = _ruta(scope)
+            DURACION_SOLICITUDES.labels(scope["method"], ruta, str(estado["status"])).observe(
+                time.perf_counter() - inicio
+            )
+            if estado["bytes"]:
+                BYTES_RECIBIDOS.labels(ruta).inc(estado["bytes"])
+
+
+def instrumentar_pools(engines: Dict[str, Engine]):
+    """
+    Publicar el uso del pool de conexiones de cada engine, leído en cada scrape.
+    """
+    metricas = [
+        ("db_pool_size", "Conexiones permanentes del pool", "size"),
+        ("db_pool_checked_out", "Conexiones del pool en uso", "checkedout"),
+        ("db_pool_checked_in", "Conexiones del pool libres", "checkedin"),
+        ("db_pool_overflow", "Conexiones por encima del tamaño del pool (negativo: cupo sin abrir)", "overflow"),
+    ]
+    for nombre, descripcion, metodo in metricas:
+        gauge = Gauge(nombre, descripcion, ["engine"])
+        for etiqueta, engine in engines.items():
+            # Los pools sin tamaño (NullPool, StaticPool) no tienen estos métodos
+            if hasattr(engine.pool, metodo):
+                gauge.labels(etiqueta).set_function(getattr(engine.pool, metodo))
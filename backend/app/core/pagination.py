@@ -0,0 +1,35 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import tuple_
+
+
+def encode_cursor(fecha: datetime, row_id: int) -> str:
+    """
+    Codificar la posición (fecha, id) del último registro de una página
+    como un cursor opaco para la siguiente petición.
+    """
+    raw = f"{fecha.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """
+    Decodificar un cursor generado por encode_cursor.
+    Retorna None si el cursor es inválido.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        fecha_str, id_str = raw.rsplit("|", 1)
+        return datetime.fromisoformat(fecha_str), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_after(fecha_column, id_column, fecha: datetime, row_id: int):
+    """
+    Condición para obtener los registros posteriores al cursor
+    en orden (fecha DESC, id DESC). Se compara como fila para que el índice
+    (fecha, id) busque directamente la posición del cursor.
+    """
+    return tuple_(fecha_column, id_column) < tuple_(fecha, row_id)
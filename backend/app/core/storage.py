@@ -0,0 +1,289 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+UPLOAD_ROOT = Path("uploads")
+BLOB_ROOT = UPLOAD_ROOT / "blobs"
+ORIGINALES_ROOT = UPLOAD_ROOT / "originales"
+TMP_ROOT = UPLOAD_ROOT / "tmp"
+CHUNK_SIZE = 1024 * 1024
+
+# Las subidas se escriben por bloques en un archivo temporal local (la E/S
+# bloqueante se delega al threadpool) calculando su SHA-256 al vuelo. Luego se
+# publican en el backend configurado con la clave uploads/blobs/ab/cd/<sha256>.<ext>,
+# que es también lo que se guarda en las columnas documento_*.
+#
+# Las rutas de la API publican el blob apenas lo validan, antes de abrir la
+# transacción: con S3 la subida no ocurre con la bolsa bloqueada. Publicar es
+# idempotente (la clave es el contenido); los blobs de solicitudes que no se
+# confirmaron quedan sin registro y los elimina purgar_documentos.
+#
+# STORAGE_BACKEND=local guarda en disco con un rename atómico.
+# STORAGE_BACKEND=s3 sube a un bucket S3 compatible (AWS, MinIO) por partes y
+# las descargas se redirigen a URLs prefirmadas, sin pasar por los workers.
+
+
+@dataclass
+class DocumentoRecibido:
+    temporal: Path
+    sha256: str
+    tamano: int
+    # Completados por la validación (app.core.validacion)
+    extension: Optional[str] = None
+    paginas: Optional[int] = None
+    # Completados por la recompresión: tamaño y clave del original guardado
+    tamano_original: Optional[int] = None
+    original: Optional[str] = None
+    # Completado al publicarlo con su clave por contenido (publicar_blob)
+    clave: Optional[str] = None
+
+
+class LocalStorage:
+    def publicar(self, temporal: Path, clave: str):
+        destino = Path(clave)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temporal, destino)
+
+    def existe(self, clave: str) -> bool:
+        return Path(clave).exists()
+
+    def tocar(self, clave: str) -> bool:
+        try:
+            os.utime(clave)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def eliminar(self, clave: str):
+        Path(clave).unlink(missing_ok=True)
+
+    def abrir(self, clave: str) -> BinaryIO:
+        return open(clave, "rb")
+
+    def listar(self, prefijo: str) -> Iterator[Tuple[str, float]]:
+        for ruta in Path(prefijo).glob("*/*/*"):
+            yield str(ruta), ruta.stat().st_mtime
+
+    def url_descarga(self, clave: str, filename: str, media_type: str) -> Optional[str]:
+        return None
+
+
+class S3Storage:
+    def __init__(self):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = settings.S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_MB * 1024 * 1024,
+            multipart_chunksize=settings.S3_MULTIPART_MB * 1024 * 1024,
+        )
+
+    def publicar(self, temporal: Path, clave: str):
+        self.client.upload_file(str(temporal), self.bucket, clave, Config=self.transfer_config)
+        temporal.unlink(missing_ok=True)
+
+    def existe(self, clave: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=clave)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def tocar(self, clave: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        # Copiar el objeto sobre sí mismo renueva su LastModified sin volver a subirlo
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket, Key=clave,
+                CopySource={"Bucket": self.bucket, "Key": clave},
+                MetadataDirective="REPLACE",
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def eliminar(self, clave: str):
+        self.client.delete_object(Bucket=self.bucket, Key=clave)
+
+    def abrir(self, clave: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=clave)["Body"]
+
+    def listar(self, prefijo: str) -> Iterator[Tuple[str, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for pagina in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefijo}/"):
+            for objeto in pagina.get("Contents", []):
+                yield objeto["Key"], objeto["LastModified"].timestamp()
+
+    def url_descarga(self, clave: str, filename: str, media_type: str) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": clave,
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": f"inline; filename={filename}",
+            },
+            ExpiresIn=settings.S3_PRESIGN_EXPIRE_SECONDS,
+        )
+
+
+@lru_cache
+def get_storage():
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+def _abrir_temporal():
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    temporal = TMP_ROOT / uuid.uuid4().hex
+    return temporal, temporal.open("wb")
+
+
+def _cerrar(buffer, sincronizar: bool):
+    if sincronizar:
+        buffer.flush()
+        os.fsync(buffer.fileno())
+    buffer.close()
+
+
+def _eliminar(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def ruta_blob(sha256: str, extension: str) -> str:
+    return str(BLOB_ROOT / sha256[:2] / sha256[2:4] / f"{sha256}.{extension}")
+
+
+def ruta_original(sha256: str, extension: str) -> str:
+    return str(ORIGINALES_ROOT / sha256[:2] / sha256[2:4] / f"{sha256}.{extension}")
+
+
+def es_blob(path: Union[str, Path]) -> bool:
+    return Path(path).parent.parent.parent == BLOB_ROOT
+
+
+def calcular_sha256(path: Union[str, Path]) -> str:
+    """
+    Hash de un documento. Los blobs se leen del backend configurado;
+    cualquier otra ruta se lee del disco local.
+    """
+    sha = hashlib.sha256()
+    archivo = get_storage().abrir(str(path)) if es_blob(path) else open(path, "rb")
+    try:
+        for chunk in iter(lambda: archivo.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    finally:
+        archivo.close()
+    return sha.hexdigest()
+
+
+async def recibir_documento(upload: UploadFile, max_bytes: Optional[int] = None) -> DocumentoRecibido:
+    """
+    Escribir el contenido de un UploadFile en un archivo temporal, validando
+    el tamaño y calculando el SHA-256 mientras se transmite.
+    """
+    if max_bytes is None:
+        max_bytes = settings.MAX_DOCUMENTO_MB * 1024 * 1024
+
+    temporal, buffer = await run_in_threadpool(_abrir_temporal)
+    sha = hashlib.sha256()
+    recibidos = 0
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            recibidos += len(chunk)
+            if recibidos > max_bytes:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"El archivo no debe superar {max_bytes // (1024 * 1024)}MB"
+                )
+            sha.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+        await run_in_threadpool(_cerrar, buffer, True)
+    except BaseException:
+        await run_in_threadpool(_cerrar, buffer, False)
+        await run_in_threadpool(_eliminar, temporal)
+        raise
+
+    return DocumentoRecibido(temporal=temporal, sha256=sha.hexdigest(), tamano=recibidos)
+
+
+async def publicar_documento(temporal: Path, clave: str):
+    """
+    Publicar un documento recibido en el backend con su clave definitiva.
+    """
+    await run_in_threadpool(get_storage().publicar, temporal, clave)
+
+
+async def existe_documento(clave: str) -> bool:
+    return await run_in_threadpool(get_storage().existe, clave)
+
+
+async def tocar_documento(clave: str) -> bool:
+    """
+    Renovar la fecha de modificación de un documento publicado.
+    Retorna False si no existe.
+    """
+    return await run_in_threadpool(get_storage().tocar, clave)
+
+
+async def publicar_blob(recibido: DocumentoRecibido, extension: Optional[str] = None) -> str:
+    """
+    Publicar un documento recibido con su clave por contenido, si no existe ya
+    una copia idéntica. Retorna la clave y la deja en recibido.clave.
+    """
+    clave = ruta_blob(recibido.sha256, extension or recibido.extension)
+    # La copia existente se toca: purgar_documentos no elimina blobs modificados
+    # hace menos de su antigüedad mínima, aunque su registro acabe de borrarse,
+    # así que sigue ahí cuando esta solicitud confirme su referencia.
+    if await tocar_documento(clave):
+        await eliminar_documento(recibido.temporal)
+    else:
+        await publicar_documento(recibido.temporal, clave)
+    recibido.clave = clave
+    return clave
+
+
+async def eliminar_documento(path: Optional[Union[str, Path]]):
+    """
+    Eliminar un documento si existe, sin fallar si no se puede.
+    Los blobs se eliminan del backend; cualquier otra ruta (temporales y
+    archivos anteriores al almacenamiento por contenido) del disco local.
+    """
+    if not path:
+        return
+    try:
+        if es_blob(path):
+            await run_in_threadpool(get_storage().eliminar, str(path))
+        else:
+            await run_in_threadpool(_eliminar, Path(path))
+    except Exception:
+        pass
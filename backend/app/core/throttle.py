@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+
+class LoginThrottle:
+    """
+    Límite de intentos fallidos por clave (cuenta o IP) en una ventana de tiempo.
+    Es local a cada proceso. Las claves se guardan en orden de su último fallo:
+    las vencidas se eliminan desde el inicio al registrar cada fallo, y nunca se
+    guardan más de `max_claves` (se descartan las de fallos más antiguos).
+    """
+
+    def __init__(self, max_intentos: int, ventana_segundos: int, max_claves: int):
+        self.max_intentos = max_intentos
+        self.ventana_segundos = ventana_segundos
+        self.max_claves = max_claves
+        self._fallos: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purgar(self, key: str, ahora: float) -> Deque[float]:
+        fallos = self._fallos.get(key)
+        if fallos is None:
+            return deque()
+        while fallos and fallos[0] <= ahora - self.ventana_segundos:
+            fallos.popleft()
+        if not fallos:
+            del self._fallos[key]
+        return fallos
+
+    def retry_after(self, key: str) -> Optional[int]:
+        """
+        Segundos que faltan para poder reintentar, o None si la clave no está bloqueada.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            fallos = self._purgar(key, ahora)
+            if len(fallos) < self.max_intentos:
+                return None
+            return int(fallos[0] + self.ventana_segundos - ahora) + 1
+
+    def registrar_fallo(self, key: str):
+        with self._lock:
+            ahora = time.monotonic()
+            # Basta con los últimos max_intentos fallos para saber si está bloqueada
+            fallos = self._fallos.setdefault(key, deque(maxlen=self.max_intentos))
+            fallos.append(ahora)
+            self._fallos.move_to_end(key)
+
+            while self._fallos:
+                primera = next(iter(self._fallos.values()))
+                if primera[-1] > ahora - self.ventana_segundos and len(self._fallos) <= self.max_claves:
+                    break
+                self._fallos.popitem(last=False)
+
+    def reiniciar(self, key: str):
+        with self._lock:
+            self._fallos.pop(key, None)
@@ -0,0 +1,272 @@
+import asyncio
+import enum
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from .compresion import comprimir
+from .config import settings
+from .storage import (
+    DocumentoRecibido, recibir_documento, eliminar_documento, publicar_documento, publicar_blob, ruta_original
+)
+
+# Los documentos recibidos se revisan por su contenido y no por el content_type
+# que envía el cliente: firma del archivo (magic bytes), estructura del PDF,
+# páginas, cifrado e integridad de las imágenes. La extensión guardada sale del
+# tipo detectado. Abrir un PDF grande es CPU intensivo, así que la revisión
+# corre en un pool de procesos acotado (VALIDACION_WORKERS por worker de la API)
+# y no bloquea el event loop. Los procesos se crean con "spawn" para no heredar
+# el loop ni las conexiones del worker. Con COMPRESION_DOCUMENTOS el mismo pool
+# recomprime el archivo después de revisarlo (ver app.core.compresion).
+
+logger = logging.getLogger("app.validacion")
+
+FIRMAS = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+)
+
+
+class ClaseDocumento(str, enum.Enum):
+    FACTURA = "factura"
+    SOAT = "soat"
+    POLIZA = "poliza"
+    COMPROBANTE = "comprobante"
+
+
+@dataclass(frozen=True)
+class Limites:
+    tipos: Tuple[str, ...]
+    max_bytes: int
+    max_paginas: int
+    max_pixeles: int
+
+
+class DocumentoInvalido(Exception):
+    pass
+
+
+def limites(*clases: ClaseDocumento) -> Limites:
+    """
+    Límites de una clase de documento. Con varias clases (un mismo archivo usado
+    como factura y como SOAT en un lote) se aplican los más estrictos.
+    """
+    por_clase = {
+        ClaseDocumento.FACTURA: (("pdf",), settings.DOCUMENTO_FACTURA_MAX_MB, settings.DOCUMENTO_FACTURA_MAX_PAGINAS),
+        ClaseDocumento.SOAT: (("pdf",), settings.DOCUMENTO_SOAT_MAX_MB, settings.DOCUMENTO_SOAT_MAX_PAGINAS),
+        ClaseDocumento.POLIZA: (("pdf",), settings.DOCUMENTO_POLIZA_MAX_MB, settings.DOCUMENTO_POLIZA_MAX_PAGINAS),
+        ClaseDocumento.COMPROBANTE: (
+            ("pdf", "png", "jpg"), settings.DOCUMENTO_COMPROBANTE_MAX_MB, settings.DOCUMENTO_COMPROBANTE_MAX_PAGINAS
+        ),
+    }
+    seleccion = [por_clase[clase] for clase in clases]
+    return Limites(
+        tipos=tuple(tipo for tipo in seleccion[0][0] if all(tipo in tipos for tipos, _, _ in seleccion)),
+        max_bytes=min(max_mb for _, max_mb, _ in seleccion) * 1024 * 1024,
+        max_paginas=min(max_paginas for _, _, max_paginas in seleccion),
+        max_pixeles=settings.DOCUMENTO_MAX_MEGAPIXELES * 1_000_000
+    )
+
+
+# Revisión (corre en los procesos del pool)
+
+def detectar_tipo(cabecera: bytes) -> Optional[str]:
+    for firma, tipo in FIRMAS:
+        if cabecera.startswith(firma):
+            return tipo
+    # La especificación admite bytes antes de la cabecera %PDF-
+    if b"%PDF-" in cabecera[:1024]:
+        return "pdf"
+    return None
+
+
+def _paginas_pdf(ruta: str) -> Optional[int]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return _paginas_pdf_basico(ruta)
+
+    try:
+        pdf = PdfReader(ruta, strict=False)
+        cifrado = pdf.is_encrypted
+        if not cifrado:
+            paginas = len(pdf.pages)
+            for pagina in pdf.pages:
+                pagina.mediabox  # Falla si la página no se puede leer
+    except Exception as e:
+        raise DocumentoInvalido(f"El PDF está dañado ({e})")
+    if cifrado:
+        raise DocumentoInvalido("El PDF está cifrado o protegido con contraseña")
+    return paginas
+
+
+def _paginas_pdf_basico(ruta: str) -> Optional[int]:
+    # Sin pypdf: trailer, cifrado y conteo aproximado de páginas sobre los bytes
+    with open(ruta, "rb") as archivo:
+        contenido = archivo.read()
+    if b"%%EOF" not in contenido[-2048:] or b"startxref" not in contenido:
+        raise DocumentoInvalido("El PDF está incompleto o dañado")
+    if b"/Encrypt" in contenido:
+        raise DocumentoInvalido("El PDF está cifrado o protegido con contraseña")
+    # Con las páginas dentro de object streams no se pueden contar
+    return len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", contenido)) or None
+
+
+def _revisar_imagen(ruta: str, max_pixeles: int):
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+
+    try:
+        with Image.open(ruta) as imagen:
+            if imagen.width * imagen.height > max_pixeles:
+                raise DocumentoInvalido(
+                    f"La imagen no debe superar {max_pixeles // 1_000_000} megapíxeles"
+                )
+            imagen.load()
+    except DocumentoInvalido:
+        raise
+    except Exception as e:
+        raise DocumentoInvalido(f"La imagen está dañada ({e})")
+
+
+def inspeccionar(ruta: str, limites: Limites) -> Tuple[str, Optional[int]]:
+    """
+    Revisar un archivo recibido. Retorna su tipo (pdf, png, jpg) y sus páginas
+    (None en las imágenes), o lanza DocumentoInvalido.
+    """
+    with open(ruta, "rb") as archivo:
+        tipo = detectar_tipo(archivo.read(1024))
+    if tipo is None or tipo not in limites.tipos:
+        permitidos = ", ".join(permitido.upper() for permitido in limites.tipos)
+        raise DocumentoInvalido(f"El archivo debe ser {permitidos}")
+
+    if tipo != "pdf":
+        _revisar_imagen(ruta, limites.max_pixeles)
+        return tipo, None
+
+    paginas = _paginas_pdf(ruta)
+    if paginas == 0:
+        raise DocumentoInvalido("El PDF no tiene páginas")
+    if paginas is not None and paginas > limites.max_paginas:
+        raise DocumentoInvalido(f"El PDF no debe superar {limites.max_paginas} páginas")
+    return tipo, paginas
+
+
+# Uso desde la API
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.VALIDACION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def cerrar_pool():
+    """
+    Detener los procesos del pool. Se llama al apagar la app: el worker de
+    uvicorn no termina mientras queden procesos hijos vivos. La espera corre en
+    un hilo para no bloquear el event loop.
+    """
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+async def _en_pool(funcion, *args):
+    global _executor
+    executor = _get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, funcion, *args)
+    except BrokenProcessPool:
+        # Un proceso murió con el archivo: se reemplaza el pool
+        if _executor is executor:
+            _executor = None
+            executor.shutdown(wait=False)
+        raise
+
+
+async def validar_documento(recibido: DocumentoRecibido, limites: Limites, nombre: str):
+    """
+    Revisar un documento recibido en el pool de procesos y completar su
+    extensión y páginas. Responde 400 si no es válido y 503 si el proceso que
+    lo revisaba murió (falla del servidor, no del archivo).
+    """
+    try:
+        recibido.extension, recibido.paginas = await _en_pool(inspeccionar, str(recibido.temporal), limites)
+    except DocumentoInvalido as e:
+        raise HTTPException(status_code=400, detail=f"{nombre}: {e}")
+    except BrokenProcessPool:
+        logger.error("El pool de validación se detuvo revisando %s", nombre)
+        raise HTTPException(
+            status_code=503,
+            detail=f"{nombre}: No se pudo revisar el archivo, intente de nuevo",
+            headers={"Retry-After": "5"}
+        )
+
+
+async def recomprimir_documento(recibido: DocumentoRecibido):
+    """
+    Reemplazar el temporal de un documento validado por su versión recomprimida,
+    si resulta más pequeña. El original se elimina o, con
+    COMPRESION_CONSERVAR_ORIGINAL, se publica en uploads/originales.
+    """
+    try:
+        resultado = await _en_pool(
+            comprimir, str(recibido.temporal), recibido.extension,
+            settings.COMPRESION_IMAGEN_MAX_PX, settings.COMPRESION_JPEG_CALIDAD
+        )
+    except BrokenProcessPool:
+        logger.error("El pool de validación se detuvo recomprimiendo %s", recibido.temporal)
+        return
+    if resultado is None:
+        return
+
+    temporal, extension, sha256, tamano = resultado
+    original, clave_original = recibido.temporal, ruta_original(recibido.sha256, recibido.extension)
+    recibido.temporal = Path(temporal)
+    recibido.tamano_original = recibido.tamano
+    recibido.extension, recibido.sha256, recibido.tamano = extension, sha256, tamano
+    try:
+        if settings.COMPRESION_CONSERVAR_ORIGINAL:
+            await publicar_documento(original, clave_original)
+            recibido.original = clave_original
+    finally:
+        await eliminar_documento(original)
+
+
+async def recibir_documento_validado(
+    upload: UploadFile,
+    *clases: ClaseDocumento,
+    nombre: Optional[str] = None
+) -> DocumentoRecibido:
+    """
+    Recibir un documento con el tamaño máximo de su clase, revisarlo y, con
+    COMPRESION_DOCUMENTOS, recomprimirlo. Luego lo publica con su clave por
+    contenido, antes de que la ruta abra su transacción. Si no es válido
+    elimina el temporal y responde 400 (503 si no se pudo revisar).
+    """
+    limites_clase = limites(*clases)
+    recibido = await recibir_documento(upload, limites_clase.max_bytes)
+    try:
+        await validar_documento(recibido, limites_clase, nombre or upload.filename or clases[0].value)
+        if settings.COMPRESION_DOCUMENTOS:
+            await recomprimir_documento(recibido)
+        await publicar_blob(recibido)
+    except BaseException:
+        await eliminar_documento(recibido.temporal)
+        raise
+    return recibido
@@ -1,15 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Gauge, generate_latest
 from app.core.config import settings
-from app.core.database import engine, Base
-from app.api import auth, bolsa, recargas, soats, dashboard, usuarios
+from app.core.database import engine, read_engine, async_engine, async_read_engine, Base
+from app.core.eventos import difusor, iniciar_escucha
+from app.core.instrumentacion import InstrumentacionDBMiddleware
+from app.core.metricas import MetricasHTTPMiddleware, instrumentar_pools
+from app.core.validacion import cerrar_pool
+from app.services.metricas import MetricasNegocio, MetricasTrabajos, MetricasDocumentos
+from app.api import auth, bolsa, recargas, soats, dashboard, usuarios, eventos
 
 # Crear tablas
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Con EVENTOS_NOTIFY cada worker escucha los eventos publicados por los demás
+    escucha = iniciar_escucha()
+    yield
+    if escucha is not None:
+        escucha.cancel()
+        with suppress(asyncio.CancelledError):
+            await escucha
+    await cerrar_pool()
+
+
 app = FastAPI(
     title=settings.APP_NAME,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -19,6 +41,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
+)
+
+# Consultas SQL por solicitud: header Server-Timing, métricas y log de consultas lentas
+app.add_middleware(InstrumentacionDBMiddleware)
+
+# Métricas de Prometheus: latencia por ruta, pool de conexiones y negocio
+app.add_middleware(MetricasHTTPMiddleware)
+pools = {"primario": engine, "primario_async": async_engine.sync_engine}
+if read_engine is not engine:
+    pools["lectura"] = read_engine
+    pools["lectura_async"] = async_read_engine.sync_engine
+instrumentar_pools(pools)
+REGISTRY.register(MetricasNegocio())
+REGISTRY.register(MetricasTrabajos())
+REGISTRY.register(MetricasDocumentos())
+Gauge("eventos_clientes_conectados", "Clientes conectados a GET /api/eventos").set_function(
+    lambda: difusor.conectados
 )
 
 # Incluir routers
@@ -28,6 +68,7 @@ app.include_router(recargas.router, prefix="/api/recargas", tags=["Recargas"])
 app.include_router(soats.router, prefix="/api/soats", tags=["SOATs"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
 app.include_router(usuarios.router, prefix="/api/usuarios", tags=["Usuarios"])
+app.include_router(eventos.router, prefix="/api/eventos", tags=["Eventos"])
 
 
 @app.get("/")
@@ -41,3 +82,11 @@ def read_root():
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Métricas en formato Prometheus.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Text, BigInteger
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, Text, BigInteger, Index, Computed, UniqueConstraint
+from sqlalchemy.sql import func, text
 from datetime import datetime
 import enum
 try:
@@ -18,6 +18,20 @@ class TipoMotoCCEnum(str, enum.Enum):
     DE_100_200CC = "100_200cc"
 
 
+class TipoMovimientoEnum(str, enum.Enum):
+    APERTURA = "apertura"
+    RECARGA = "recarga"
+    EXPEDICION = "expedicion"
+    AJUSTE = "ajuste"
+
+
+class EstadoTrabajoEnum(str, enum.Enum):
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    FALLIDO = "fallido"
+
+
 class Usuario(Base):
     __tablename__ = "usuarios"
     
@@ -39,6 +53,51 @@ class Bolsa(Base):
     fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+class MovimientoBolsa(Base):
+    """Libro de movimientos de la bolsa. Solo se insertan filas, nunca se modifican."""
+    __tablename__ = "movimientos_bolsa"
+    __table_args__ = (
+        Index("ix_movimientos_bolsa_fecha_id", "fecha", "id"),
+    )
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    tipo = Column(Enum(TipoMovimientoEnum), nullable=False)
+    monto = Column(BigInteger, nullable=False)  # Positivo = entra a la bolsa, negativo = sale
+    saldo_resultante = Column(BigInteger, nullable=False)  # Saldo de la bolsa después del movimiento
+    recarga_id = Column(Integer, nullable=True, index=True)
+    soat_id = Column(Integer, nullable=True, index=True)
+    usuario_registro_id = Column(Integer, nullable=True)
+    fecha = Column(DateTime(timezone=True), server_default=func.clock_timestamp(), nullable=False)
+
+
+class CorteBolsa(Base):
+    """Saldo de la bolsa tomado periódicamente, para consultar saldos históricos sin sumar todo el libro."""
+    __tablename__ = "cortes_bolsa"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    movimiento_id = Column(BigInteger, nullable=False)  # Último movimiento incluido en el corte
+    saldo = Column(BigInteger, nullable=False)
+    fecha_corte = Column(DateTime(timezone=True), server_default=func.clock_timestamp(), nullable=False, index=True)
+
+
+class Documento(Base):
+    """Archivo guardado por contenido en uploads/blobs. Se comparte entre todos los registros que lo referencian."""
+    __tablename__ = "documentos"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    extension = Column(String(10), nullable=False)
+    tamano = Column(BigInteger, nullable=False)
+    tamano_original = Column(BigInteger, nullable=True)  # Antes de recomprimirlo al recibirlo
+    original = Column(String(255), nullable=True)  # Clave del original, con COMPRESION_CONSERVAR_ORIGINAL
+    referencias = Column(Integer, nullable=False, default=0)
+    # Completados por procesar_documentos.py
+    paginas = Column(Integer, nullable=True)  # PDFs
+    texto = Column(Text, nullable=True)  # Texto extraído de los PDFs
+    miniatura = Column(String(255), nullable=True)  # Clave de la miniatura de las imágenes
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Recarga(Base):
     __tablename__ = "recargas"
     
@@ -53,10 +112,32 @@ class Recarga(Base):
 
 class SoatExpedido(Base):
     __tablename__ = "soats_expedidos"
+    __table_args__ = (
+        # Soportan la paginación por cursor (fecha_expedicion, id) con y sin filtros
+        Index("ix_soats_expedidos_fecha_id", "fecha_expedicion", "id"),
+        Index("ix_soats_expedidos_tipo_fecha_id", "tipo_moto", "fecha_expedicion", "id"),
+        # Búsqueda exacta y por prefijo sobre las claves normalizadas, ya en el orden
+        # de los resultados (con collation "C" el índice sirve para LIKE 'ABC%')
+        Index(
+            "ix_soats_expedidos_placa_busqueda_fecha_id",
+            "placa_busqueda", text("fecha_expedicion DESC"), text("id DESC")
+        ),
+        Index(
+            "ix_soats_expedidos_cedula_busqueda_fecha_id",
+            "cedula_busqueda", text("fecha_expedicion DESC"), text("id DESC")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    placa = Column(String(20), nullable=False, index=True)
+    placa = Column(String(20), nullable=False)
     cedula = Column(String(20), nullable=True)
+    # Claves de búsqueda: solo letras y números, en mayúsculas (ver app/core/busqueda.py)
+    placa_busqueda = Column(
+        String(20, collation="C"), Computed("upper(regexp_replace(placa, '[^0-9A-Za-z]', '', 'g'))", persisted=True)
+    )
+    cedula_busqueda = Column(
+        String(20, collation="C"), Computed("upper(regexp_replace(cedula, '[^0-9A-Za-z]', '', 'g'))", persisted=True)
+    )
     nombre_propietario = Column(String(255), nullable=True)
     tipo_moto = Column(Enum(TipoMotoCCEnum), nullable=False)
     valor_soat = Column(Integer, nullable=False)
@@ -68,3 +149,53 @@ class SoatExpedido(Base):
     documento_poliza = Column(String(500))  # Ruta al PDF de la póliza (se sube después)
     fecha_expedicion = Column(DateTime(timezone=True), server_default=func.now())
     usuario_registro_id = Column(Integer, nullable=False)  # ID del admin que registró
+
+
+class ResumenDiario(Base):
+    """Totales por día de SOATs y recargas, actualizados en la misma transacción de cada operación."""
+    __tablename__ = "resumen_diario"
+    
+    fecha = Column(Date, primary_key=True)
+    soats_expedidos = Column(Integer, nullable=False, default=0)
+    total_valor_soat = Column(BigInteger, nullable=False, default=0)
+    total_comisiones = Column(BigInteger, nullable=False, default=0)
+    recargas = Column(Integer, nullable=False, default=0)
+    total_recargas = Column(BigInteger, nullable=False, default=0)
+
+
+class ClaveIdempotencia(Base):
+    """Respuesta guardada de una operación con header Idempotency-Key, para repetirla en los reintentos."""
+    __tablename__ = "claves_idempotencia"
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "clave", name="uq_claves_idempotencia_usuario_clave"),
+    )
+    
+    id = Column(BigInteger, primary_key=True)
+    usuario_id = Column(Integer, nullable=False)
+    clave = Column(String(255), nullable=False)
+    hash_solicitud = Column(String(64), nullable=False)
+    codigo_estado = Column(Integer)
+    respuesta = Column(Text)  # Cuerpo JSON de la respuesta
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+
+class TrabajoDocumento(Base):
+    """Tarea pendiente sobre un documento (checksum, texto, miniatura), procesada por procesar_documentos.py."""
+    __tablename__ = "trabajos_documentos"
+    __table_args__ = (
+        UniqueConstraint("tipo", "sha256", name="uq_trabajos_documentos_tipo_sha256"),
+        Index("ix_trabajos_documentos_estado_disponible", "estado", "disponible_desde"),
+    )
+    
+    id = Column(BigInteger, primary_key=True)
+    tipo = Column(String(20), nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    extension = Column(String(10), nullable=False)
+    estado = Column(Enum(EstadoTrabajoEnum), nullable=False, default=EstadoTrabajoEnum.PENDIENTE)
+    intentos = Column(Integer, nullable=False, default=0)
+    max_intentos = Column(Integer, nullable=False)
+    disponible_desde = Column(DateTime(timezone=True), nullable=False)  # Reintento o fin del plazo del worker
+    error = Column(Text)
+    resultado = Column(Text)  # JSON
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
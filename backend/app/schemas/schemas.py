@@ -1,7 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional
-from app.models.models import RolEnum, TipoMotoCCEnum
+from pydantic import BaseModel, EmailStr, field_validator
+from datetime import datetime, date
+from typing import List, Optional
+from app.models.models import RolEnum, TipoMotoCCEnum, TipoMovimientoEnum
 
 
 # ========== Usuario Schemas ==========
@@ -45,6 +45,25 @@ class BolsaResponse(BaseModel):
         from_attributes = True
 
 
+class MovimientoBolsaResponse(BaseModel):
+    id: int
+    tipo: TipoMovimientoEnum
+    monto: int
+    saldo_resultante: int
+    recarga_id: Optional[int]
+    soat_id: Optional[int]
+    usuario_registro_id: Optional[int]
+    fecha: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class SaldoFechaResponse(BaseModel):
+    fecha: datetime
+    saldo: int
+
+
 # ========== Recarga Schemas ==========
 class RecargaCreate(BaseModel):
     monto: int
@@ -52,6 +71,21 @@ class RecargaCreate(BaseModel):
     observaciones: Optional[str] = None
 
 
+def _fecha_historica(valor):
+    # En los archivos de importación la fecha puede venir sin hora
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        return datetime.combine(valor, datetime.min.time())
+    if isinstance(valor, str) and len(valor.strip()) == 10:
+        return f"{valor.strip()}T00:00:00"
+    return valor
+
+
+class RecargaImport(RecargaCreate):
+    fecha_recarga: Optional[datetime] = None
+    
+    _validar_fecha = field_validator("fecha_recarga", mode="before")(_fecha_historica)
+
+
 class RecargaResponse(BaseModel):
     id: int
     monto: int
@@ -82,6 +116,21 @@ class SoatExpedidoUpdate(BaseModel):
     observaciones: Optional[str] = None
 
 
+class SoatLoteItem(SoatExpedidoCreate):
+    # Nombres de archivo de los PDFs dentro de la lista `documentos` del lote
+    archivo_factura: str
+    archivo_soat: str
+
+
+class SoatImport(SoatExpedidoCreate):
+    fecha_expedicion: Optional[datetime] = None
+    # Si no vienen se usan las tarifas vigentes
+    valor_soat: Optional[int] = None
+    comision: Optional[int] = None
+    
+    _validar_fecha = field_validator("fecha_expedicion", mode="before")(_fecha_historica)
+
+
 class SoatExpedidoResponse(BaseModel):
     id: int
     placa: str
@@ -102,6 +151,12 @@ class SoatExpedidoResponse(BaseModel):
         from_attributes = True
 
 
+class SoatLoteResponse(BaseModel):
+    cantidad: int
+    total: int
+    soats: List[SoatExpedidoResponse]
+
+
 # ========== Dashboard Schemas ==========
 class DashboardStats(BaseModel):
     saldo_actual: int
@@ -0,0 +1,211 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.core.config import settings
+from app.models.models import Bolsa, MovimientoBolsa, CorteBolsa, TipoMovimientoEnum
+
+# Todos los movimientos de saldo pasan por este módulo. Cada uno es un único
+# UPDATE condicional sobre la fila de la bolsa: la base de datos serializa las
+# escrituras concurrentes con el bloqueo de fila, sin leer-modificar-escribir
+# en Python. El bloqueo se libera con el commit del llamador.
+#
+# Cada cambio de saldo queda además en movimientos_bolsa con el saldo resultante,
+# y cada BOLSA_CORTE_CADA_MOVIMIENTOS movimientos se guarda un corte en cortes_bolsa.
+# El primer movimiento de un libro vacío lo abre con un movimiento APERTURA.
+# La fecha de ambos es clock_timestamp(), la hora real del INSERT bajo el bloqueo,
+# y no la del inicio de la transacción: así sigue el mismo orden que el id.
+
+
+def _obtener_bolsa_id(db: Session, crear: bool = False):
+    bolsa_id = db.query(Bolsa.id).order_by(Bolsa.id).limit(1).scalar()
+    if bolsa_id is None and crear:
+        bolsa = Bolsa(saldo_actual=0)
+        db.add(bolsa)
+        db.flush()
+        bolsa_id = bolsa.id
+    return bolsa_id
+
+
+def _registrar_movimientos(db: Session, movimientos: List[MovimientoBolsa]):
+    # Se llama con la fila de la bolsa bloqueada, así que los movimientos y
+    # cortes se registran en el mismo orden en que cambió el saldo. Los ids
+    # tienen huecos (las transacciones revertidas también consumen la
+    # secuencia): el corte se toma contando los movimientos desde el último.
+    ultimo_corte = db.query(CorteBolsa.movimiento_id).order_by(CorteBolsa.id.desc()).limit(1).scalar()
+    pendientes = db.query(func.count(MovimientoBolsa.id)).filter(MovimientoBolsa.id > (ultimo_corte or 0)).scalar()
+
+    if ultimo_corte is None and pendientes == 0:
+        # Libro vacío: se abre con el saldo que había antes de este movimiento,
+        # para que los saldos históricos no partan de 0
+        saldo_previo = movimientos[0].saldo_resultante - movimientos[0].monto
+        apertura = MovimientoBolsa(
+            tipo=TipoMovimientoEnum.APERTURA, monto=saldo_previo, saldo_resultante=saldo_previo
+        )
+        db.add(apertura)
+        db.flush()
+        db.add(CorteBolsa(movimiento_id=apertura.id, saldo=saldo_previo))
+
+    db.add_all(movimientos)
+    db.flush()
+
+    for movimiento in movimientos:
+        pendientes += 1
+        if pendientes >= settings.BOLSA_CORTE_CADA_MOVIMIENTOS:
+            db.add(CorteBolsa(movimiento_id=movimiento.id, saldo=movimiento.saldo_resultante))
+            pendientes = 0
+
+
+def _registrar_movimiento(
+    db: Session,
+    tipo: TipoMovimientoEnum,
+    monto: int,
+    saldo_resultante: int,
+    usuario_id: Optional[int],
+    soat_id: Optional[int],
+    recarga_id: Optional[int]
+) -> MovimientoBolsa:
+    movimiento = MovimientoBolsa(
+        tipo=tipo,
+        monto=monto,
+        saldo_resultante=saldo_resultante,
+        soat_id=soat_id,
+        recarga_id=recarga_id,
+        usuario_registro_id=usuario_id
+    )
+    _registrar_movimientos(db, [movimiento])
+    return movimiento
+
+
+def _descontar(db: Session, monto: int, detalle: str) -> int:
+    bolsa_id = _obtener_bolsa_id(db)
+    if bolsa_id is None:
+        raise HTTPException(status_code=400, detail="No hay bolsa inicializada")
+
+    nuevo_saldo = db.execute(
+        update(Bolsa)
+        .where(Bolsa.id == bolsa_id, Bolsa.saldo_actual >= monto)
+        .values(saldo_actual=Bolsa.saldo_actual - monto, fecha_actualizacion=func.now())
+        .returning(Bolsa.saldo_actual)
+    ).scalar_one_or_none()
+
+    if nuevo_saldo is None:
+        saldo_actual = db.query(Bolsa.saldo_actual).filter(Bolsa.id == bolsa_id).scalar()
+        raise HTTPException(
+            status_code=400,
+            detail=f"{detalle}. Saldo actual: ${saldo_actual:,}, Requerido: ${monto:,}"
+        )
+    return nuevo_saldo
+
+
+def debitar_bolsa(
+    db: Session,
+    monto: int,
+    tipo: TipoMovimientoEnum,
+    usuario_id: Optional[int] = None,
+    soat_id: Optional[int] = None,
+    recarga_id: Optional[int] = None,
+    detalle: str = "Saldo insuficiente"
+) -> int:
+    """
+    Descontar un monto de la bolsa solo si el saldo alcanza.
+    Retorna el nuevo saldo. No hace commit.
+    """
+    nuevo_saldo = _descontar(db, monto, detalle)
+    _registrar_movimiento(db, tipo, -monto, nuevo_saldo, usuario_id, soat_id, recarga_id)
+    return nuevo_saldo
+
+
+def debitar_bolsa_lote(
+    db: Session,
+    cargos: List[Tuple[int, int]],
+    tipo: TipoMovimientoEnum,
+    usuario_id: Optional[int] = None,
+    detalle: str = "Saldo insuficiente"
+) -> int:
+    """
+    Descontar de una vez la suma de varios cargos (soat_id, monto) con un solo
+    UPDATE, dejando un movimiento por cargo con su saldo resultante.
+    Retorna el nuevo saldo. No hace commit.
+    """
+    total = sum(monto for _, monto in cargos)
+    nuevo_saldo = _descontar(db, total, detalle)
+
+    saldo = nuevo_saldo + total
+    movimientos = []
+    for soat_id, monto in cargos:
+        saldo -= monto
+        movimientos.append(MovimientoBolsa(
+            tipo=tipo,
+            monto=-monto,
+            saldo_resultante=saldo,
+            soat_id=soat_id,
+            usuario_registro_id=usuario_id
+        ))
+    _registrar_movimientos(db, movimientos)
+    return nuevo_saldo
+
+
+def acreditar_bolsa(
+    db: Session,
+    monto: int,
+    tipo: TipoMovimientoEnum,
+    usuario_id: Optional[int] = None,
+    soat_id: Optional[int] = None,
+    recarga_id: Optional[int] = None
+) -> int:
+    """
+    Sumar un monto a la bolsa, inicializándola si no existe.
+    Retorna el nuevo saldo. No hace commit.
+    """
+    bolsa_id = _obtener_bolsa_id(db, crear=True)
+
+    nuevo_saldo = db.execute(
+        update(Bolsa)
+        .where(Bolsa.id == bolsa_id)
+        .values(saldo_actual=Bolsa.saldo_actual + monto, fecha_actualizacion=func.now())
+        .returning(Bolsa.saldo_actual)
+    ).scalar_one()
+
+    _registrar_movimiento(db, tipo, monto, nuevo_saldo, usuario_id, soat_id, recarga_id)
+    return nuevo_saldo
+
+
+def ajustar_bolsa(
+    db: Session,
+    diferencia: int,
+    usuario_id: Optional[int] = None,
+    soat_id: Optional[int] = None,
+    detalle: str = "Saldo insuficiente"
+) -> int:
+    """
+    Aplicar una diferencia de cobro: positiva se descuenta, negativa se devuelve.
+    Retorna el nuevo saldo. No hace commit.
+    """
+    if diferencia > 0:
+        return debitar_bolsa(
+            db, diferencia, TipoMovimientoEnum.AJUSTE, usuario_id, soat_id=soat_id, detalle=detalle
+        )
+    return acreditar_bolsa(db, -diferencia, TipoMovimientoEnum.AJUSTE, usuario_id, soat_id=soat_id)
+
+
+def saldo_a_fecha(db: Session, fecha: datetime) -> int:
+    """
+    Saldo de la bolsa a una fecha: el último corte anterior a la fecha
+    más los movimientos registrados después de ese corte.
+    """
+    corte = db.query(CorteBolsa).filter(
+        CorteBolsa.fecha_corte <= fecha
+    ).order_by(CorteBolsa.fecha_corte.desc(), CorteBolsa.id.desc()).first()
+
+    query = db.query(func.coalesce(func.sum(MovimientoBolsa.monto), 0)).filter(
+        MovimientoBolsa.fecha <= fecha
+    )
+    saldo_base = 0
+    if corte:
+        query = query.filter(MovimientoBolsa.id > corte.movimiento_id)
+        saldo_base = corte.saldo
+
+    return saldo_base + query.scalar()
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.core.storage import (
+    DocumentoRecibido, BLOB_ROOT, ORIGINALES_ROOT, get_storage, ruta_blob, es_blob, calcular_sha256,
+    publicar_blob
+)
+from app.models.models import Documento, TrabajoDocumento
+from app.services.trabajos import encolar_trabajos
+
+# Los documentos se guardan una sola vez por contenido. documentos.referencias
+# cuenta cuántas columnas documento_* apuntan a cada archivo; los que quedan
+# en cero se eliminan con purgar_documentos (ver mantener_documentos.py).
+# Cada documento registrado encola sus tareas de procesamiento (checksum, texto,
+# miniatura) para procesar_documentos.py, fuera de la solicitud.
+
+
+def _sumar_referencias(db: Session, recibido: DocumentoRecibido, extension: str, referencias: int) -> str:
+    stmt = insert(Documento).values(
+        sha256=recibido.sha256,
+        extension=extension,
+        tamano=recibido.tamano,
+        tamano_original=recibido.tamano_original,
+        original=recibido.original,
+        paginas=recibido.paginas,
+        referencias=referencias
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Documento.sha256],
+        set_={"referencias": Documento.referencias + referencias}
+    ).returning(Documento.extension)
+    extension_guardada = db.execute(stmt).scalar_one()
+    encolar_trabajos(db, recibido.sha256, extension_guardada)
+    return extension_guardada
+
+
+async def almacenar_documento(
+    db: AsyncSession,
+    recibido: DocumentoRecibido,
+    extension: str,
+    referencias: int = 1
+) -> str:
+    """
+    Registrar las referencias a un documento recibido. Retorna la ruta a
+    guardar en la columna documento_*. No hace commit.
+    Las rutas de la API lo reciben ya publicado (recibir_documento_validado),
+    así que dentro de la transacción solo se actualiza el contador; si no lo
+    está (mantener_documentos.py migrar) se publica aquí.
+    """
+    extension = re.sub(r"[^a-z0-9]", "", extension.lower())[:10] or "bin"
+    if recibido.clave is None:
+        await publicar_blob(recibido, extension)
+    extension_guardada = await db.run_sync(_sumar_referencias, recibido, extension, referencias)
+    return ruta_blob(recibido.sha256, extension_guardada)
+
+
+def liberar_documento(db: Session, ruta: Optional[str]) -> Optional[str]:
+    """
+    Quitar una referencia a un documento. No hace commit.
+    Los archivos anteriores al almacenamiento por contenido no se comparten:
+    se retorna su ruta para eliminarla después del commit.
+    """
+    if not ruta:
+        return None
+    if not es_blob(ruta):
+        return ruta
+
+    sha256 = Path(ruta).name.split(".")[0]
+    db.execute(
+        update(Documento)
+        .where(Documento.sha256 == sha256, Documento.referencias > 0)
+        .values(referencias=Documento.referencias - 1)
+    )
+    return None
+
+
+def verificar_documento(ruta: str) -> bool:
+    """
+    Comprobar que el contenido de un documento coincide con el hash de su nombre.
+    """
+    if not es_blob(ruta):
+        return os.path.exists(ruta)
+    sha256 = Path(ruta).name.split(".")[0]
+    try:
+        return calcular_sha256(ruta) == sha256
+    except Exception:
+        # Archivo u objeto inexistente o ilegible
+        return False
+
+
+def purgar_documentos(db: Session, antiguedad_minima_segundos: int = 3600) -> List[str]:
+    """
+    Eliminar los documentos sin referencias y los blobs y originales que no
+    tienen registro (subidas cuya transacción no se confirmó).
+    Retorna las rutas eliminadas. Hace commit.
+    """
+    storage = get_storage()
+    eliminados = []
+
+    # Primero se eliminan los registros. Una solicitud que publicó el mismo
+    # archivo antes de abrir su transacción puede volver a registrarlo en
+    # cualquier momento, así que el blob y el original no se eliminan aquí:
+    # quedan sin registro y los elimina el recorrido de abajo cuando superan
+    # la antigüedad mínima (publicar_blob renueva la fecha del blob al reusarlo).
+    sin_referencias = db.query(Documento).filter(
+        Documento.referencias == 0
+    ).with_for_update(skip_locked=True).all()
+    miniaturas = []
+    for documento in sin_referencias:
+        if documento.miniatura:
+            miniaturas.append((documento.sha256, documento.miniatura))
+        db.execute(delete(TrabajoDocumento).where(TrabajoDocumento.sha256 == documento.sha256))
+        db.delete(documento)
+    db.commit()
+
+    # Un documento registrado de nuevo vuelve a generar su miniatura
+    for sha256, miniatura in miniaturas:
+        if db.query(Documento.id).filter(Documento.sha256 == sha256).first() is None:
+            storage.eliminar(miniatura)
+            eliminados.append(miniatura)
+
+    limite = time.time() - antiguedad_minima_segundos
+    for ruta, modificado in storage.listar(str(BLOB_ROOT)):
+        if modificado > limite:
+            continue
+        sha256, _, extension = Path(ruta).name.partition(".")
+        registrado = db.query(Documento.id).filter(
+            Documento.sha256 == sha256, Documento.extension == extension
+        ).first()
+        if registrado is None:
+            storage.eliminar(ruta)
+            eliminados.append(ruta)
+
+    for ruta, modificado in storage.listar(str(ORIGINALES_ROOT)):
+        if modificado > limite:
+            continue
+        if db.query(Documento.id).filter(Documento.original == ruta).first() is None:
+            storage.eliminar(ruta)
+            eliminados.append(ruta)
+
+    return eliminados
+
+
+async def reemplazar_documento(
+    db: AsyncSession,
+    ruta_actual: Optional[str],
+    recibido: DocumentoRecibido,
+    extension: str
+):
+    """
+    Cambiar la referencia de una columna documento_* por un documento recibido.
+    Retorna la nueva ruta y, si corresponde, la ruta anterior a eliminar
+    después del commit. No hace commit.
+    """
+    por_eliminar = await db.run_sync(liberar_documento, ruta_actual)
+    nueva_ruta = await almacenar_documento(db, recibido, extension)
+    if por_eliminar == nueva_ruta:
+        por_eliminar = None
+    return nueva_ruta, por_eliminar
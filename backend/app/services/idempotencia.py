@@ -0,0 +1,122 @@
+import hashlib
+import itertools
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import ClaveIdempotencia
+
+# Las operaciones que mueven saldo aceptan el header Idempotency-Key. La clave se
+# registra con un INSERT ... ON CONFLICT DO NOTHING dentro de la misma transacción
+# que la operación: un duplicado concurrente queda esperando en el índice único
+# hasta que la primera termine. Si esta confirmó, el duplicado repite su respuesta;
+# si falló, la clave queda libre y el duplicado ejecuta la operación.
+#
+# Las claves vencen a las IDEMPOTENCIA_TTL_HORAS: una clave vencida se puede volver
+# a usar, y cada PURGA_CADA_RECLAMOS reclamos se borra un tramo de claves vencidas.
+
+PURGA_CADA_RECLAMOS = 100
+PURGA_TAMANO = 1000
+
+_reclamos = itertools.count(1)
+
+
+def hash_solicitud(**datos: Any) -> str:
+    """
+    Huella de los datos de una solicitud, para detectar una clave reutilizada con otros datos.
+    """
+    contenido = json.dumps(datos, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def _filtro(usuario_id: int, clave: str):
+    return (ClaveIdempotencia.usuario_id == usuario_id, ClaveIdempotencia.clave == clave)
+
+
+def _vencimiento() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(hours=settings.IDEMPOTENCIA_TTL_HORAS)
+
+
+def purgar_claves(db: Session, limite: int = PURGA_TAMANO) -> int:
+    """
+    Borrar hasta `limite` claves vencidas. Retorna cuántas se borraron. Hace commit.
+    """
+    vencidas = db.query(ClaveIdempotencia.id).filter(
+        ClaveIdempotencia.fecha_creacion < _vencimiento()
+    ).limit(limite).scalar_subquery()
+    borradas = db.execute(
+        delete(ClaveIdempotencia).where(ClaveIdempotencia.id.in_(vencidas))
+    ).rowcount
+    db.commit()
+    return borradas
+
+
+def _purgar():
+    with SessionLocal() as db:
+        purgar_claves(db)
+
+
+def _purgar_periodicamente():
+    if next(_reclamos) % PURGA_CADA_RECLAMOS:
+        return
+    # En un hilo y una sesión aparte para no alargar la transacción de la
+    # operación ni bloquear el event loop (reclamar_clave corre en él)
+    threading.Thread(target=_purgar, daemon=True).start()
+
+
+def reclamar_clave(db: Session, usuario_id: int, clave: str, huella: str) -> Optional[JSONResponse]:
+    """
+    Registrar la clave para esta solicitud. Si ya se usó, retorna la respuesta
+    guardada para repetirla en lugar de ejecutar la operación. No hace commit.
+    """
+    _purgar_periodicamente()
+
+    insertar = (
+        insert(ClaveIdempotencia)
+        .values(usuario_id=usuario_id, clave=clave, hash_solicitud=huella)
+        .on_conflict_do_nothing(index_elements=[ClaveIdempotencia.usuario_id, ClaveIdempotencia.clave])
+        .returning(ClaveIdempotencia.id)
+    )
+    if db.execute(insertar).scalar_one_or_none() is not None:
+        return None
+
+    # Una clave vencida que todavía no se purgó se libera y se reclama de nuevo
+    vencida = db.execute(
+        delete(ClaveIdempotencia)
+        .where(*_filtro(usuario_id, clave), ClaveIdempotencia.fecha_creacion < _vencimiento())
+    ).rowcount
+    if vencida and db.execute(insertar).scalar_one_or_none() is not None:
+        return None
+
+    existente = db.query(ClaveIdempotencia).filter(*_filtro(usuario_id, clave)).first()
+    if existente is None or existente.respuesta is None:
+        raise HTTPException(status_code=409, detail="La solicitud con esta Idempotency-Key sigue en proceso")
+    if existente.hash_solicitud != huella:
+        raise HTTPException(
+            status_code=422,
+            detail="La Idempotency-Key ya se usó con una solicitud distinta"
+        )
+    return JSONResponse(
+        content=json.loads(existente.respuesta),
+        status_code=existente.codigo_estado,
+        headers={"Idempotency-Replayed": "true"}
+    )
+
+
+def guardar_respuesta(db: Session, usuario_id: int, clave: str, cuerpo: Any, codigo_estado: int = 200):
+    """
+    Guardar la respuesta de la operación junto a su clave. No hace commit:
+    se confirma con la operación.
+    """
+    db.execute(
+        update(ClaveIdempotencia)
+        .where(*_filtro(usuario_id, clave))
+        .values(codigo_estado=codigo_estado, respuesta=json.dumps(cuerpo))
+    )
@@ -0,0 +1,204 @@
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import Recarga, SoatExpedido, TipoMovimientoEnum
+from app.schemas.schemas import RecargaImport, SoatImport
+from app.services.bolsa import acreditar_bolsa, debitar_bolsa
+from app.services.resumen import dia_resumen, registrar_expedicion, registrar_recarga
+from app.services.tarifas import tarifa_soat
+
+# Importación de registros históricos desde CSV o XLSX (ver importar_historico.py).
+# El archivo se lee fila por fila y se valida con los schemas de la API. Las filas
+# válidas se insertan por lotes con bulk_insert_mappings, cada lote en su propia
+# transacción junto con su resumen diario y un único movimiento de bolsa por el
+# total del lote: si la importación se corta, lo ya confirmado queda cuadrado.
+
+TAMANO_LOTE = 1000
+
+
+@dataclass
+class ResultadoImportacion:
+    importados: int = 0
+    total: int = 0
+    errores: List[Tuple[int, str]] = field(default_factory=list)
+    # Motivo por el que se detuvo la importación antes del final
+    detenido: Optional[str] = None
+
+
+def _celda(valor):
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    valor = str(valor).strip()
+    return valor or None
+
+
+def leer_filas(ruta: Path) -> Iterator[Dict[str, object]]:
+    """
+    Recorrer las filas de un CSV o XLSX como diccionarios por nombre de columna.
+    La primera fila es el encabezado.
+    """
+    if ruta.suffix.lower() == ".xlsx":
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RuntimeError("Para importar archivos XLSX instale openpyxl")
+
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            encabezado = [str(c).strip().lower() if c is not None else "" for c in next(filas, ())]
+            for fila in filas:
+                yield {col: _celda(v) for col, v in zip(encabezado, fila) if col}
+        finally:
+            libro.close()
+    else:
+        with open(ruta, newline="", encoding="utf-8-sig") as archivo:
+            for fila in csv.DictReader(archivo):
+                yield {(col or "").strip().lower(): _celda(v) for col, v in fila.items() if col}
+
+
+def _mensaje(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors(include_url=False)
+    )
+
+
+def _importar(
+    db: Session,
+    filas: Iterator[Dict[str, object]],
+    schema: Type[BaseModel],
+    guardar_lote: Callable[[Session, List[BaseModel]], None],
+    tamano_lote: int,
+    progreso: Optional[Callable[[ResultadoImportacion], None]]
+) -> ResultadoImportacion:
+    resultado = ResultadoImportacion()
+    lote = []
+
+    def confirmar() -> bool:
+        try:
+            guardar_lote(db, lote)
+            db.commit()
+        except HTTPException as e:
+            # Por ejemplo saldo insuficiente: el lote no se importa y se detiene
+            db.rollback()
+            resultado.detenido = e.detail
+            return False
+        except BaseException:
+            db.rollback()
+            raise
+        resultado.importados += len(lote)
+        lote.clear()
+        if progreso:
+            progreso(resultado)
+        return True
+
+    # La fila 1 es el encabezado
+    for numero, fila in enumerate(filas, start=2):
+        resultado.total += 1
+        try:
+            lote.append(schema.model_validate(fila))
+        except ValidationError as e:
+            resultado.errores.append((numero, _mensaje(e)))
+            continue
+        if len(lote) >= tamano_lote and not confirmar():
+            return resultado
+    if lote:
+        confirmar()
+    return resultado
+
+
+def _guardar_recargas(usuario_id: int):
+    def guardar(db: Session, lote: List[RecargaImport]):
+        db.bulk_insert_mappings(Recarga, [
+            {**r.model_dump(exclude_none=True), "usuario_registro_id": usuario_id} for r in lote
+        ])
+
+        # Un upsert del resumen por día del lote
+        por_dia = {}
+        for r in lote:
+            dia = por_dia.setdefault(dia_resumen(r.fecha_recarga), [r.fecha_recarga, 0, 0])
+            dia[1] += 1
+            dia[2] += r.monto
+        for fecha, cantidad, monto in por_dia.values():
+            registrar_recarga(db, monto, cantidad=cantidad, fecha=fecha)
+
+        acreditar_bolsa(db, sum(r.monto for r in lote), TipoMovimientoEnum.RECARGA, usuario_id)
+    return guardar
+
+
+def _guardar_soats(usuario_id: int):
+    def guardar(db: Session, lote: List[SoatImport]):
+        registros = []
+        por_dia = {}
+        for soat in lote:
+            valor_soat = soat.valor_soat if soat.valor_soat is not None else tarifa_soat(soat.tipo_moto)
+            comision = soat.comision if soat.comision is not None else settings.COMISION_FIJA
+            registro = {
+                "placa": soat.placa.upper(),
+                "cedula": soat.cedula.upper() if soat.cedula else None,
+                "nombre_propietario": soat.nombre_propietario.upper() if soat.nombre_propietario else None,
+                "tipo_moto": soat.tipo_moto,
+                "valor_soat": valor_soat,
+                "comision": comision,
+                "total": valor_soat + comision,
+                "observaciones": soat.observaciones,
+                "usuario_registro_id": usuario_id,
+            }
+            if soat.fecha_expedicion:
+                registro["fecha_expedicion"] = soat.fecha_expedicion
+            registros.append(registro)
+
+            dia = por_dia.setdefault(dia_resumen(soat.fecha_expedicion), [soat.fecha_expedicion, 0, 0, 0])
+            dia[1] += 1
+            dia[2] += valor_soat
+            dia[3] += comision
+
+        db.bulk_insert_mappings(SoatExpedido, registros)
+        for fecha, cantidad, valor, comision in por_dia.values():
+            registrar_expedicion(db, valor, comision, cantidad=cantidad, fecha=fecha)
+
+        debitar_bolsa(
+            db,
+            sum(r["total"] for r in registros),
+            TipoMovimientoEnum.EXPEDICION,
+            usuario_id,
+            detalle="Saldo insuficiente para importar el lote"
+        )
+    return guardar
+
+
+def importar_recargas(
+    db: Session,
+    filas: Iterator[Dict[str, object]],
+    usuario_id: int,
+    tamano_lote: int = TAMANO_LOTE,
+    progreso: Optional[Callable[[ResultadoImportacion], None]] = None
+) -> ResultadoImportacion:
+    """
+    Importar recargas históricas (columnas: monto, referencia, observaciones,
+    fecha_recarga). Hace commit por lote.
+    """
+    return _importar(db, filas, RecargaImport, _guardar_recargas(usuario_id), tamano_lote, progreso)
+
+
+def importar_soats(
+    db: Session,
+    filas: Iterator[Dict[str, object]],
+    usuario_id: int,
+    tamano_lote: int = TAMANO_LOTE,
+    progreso: Optional[Callable[[ResultadoImportacion], None]] = None
+) -> ResultadoImportacion:
+    """
+    Importar SOATs históricos (columnas: placa, cedula, nombre_propietario,
+    tipo_moto, observaciones, fecha_expedicion y opcionalmente valor_soat y
+    comision). Hace commit por lote.
+    """
+    return _importar(db, filas, SoatImport, _guardar_soats(usuario_id), tamano_lote, progreso)
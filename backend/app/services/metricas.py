@@ -0,0 +1,119 @@
+import logging
+from datetime import datetime, timezone
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import func, select
+from app.core.database import ReadSessionLocal
+from app.models.models import Bolsa, Documento, ResumenDiario, TrabajoDocumento, EstadoTrabajoEnum
+
+# Métricas de negocio para Prometheus. Se leen de la base de datos en cada scrape
+# (bolsa y totales de resumen_diario, una sola consulta pequeña), así que son las
+# mismas sin importar qué worker responda y no se reinician al reiniciar la app.
+# describe() retorna una lista vacía: sin ella REGISTRY.register llamaría a
+# collect() al importar app.main, con una consulta por collector en cada worker.
+
+logger = logging.getLogger("app.metricas")
+
+
+class MetricasNegocio:
+    """
+    Collector de Prometheus con el saldo de la bolsa y los totales de SOATs y recargas.
+    """
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        saldo_actual = select(Bolsa.saldo_actual).order_by(Bolsa.id).limit(1).scalar_subquery()
+        try:
+            with ReadSessionLocal() as db:
+                saldo, soats, valor_soats, comisiones, recargas, total_recargas = db.query(
+                    saldo_actual,
+                    func.sum(ResumenDiario.soats_expedidos),
+                    func.sum(ResumenDiario.total_valor_soat),
+                    func.sum(ResumenDiario.total_comisiones),
+                    func.sum(ResumenDiario.recargas),
+                    func.sum(ResumenDiario.total_recargas)
+                ).one()
+        except Exception:
+            logger.exception("No se pudieron leer las métricas de negocio")
+            return
+
+        yield GaugeMetricFamily("bolsa_saldo_pesos", "Saldo actual de la bolsa", value=saldo or 0)
+        yield CounterMetricFamily("soats_expedidos", "SOATs expedidos", value=soats or 0)
+        yield GaugeMetricFamily(
+            "soats_valor_pesos", "Valor acumulado de los SOATs expedidos (cambia con los ajustes)",
+            value=valor_soats or 0
+        )
+        yield GaugeMetricFamily("soats_comisiones_pesos", "Comisiones acumuladas", value=comisiones or 0)
+        yield CounterMetricFamily("recargas", "Recargas registradas", value=recargas or 0)
+        yield CounterMetricFamily("recargas_monto_pesos", "Monto acumulado de recargas", value=total_recargas or 0)
+
+
+class MetricasTrabajos:
+    """
+    Collector de Prometheus con la cola de trabajos sobre documentos: trabajos por
+    estado y tipo (sin los completados) y antigüedad del pendiente más antiguo.
+    """
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        try:
+            with ReadSessionLocal() as db:
+                conteos = db.query(
+                    TrabajoDocumento.estado, TrabajoDocumento.tipo, func.count()
+                ).filter(
+                    TrabajoDocumento.estado != EstadoTrabajoEnum.COMPLETADO
+                ).group_by(TrabajoDocumento.estado, TrabajoDocumento.tipo).all()
+                mas_antiguo = db.query(func.min(TrabajoDocumento.fecha_creacion)).filter(
+                    TrabajoDocumento.estado == EstadoTrabajoEnum.PENDIENTE
+                ).scalar()
+        except Exception:
+            logger.exception("No se pudieron leer las métricas de la cola de trabajos")
+            return
+
+        trabajos = GaugeMetricFamily(
+            "trabajos_documentos", "Trabajos sobre documentos por estado y tipo", labels=["estado", "tipo"]
+        )
+        for estado, tipo, cantidad in conteos:
+            trabajos.add_metric([estado.value, tipo], cantidad)
+        yield trabajos
+
+        antiguedad = 0
+        if mas_antiguo is not None:
+            antiguedad = max((datetime.now(timezone.utc) - mas_antiguo).total_seconds(), 0)
+        yield GaugeMetricFamily(
+            "trabajos_documentos_pendiente_antiguedad_segundos",
+            "Antigüedad del trabajo pendiente más antiguo",
+            value=antiguedad
+        )
+
+
+class MetricasDocumentos:
+    """
+    Collector de Prometheus con el espacio ocupado por los documentos y el
+    ahorrado al recomprimirlos (documentos.tamano_original - documentos.tamano).
+    """
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        try:
+            with ReadSessionLocal() as db:
+                documentos, tamano, ahorrados = db.query(
+                    func.count(Documento.id),
+                    func.sum(Documento.tamano),
+                    func.sum(Documento.tamano_original - Documento.tamano)
+                ).one()
+        except Exception:
+            logger.exception("No se pudieron leer las métricas de documentos")
+            return
+
+        yield GaugeMetricFamily("documentos", "Documentos guardados", value=documentos or 0)
+        yield GaugeMetricFamily("documentos_bytes", "Tamaño de los documentos guardados", value=tamano or 0)
+        yield GaugeMetricFamily(
+            "documentos_bytes_ahorrados", "Bytes ahorrados al recomprimir los documentos recibidos",
+            value=ahorrados or 0
+        )
@@ -0,0 +1,77 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.models.models import ResumenDiario
+
+# Los totales del dashboard se leen de resumen_diario en lugar de recorrer
+# soats_expedidos y recargas. Cada operación suma sus montos a la fila del día
+# con un INSERT ... ON CONFLICT DO UPDATE dentro de la transacción del llamador.
+
+
+def dia_resumen(fecha: Optional[datetime]) -> date:
+    if fecha is None:
+        return date.today()
+    if fecha.tzinfo is not None:
+        return fecha.astimezone().date()
+    return fecha.date()
+
+
+def _acumular(db: Session, dia: date, **incrementos: int):
+    stmt = insert(ResumenDiario).values(fecha=dia, **incrementos)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ResumenDiario.fecha],
+        set_={
+            campo: getattr(ResumenDiario, campo) + stmt.excluded[campo]
+            for campo in incrementos
+        }
+    )
+    db.execute(stmt)
+
+
+def registrar_expedicion(
+    db: Session,
+    valor_soat: int,
+    comision: int,
+    cantidad: int = 1,
+    fecha: Optional[datetime] = None
+):
+    """
+    Sumar SOATs expedidos al resumen del día (hoy si no se indica). No hace commit.
+    """
+    _acumular(
+        db,
+        dia_resumen(fecha),
+        soats_expedidos=cantidad,
+        total_valor_soat=valor_soat,
+        total_comisiones=comision
+    )
+
+
+def registrar_recarga(
+    db: Session,
+    monto: int,
+    cantidad: int = 1,
+    fecha: Optional[datetime] = None
+):
+    """
+    Sumar recargas al resumen del día (hoy si no se indica). No hace commit.
+    """
+    _acumular(db, dia_resumen(fecha), recargas=cantidad, total_recargas=monto)
+
+
+def registrar_ajuste_soat(
+    db: Session,
+    fecha_expedicion: Optional[datetime],
+    diferencia_valor: int,
+    diferencia_comision: int = 0
+):
+    """
+    Corregir los totales del día en que se expidió un SOAT editado. No hace commit.
+    """
+    _acumular(
+        db,
+        dia_resumen(fecha_expedicion),
+        total_valor_soat=diferencia_valor,
+        total_comisiones=diferencia_comision
+    )
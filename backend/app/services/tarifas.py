@@ -0,0 +1,14 @@
+from fastapi import HTTPException
+from app.core.config import settings
+from app.models.models import TipoMotoCCEnum
+
+
+def tarifa_soat(tipo_moto: TipoMotoCCEnum) -> int:
+    """
+    Valor del SOAT según el tipo de moto, con las tarifas vigentes.
+    """
+    if tipo_moto == TipoMotoCCEnum.HASTA_99CC:
+        return settings.TARIFA_MOTO_HASTA_99CC
+    if tipo_moto == TipoMotoCCEnum.DE_100_200CC:
+        return settings.TARIFA_MOTO_100_200CC
+    raise HTTPException(status_code=400, detail="Tipo de moto inválido")
@@ -0,0 +1,308 @@
+import io
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.core.storage import UPLOAD_ROOT, TMP_ROOT, get_storage, ruta_blob, calcular_sha256
+from app.models.models import Documento, TrabajoDocumento, EstadoTrabajoEnum
+
+# Cola de trabajos sobre los documentos recibidos, guardada en la tabla
+# trabajos_documentos. Los trabajos se encolan en la misma transacción que
+# registra el documento (ver almacenar_documento), así que solo existen si la
+# operación se confirmó y el archivo ya está publicado. procesar_documentos.py
+# los toma por lotes con FOR UPDATE SKIP LOCKED, de modo que varios workers
+# pueden correr a la vez.
+#
+# Al tomar un trabajo se suma un intento y se corre disponible_desde al fin del
+# plazo TRABAJOS_VISIBILIDAD_SEGUNDOS: si el worker muere, otro lo retoma al
+# vencer el plazo. Los errores se reintentan con espera exponencial hasta
+# TRABAJOS_MAX_INTENTOS; ErrorPermanente lo deja fallido de inmediato.
+
+logger = logging.getLogger("app.trabajos")
+
+TAREAS_POR_EXTENSION = {
+    "pdf": ("checksum", "texto"),
+    "png": ("checksum", "miniatura"),
+    "jpg": ("checksum", "miniatura"),
+    "jpeg": ("checksum", "miniatura"),
+}
+TEXTO_MAX_CARACTERES = 100_000
+MINIATURAS_ROOT = UPLOAD_ROOT / "miniaturas"
+
+
+class ErrorPermanente(Exception):
+    """Error que no se corrige reintentando (archivo dañado o inexistente)."""
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def encolar_trabajos(db: Session, sha256: str, extension: str):
+    """
+    Encolar las tareas que corresponden a un documento según su extensión.
+    Un documento ya encolado no se repite. No hace commit.
+    """
+    tareas = TAREAS_POR_EXTENSION.get(extension, ("checksum",))
+    stmt = insert(TrabajoDocumento).values([
+        {
+            "tipo": tipo,
+            "sha256": sha256,
+            "extension": extension,
+            "estado": EstadoTrabajoEnum.PENDIENTE,
+            "intentos": 0,
+            "max_intentos": settings.TRABAJOS_MAX_INTENTOS,
+            "disponible_desde": _ahora(),
+        }
+        for tipo in tareas
+    ])
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["tipo", "sha256"]))
+
+
+def reclamar_trabajos(db: Session, cantidad: int):
+    """
+    Tomar hasta `cantidad` trabajos disponibles: pendientes, o en proceso con el
+    plazo vencido. Retorna filas con id, tipo, sha256, extension, intentos y
+    max_intentos. Hace commit.
+    """
+    ahora = _ahora()
+
+    # Vencidos en su último intento
+    db.execute(
+        update(TrabajoDocumento)
+        .where(
+            TrabajoDocumento.estado == EstadoTrabajoEnum.EN_PROCESO,
+            TrabajoDocumento.disponible_desde <= ahora,
+            TrabajoDocumento.intentos >= TrabajoDocumento.max_intentos
+        )
+        .values(estado=EstadoTrabajoEnum.FALLIDO, error="Se venció el plazo del último intento")
+    )
+
+    disponibles = (
+        select(TrabajoDocumento.id)
+        .where(
+            TrabajoDocumento.estado.in_([EstadoTrabajoEnum.PENDIENTE, EstadoTrabajoEnum.EN_PROCESO]),
+            TrabajoDocumento.disponible_desde <= ahora,
+            TrabajoDocumento.intentos < TrabajoDocumento.max_intentos
+        )
+        .order_by(TrabajoDocumento.id)
+        .limit(cantidad)
+        .with_for_update(skip_locked=True)
+    )
+    trabajos = db.execute(
+        update(TrabajoDocumento)
+        .where(TrabajoDocumento.id.in_(disponibles.scalar_subquery()))
+        .values(
+            estado=EstadoTrabajoEnum.EN_PROCESO,
+            intentos=TrabajoDocumento.intentos + 1,
+            disponible_desde=ahora + timedelta(seconds=settings.TRABAJOS_VISIBILIDAD_SEGUNDOS)
+        )
+        .returning(
+            TrabajoDocumento.id,
+            TrabajoDocumento.tipo,
+            TrabajoDocumento.sha256,
+            TrabajoDocumento.extension,
+            TrabajoDocumento.intentos,
+            TrabajoDocumento.max_intentos
+        )
+    ).all()
+    db.commit()
+    return sorted(trabajos, key=lambda trabajo: trabajo.id)
+
+
+def _del_intento(trabajo):
+    # Si el plazo venció y otro worker retomó el trabajo, este intento ya no lo modifica
+    return (
+        TrabajoDocumento.id == trabajo.id,
+        TrabajoDocumento.intentos == trabajo.intentos,
+        TrabajoDocumento.estado == EstadoTrabajoEnum.EN_PROCESO
+    )
+
+
+def liberar_trabajos(db: Session, trabajos):
+    """
+    Devolver a la cola trabajos tomados que no se alcanzaron a procesar, sin
+    contar el intento. Hace commit.
+    """
+    for trabajo in trabajos:
+        db.execute(
+            update(TrabajoDocumento)
+            .where(*_del_intento(trabajo))
+            .values(
+                estado=EstadoTrabajoEnum.PENDIENTE,
+                intentos=TrabajoDocumento.intentos - 1,
+                disponible_desde=_ahora()
+            )
+        )
+    db.commit()
+
+
+def ejecutar_trabajo(db: Session, trabajo):
+    """
+    Ejecutar un trabajo tomado y registrar su resultado o su error. Hace commit.
+    """
+    tarea = TAREAS.get(trabajo.tipo)
+    try:
+        if tarea is None:
+            raise ErrorPermanente(f"Tarea desconocida: {trabajo.tipo}")
+        resultado = tarea(db, trabajo)
+    except Exception as e:
+        db.rollback()
+        permanente = isinstance(e, ErrorPermanente)
+        if permanente:
+            logger.warning("Trabajo %s (%s %s) fallido: %s", trabajo.id, trabajo.tipo, trabajo.sha256, e)
+        else:
+            logger.exception("Error en el trabajo %s (%s %s)", trabajo.id, trabajo.tipo, trabajo.sha256)
+
+        if permanente or trabajo.intentos >= trabajo.max_intentos:
+            valores = {"estado": EstadoTrabajoEnum.FALLIDO}
+        else:
+            espera = settings.TRABAJOS_REINTENTO_SEGUNDOS * 2 ** (trabajo.intentos - 1)
+            valores = {
+                "estado": EstadoTrabajoEnum.PENDIENTE,
+                "disponible_desde": _ahora() + timedelta(seconds=espera)
+            }
+        db.execute(
+            update(TrabajoDocumento)
+            .where(*_del_intento(trabajo))
+            .values(error=str(e) or type(e).__name__, **valores)
+        )
+        db.commit()
+        return False
+
+    db.execute(
+        update(TrabajoDocumento)
+        .where(*_del_intento(trabajo))
+        .values(estado=EstadoTrabajoEnum.COMPLETADO, resultado=json.dumps(resultado), error=None)
+    )
+    db.commit()
+    return True
+
+
+def purgar_trabajos(db: Session) -> int:
+    """
+    Eliminar los trabajos completados hace más de TRABAJOS_RETENCION_DIAS. Hace commit.
+    """
+    limite = _ahora() - timedelta(days=settings.TRABAJOS_RETENCION_DIAS)
+    eliminados = db.execute(
+        delete(TrabajoDocumento).where(
+            TrabajoDocumento.estado == EstadoTrabajoEnum.COMPLETADO,
+            TrabajoDocumento.fecha_actualizacion < limite
+        )
+    ).rowcount
+    db.commit()
+    return eliminados
+
+
+def reintentar_fallidos(db: Session) -> int:
+    """
+    Volver a encolar los trabajos fallidos con sus intentos en cero. Hace commit.
+    """
+    reencolados = db.execute(
+        update(TrabajoDocumento)
+        .where(TrabajoDocumento.estado == EstadoTrabajoEnum.FALLIDO)
+        .values(estado=EstadoTrabajoEnum.PENDIENTE, intentos=0, disponible_desde=_ahora())
+    ).rowcount
+    db.commit()
+    return reencolados
+
+
+def encolar_existentes(db: Session) -> int:
+    """
+    Encolar las tareas de los documentos ya guardados (los trabajos existentes
+    no se repiten). Hace commit.
+    """
+    documentos = db.execute(select(Documento.sha256, Documento.extension)).all()
+    for sha256, extension in documentos:
+        encolar_trabajos(db, sha256, extension)
+    db.commit()
+    return len(documentos)
+
+
+# Tareas. Reciben la sesión y el trabajo y retornan un resultado JSON; los
+# cambios que hagan en la sesión se confirman junto con el trabajo.
+
+def _leer(trabajo) -> bytes:
+    archivo = get_storage().abrir(ruta_blob(trabajo.sha256, trabajo.extension))
+    try:
+        return archivo.read()
+    finally:
+        archivo.close()
+
+
+def _verificar_checksum(db: Session, trabajo) -> Dict[str, Any]:
+    ruta = ruta_blob(trabajo.sha256, trabajo.extension)
+    if not get_storage().existe(ruta):
+        raise ErrorPermanente(f"No existe el archivo {ruta}")
+    if calcular_sha256(ruta) != trabajo.sha256:
+        raise ErrorPermanente(f"El contenido de {ruta} no coincide con su hash")
+    return {"ok": True}
+
+
+def _extraer_texto(db: Session, trabajo) -> Dict[str, Any]:
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        return {"omitido": "pypdf no está instalado"}
+
+    contenido = _leer(trabajo)
+    try:
+        pdf = PdfReader(io.BytesIO(contenido))
+        if pdf.is_encrypted:
+            raise ErrorPermanente("El PDF está cifrado")
+        paginas = len(pdf.pages)
+        texto = "\n".join(pagina.extract_text() or "" for pagina in pdf.pages)
+    except PdfReadError as e:
+        raise ErrorPermanente(f"PDF dañado: {e}")
+
+    texto = texto.strip()[:TEXTO_MAX_CARACTERES]
+    db.execute(
+        update(Documento)
+        .where(Documento.sha256 == trabajo.sha256)
+        .values(paginas=paginas, texto=texto or None)
+    )
+    return {"paginas": paginas, "caracteres": len(texto)}
+
+
+def ruta_miniatura(sha256: str) -> str:
+    return str(MINIATURAS_ROOT / sha256[:2] / sha256[2:4] / f"{sha256}.jpg")
+
+
+def _generar_miniatura(db: Session, trabajo) -> Dict[str, Any]:
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return {"omitido": "Pillow no está instalado"}
+
+    contenido = _leer(trabajo)
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        imagen.thumbnail((settings.MINIATURA_PX, settings.MINIATURA_PX))
+        imagen = imagen.convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ErrorPermanente(f"Imagen dañada: {e}")
+
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    temporal = TMP_ROOT / uuid.uuid4().hex
+    try:
+        imagen.save(temporal, "JPEG", quality=80)
+        clave = ruta_miniatura(trabajo.sha256)
+        get_storage().publicar(temporal, clave)
+    finally:
+        temporal.unlink(missing_ok=True)
+
+    db.execute(update(Documento).where(Documento.sha256 == trabajo.sha256).values(miniatura=clave))
+    return {"miniatura": clave, "ancho": imagen.width, "alto": imagen.height}
+
+
+TAREAS = {
+    "checksum": _verificar_checksum,
+    "texto": _extraer_texto,
+    "miniatura": _generar_miniatura,
+}
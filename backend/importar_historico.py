@@ -0,0 +1,73 @@
+"""
+Importación de registros históricos desde CSV o XLSX.
+
+    python importar_historico.py recargas archivo.csv [--usuario-id N] [--lote 1000] [--errores errores.csv]
+    python importar_historico.py soats archivo.xlsx [--usuario-id N] [--lote 1000] [--errores errores.csv]
+
+Columnas de recargas: monto, referencia, observaciones, fecha_recarga
+Columnas de SOATs: placa, cedula, nombre_propietario, tipo_moto, observaciones,
+fecha_expedicion, valor_soat (opcional), comision (opcional)
+
+Las filas inválidas se omiten y se reportan; las válidas se confirman por lotes
+y cada lote ajusta la bolsa una sola vez. Importe las recargas antes que los SOATs.
+"""
+import argparse
+import asyncio
+import csv
+import sys
+from pathlib import Path
+from app.core.cache_respuestas import invalidar
+from app.core.database import SessionLocal, engine, Base
+from app.models.models import Usuario, RolEnum
+from app.services.importacion import TAMANO_LOTE, leer_filas, importar_recargas, importar_soats
+
+ETIQUETAS = {"recargas": "Recargas", "soats": "SOATs"}
+
+
+def mostrar_progreso(resultado):
+    print(f"  ... {resultado.importados} importados, {resultado.total} filas leídas, {len(resultado.errores)} con errores")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tipo", choices=["recargas", "soats"])
+    parser.add_argument("archivo", type=Path)
+    parser.add_argument("--usuario-id", type=int, help="Admin que queda como registrador (por defecto el primero)")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Filas por transacción")
+    parser.add_argument("--errores", type=Path, help="Guardar las filas con errores en este CSV")
+    args = parser.parse_args()
+    
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        usuario_id = args.usuario_id or db.query(Usuario.id).filter(
+            Usuario.rol == RolEnum.ADMIN
+        ).order_by(Usuario.id).limit(1).scalar()
+        if usuario_id is None:
+            print("❌ No hay un administrador para registrar la importación")
+            sys.exit(1)
+        
+        importar = importar_recargas if args.tipo == "recargas" else importar_soats
+        print(f"Importando {args.tipo} desde {args.archivo}")
+        resultado = importar(db, leer_filas(args.archivo), usuario_id, args.lote, mostrar_progreso)
+    finally:
+        db.close()
+    
+    # Con la caché compartida (redis) los workers ven los importados de inmediato
+    if resultado.importados:
+        asyncio.run(invalidar(args.tipo, "bolsa"))
+    
+    for fila, error in resultado.errores:
+        print(f"❌ Fila {fila}: {error}")
+    if args.errores and resultado.errores:
+        with open(args.errores, "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(["fila", "error"])
+            escritor.writerows(resultado.errores)
+    
+    print(f"✅ {ETIQUETAS[args.tipo]} importados: {resultado.importados} de {resultado.total} filas leídas")
+    if resultado.errores:
+        print(f"Filas con errores: {len(resultado.errores)}")
+    if resultado.detenido:
+        print(f"❌ Importación detenida: {resultado.detenido}")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+"""
+Script de mantenimiento del almacenamiento de documentos por contenido.
+
+    python mantener_documentos.py migrar    # pasar archivos antiguos a uploads/blobs
+    python mantener_documentos.py verificar # comprobar el hash de cada documento
+    python mantener_documentos.py purgar    # eliminar documentos sin referencias
+"""
+import asyncio
+import shutil
+import sys
+from pathlib import Path
+from sqlalchemy import select
+from app.core.database import SessionLocal, AsyncSessionLocal, engine, Base
+from app.core.storage import DocumentoRecibido, TMP_ROOT, es_blob, calcular_sha256
+from app.models.models import SoatExpedido, Recarga
+from app.services.documentos import almacenar_documento, verificar_documento, purgar_documentos
+
+COLUMNAS = [
+    (SoatExpedido, "documento_factura"),
+    (SoatExpedido, "documento_soat"),
+    (SoatExpedido, "documento_poliza"),
+    (Recarga, "documento_comprobante"),
+]
+
+
+async def migrar():
+    migrados = 0
+    async with AsyncSessionLocal() as db:
+        for modelo, columna in COLUMNAS:
+            registros = (await db.scalars(
+                select(modelo).where(getattr(modelo, columna).isnot(None))
+            )).all()
+            for registro in registros:
+                ruta = Path(getattr(registro, columna))
+                if es_blob(ruta) or not ruta.exists():
+                    continue
+                
+                # Copiar a un temporal para que el original siga intacto hasta el commit
+                TMP_ROOT.mkdir(parents=True, exist_ok=True)
+                temporal = TMP_ROOT / f"migracion-{ruta.name}"
+                shutil.copyfile(ruta, temporal)
+                recibido = DocumentoRecibido(
+                    temporal=temporal,
+                    sha256=calcular_sha256(temporal),
+                    tamano=temporal.stat().st_size
+                )
+                setattr(registro, columna, await almacenar_documento(db, recibido, ruta.suffix.lstrip(".")))
+                await db.commit()
+                ruta.unlink()
+                migrados += 1
+    print(f"✅ Documentos migrados: {migrados}")
+
+
+def verificar(db):
+    errores = 0
+    for modelo, columna in COLUMNAS:
+        for (ruta,) in db.query(getattr(modelo, columna)).filter(getattr(modelo, columna).isnot(None)):
+            if not verificar_documento(ruta):
+                errores += 1
+                print(f"❌ {modelo.__tablename__}.{columna}: {ruta}")
+    print(f"Documentos con errores: {errores}")
+
+
+def purgar(db):
+    eliminados = purgar_documentos(db)
+    for ruta in eliminados:
+        print(f"  - {ruta}")
+    print(f"✅ Documentos eliminados: {len(eliminados)}")
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando not in ("migrar", "verificar", "purgar"):
+        print(__doc__)
+        sys.exit(1)
+    
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if comando == "migrar":
+            asyncio.run(migrar())
+        elif comando == "verificar":
+            verificar(db)
+        else:
+            purgar(db)
+    finally:
+        db.close()
@@ -0,0 +1,12 @@
+-- Migración: Recompresión de documentos al recibirlos
+-- Fecha: 2026-10-17
+-- Motivo: Registrar el tamaño original de cada documento recomprimido y la clave del original conservado
+
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS tamano_original BIGINT;
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS original VARCHAR(255);
+
+-- Verificar cambios
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'documentos'
+ORDER BY ordinal_position;
@@ -0,0 +1,35 @@
+-- Migración: Claves de búsqueda normalizadas para placa y cédula, y búsqueda por nombre
+-- Fecha: 2026-10-17
+-- Motivo: Búsqueda exacta y por prefijo en GET /api/soats/buscar sin importar espacios ni guiones,
+--         y búsqueda aproximada por nombre del propietario con pg_trgm
+-- Agregar las columnas generadas reescribe la tabla: ejecutar en una ventana de mantenimiento.
+-- pg_trgm viene en postgresql-contrib; sin él la búsqueda por nombre funciona solo por contenido.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE soats_expedidos
+ADD COLUMN IF NOT EXISTS placa_busqueda VARCHAR(20) COLLATE "C"
+GENERATED ALWAYS AS (upper(regexp_replace(placa, '[^0-9A-Za-z]', '', 'g'))) STORED;
+
+ALTER TABLE soats_expedidos
+ADD COLUMN IF NOT EXISTS cedula_busqueda VARCHAR(20) COLLATE "C"
+GENERATED ALWAYS AS (upper(regexp_replace(cedula, '[^0-9A-Za-z]', '', 'g'))) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_placa_busqueda_fecha_id
+ON soats_expedidos (placa_busqueda, fecha_expedicion DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_cedula_busqueda_fecha_id
+ON soats_expedidos (cedula_busqueda, fecha_expedicion DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_nombre_trgm
+ON soats_expedidos USING gin (nombre_propietario gin_trgm_ops);
+
+-- Los filtros por placa y cédula ahora usan las claves normalizadas
+DROP INDEX IF EXISTS ix_soats_expedidos_placa_fecha_id;
+DROP INDEX IF EXISTS ix_soats_expedidos_cedula_fecha_id;
+DROP INDEX IF EXISTS ix_soats_expedidos_placa;
+
+-- Verificar cambios
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'soats_expedidos';
@@ -0,0 +1,20 @@
+-- Migración: Índices compuestos para la paginación por cursor de soats_expedidos
+-- Fecha: 2026-10-17
+-- Motivo: Listado paginado por (fecha_expedicion, id) con filtros por placa, cédula y tipo de moto
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_fecha_id
+ON soats_expedidos (fecha_expedicion, id);
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_placa_fecha_id
+ON soats_expedidos (placa, fecha_expedicion, id);
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_cedula_fecha_id
+ON soats_expedidos (cedula, fecha_expedicion, id);
+
+CREATE INDEX IF NOT EXISTS ix_soats_expedidos_tipo_fecha_id
+ON soats_expedidos (tipo_moto, fecha_expedicion, id);
+
+-- Verificar cambios
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'soats_expedidos';
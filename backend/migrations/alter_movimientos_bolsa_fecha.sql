@@ -0,0 +1,12 @@
+-- Migración: Fecha real de los movimientos y cortes de la bolsa
+-- Fecha: 2026-10-17
+-- Motivo: now() es la hora de inicio de la transacción y no sigue el orden en que se
+-- bloquea la bolsa; clock_timestamp() es la hora del INSERT, ordenada igual que el id
+
+ALTER TABLE movimientos_bolsa ALTER COLUMN fecha SET DEFAULT clock_timestamp();
+ALTER TABLE cortes_bolsa ALTER COLUMN fecha_corte SET DEFAULT clock_timestamp();
+
+-- Verificar cambios
+SELECT table_name, column_name, column_default
+FROM information_schema.columns
+WHERE table_name IN ('movimientos_bolsa', 'cortes_bolsa') AND column_name IN ('fecha', 'fecha_corte');
@@ -0,0 +1,45 @@
+-- Migración: Libro de movimientos de la bolsa
+-- Fecha: 2026-10-17
+-- Motivo: Registrar cada cambio de saldo con su saldo resultante y consultar saldos históricos
+-- Las tablas movimientos_bolsa y cortes_bolsa las crea la aplicación al iniciar (create_all).
+-- Ejecutar este script una vez, después de desplegar, para abrir el libro con el saldo actual.
+-- En una base nueva la aplicación abre el libro sola con el primer movimiento.
+
+BEGIN;
+
+-- Bloquear la bolsa: ningún movimiento se registra mientras se abre el libro
+SELECT id FROM bolsa ORDER BY id LIMIT 1 FOR UPDATE;
+
+-- Movimiento de apertura. Si la aplicación ya registró movimientos antes de
+-- ejecutar el script, la apertura es el saldo previo a todos ellos (saldo
+-- actual menos su suma) y se fecha con el primero, para que los saldos
+-- históricos anteriores al primer corte partan de él y no de 0.
+INSERT INTO movimientos_bolsa (tipo, monto, saldo_resultante, fecha)
+SELECT 'APERTURA', b.saldo_actual - m.suma, b.saldo_actual - m.suma, m.primera_fecha
+FROM (SELECT saldo_actual FROM bolsa ORDER BY id LIMIT 1) b,
+     (SELECT coalesce(sum(monto), 0) AS suma, coalesce(min(fecha), now()) AS primera_fecha
+      FROM movimientos_bolsa) m
+WHERE NOT EXISTS (SELECT 1 FROM movimientos_bolsa WHERE tipo = 'APERTURA');
+
+-- Corte inicial con el saldo actual, sobre el último movimiento registrado
+INSERT INTO cortes_bolsa (movimiento_id, saldo, fecha_corte)
+SELECT (SELECT max(id) FROM movimientos_bolsa), b.saldo_actual, clock_timestamp()
+FROM (SELECT saldo_actual FROM bolsa ORDER BY id LIMIT 1) b
+WHERE NOT EXISTS (SELECT 1 FROM cortes_bolsa);
+
+COMMIT;
+
+-- El libro solo admite inserciones
+CREATE OR REPLACE FUNCTION movimientos_bolsa_solo_insercion() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'movimientos_bolsa no admite UPDATE ni DELETE';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS movimientos_bolsa_solo_insercion ON movimientos_bolsa;
+CREATE TRIGGER movimientos_bolsa_solo_insercion
+BEFORE UPDATE OR DELETE ON movimientos_bolsa
+FOR EACH ROW EXECUTE FUNCTION movimientos_bolsa_solo_insercion();
+
+-- Verificar cambios
+SELECT id, tipo, monto, saldo_resultante, fecha FROM movimientos_bolsa ORDER BY id LIMIT 5;
@@ -0,0 +1,34 @@
+-- Migración: Cargar resumen_diario con el histórico
+-- Fecha: 2026-10-17
+-- Motivo: El dashboard lee los totales de resumen_diario en lugar de recorrer soats_expedidos y recargas
+-- La tabla resumen_diario la crea la aplicación al iniciar (create_all).
+-- Ejecutar este script una vez, después de desplegar y antes de registrar nuevas operaciones.
+
+INSERT INTO resumen_diario (fecha, soats_expedidos, total_valor_soat, total_comisiones, recargas, total_recargas)
+SELECT fecha,
+       SUM(soats_expedidos), SUM(total_valor_soat), SUM(total_comisiones),
+       SUM(recargas), SUM(total_recargas)
+FROM (
+    SELECT date(fecha_expedicion) AS fecha,
+           COUNT(*) AS soats_expedidos,
+           SUM(valor_soat) AS total_valor_soat,
+           SUM(comision) AS total_comisiones,
+           0 AS recargas,
+           0 AS total_recargas
+    FROM soats_expedidos
+    GROUP BY date(fecha_expedicion)
+    UNION ALL
+    SELECT date(fecha_recarga), 0, 0, 0, COUNT(*), SUM(monto)
+    FROM recargas
+    GROUP BY date(fecha_recarga)
+) historico
+GROUP BY fecha
+ON CONFLICT (fecha) DO UPDATE SET
+    soats_expedidos = EXCLUDED.soats_expedidos,
+    total_valor_soat = EXCLUDED.total_valor_soat,
+    total_comisiones = EXCLUDED.total_comisiones,
+    recargas = EXCLUDED.recargas,
+    total_recargas = EXCLUDED.total_recargas;
+
+-- Verificar cambios
+SELECT * FROM resumen_diario ORDER BY fecha DESC LIMIT 10;
@@ -0,0 +1,17 @@
+-- Migración: Cola de trabajos sobre documentos
+-- Fecha: 2026-10-17
+-- Motivo: Procesar los documentos (checksum, texto de PDFs, miniaturas) fuera de la solicitud
+-- La tabla trabajos_documentos la crea la aplicación al iniciar (create_all).
+-- Después de ejecutar este script, encolar los documentos existentes con:
+--     python procesar_documentos.py encolar
+
+-- Resultados del procesamiento
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS paginas INTEGER;
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS texto TEXT;
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS miniatura VARCHAR(255);
+
+-- Verificar cambios
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'documentos'
+ORDER BY ordinal_position;
@@ -0,0 +1,76 @@
+"""
+Worker de la cola de trabajos sobre documentos (checksum, texto de los PDFs y
+miniaturas de las imágenes). Se pueden correr varios a la vez.
+
+    python procesar_documentos.py             # procesar la cola continuamente
+    python procesar_documentos.py una-vez     # procesar lo disponible y salir
+    python procesar_documentos.py encolar     # encolar los documentos ya guardados
+    python procesar_documentos.py reintentar  # volver a encolar los trabajos fallidos
+
+Con SIGTERM o Ctrl+C termina el trabajo en curso y devuelve a la cola los
+que había tomado.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from app.core.database import SessionLocal, engine, Base
+from app.services.trabajos import (
+    reclamar_trabajos, ejecutar_trabajo, liberar_trabajos, purgar_trabajos,
+    reintentar_fallidos, encolar_existentes
+)
+
+PURGAR_CADA_SEGUNDOS = 3600
+
+detener = threading.Event()
+
+
+def procesar(db, lote: int, intervalo: float, una_vez: bool):
+    procesados = fallidos = 0
+    ultima_purga = 0.0
+    while not detener.is_set():
+        if time.monotonic() - ultima_purga > PURGAR_CADA_SEGUNDOS:
+            purgar_trabajos(db)
+            ultima_purga = time.monotonic()
+
+        trabajos = reclamar_trabajos(db, lote)
+        if not trabajos:
+            if una_vez:
+                break
+            detener.wait(intervalo)
+            continue
+
+        for i, trabajo in enumerate(trabajos):
+            if detener.is_set():
+                liberar_trabajos(db, trabajos[i:])
+                break
+            if ejecutar_trabajo(db, trabajo):
+                procesados += 1
+            else:
+                fallidos += 1
+    print(f"✅ Trabajos procesados: {procesados}, con errores: {fallidos}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("comando", nargs="?", default="procesar", choices=["procesar", "una-vez", "encolar", "reintentar"])
+    parser.add_argument("--lote", type=int, default=10, help="Trabajos que se toman a la vez")
+    parser.add_argument("--intervalo", type=float, default=2, help="Segundos de espera con la cola vacía")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.comando == "encolar":
+            print(f"✅ Documentos encolados: {encolar_existentes(db)}")
+        elif args.comando == "reintentar":
+            print(f"✅ Trabajos reencolados: {reintentar_fallidos(db)}")
+        else:
+            procesar(db, args.lote, args.intervalo, args.comando == "una-vez")
+    finally:
+        db.close()
@@ -0,0 +1,239 @@
+"""
+Prueba de carga de la bolsa: lanza muchas expediciones (POST /api/soats/) y
+recargas (POST /api/recargas/) concurrentes contra la API, sobre PostgreSQL,
+y comprueba que el saldo final es exacto, que nunca fue negativo y que el
+libro de movimientos cuadra con él.
+
+    python prueba_carga_bolsa.py --confirmar [--operaciones 2000] [--concurrencia 32]
+
+Las solicitudes pasan por la app completa (autenticación, validación de los
+PDFs, transacción y caché) con un cliente httpx en el mismo proceso. Usa la base
+de DATABASE_URL ya inicializada (init_db.py) y el administrador por defecto.
+Modifica la bolsa, crea SOATs y recargas y publica los PDFs en uploads/: úsela
+solo sobre una base de datos de pruebas. Las expediciones sin saldo suficiente
+se rechazan con 400 y se cuentan aparte.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import httpx
+from sqlalchemy import func
+from app.core.config import settings
+from app.core.database import SessionLocal, async_engine
+from app.core.validacion import cerrar_pool
+from app.main import app
+from app.models.models import Bolsa, MovimientoBolsa, TipoMotoCCEnum
+from app.services.tarifas import tarifa_soat
+
+TIPO_MOTO = TipoMotoCCEnum.HASTA_99CC
+
+
+@dataclass
+class Resultado:
+    operaciones: int
+    duracion: float
+    aplicadas: int
+    rechazadas: int
+    saldo_inicial: int
+    saldo_final: int
+    errores: List[str] = field(default_factory=list)
+
+
+def _pdf() -> bytes:
+    from pypdf import PdfWriter
+
+    escritor = PdfWriter()
+    escritor.add_blank_page(612, 792)
+    contenido = io.BytesIO()
+    escritor.write(contenido)
+    return contenido.getvalue()
+
+
+def _estado() -> Tuple[int, int]:
+    db = SessionLocal()
+    try:
+        saldo = db.query(Bolsa.saldo_actual).order_by(Bolsa.id).limit(1).scalar() or 0
+        ultimo_id = db.query(func.coalesce(func.max(MovimientoBolsa.id), 0)).scalar()
+        return saldo, ultimo_id
+    finally:
+        db.close()
+
+
+async def _expedir(cliente: httpx.AsyncClient, placa: str, pdf: bytes) -> Optional[int]:
+    """
+    Expedir un SOAT. Retorna la variación del saldo, 0 si se rechazó por saldo
+    insuficiente o None si la respuesta no es ninguna de las esperadas.
+    """
+    respuesta = await cliente.post("/api/soats/", data={"placa": placa, "tipo_moto": TIPO_MOTO.value}, files={
+        "documento_factura": ("factura.pdf", pdf, "application/pdf"),
+        "documento_soat": ("soat.pdf", pdf, "application/pdf"),
+    })
+    if respuesta.status_code == 200:
+        return -respuesta.json()["total"]
+    if respuesta.status_code == 400 and respuesta.json()["detail"].startswith("Saldo insuficiente"):
+        return 0
+    return None
+
+
+async def _recargar(cliente: httpx.AsyncClient, monto: int) -> Optional[int]:
+    respuesta = await cliente.post("/api/recargas/", data={"monto": monto})
+    if respuesta.status_code == 200:
+        return respuesta.json()["monto"]
+    return None
+
+
+async def ejecutar_prueba(
+    operaciones: int = 2000,
+    concurrencia: int = 32,
+    email: str = "admin@soat.com",
+    password: str = "admin123",
+    semilla: int = 0
+) -> Resultado:
+    """
+    Lanzar las operaciones contra la app y verificar la bolsa al terminar.
+    Los problemas encontrados quedan en Resultado.errores.
+    """
+    transporte = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba", timeout=120) as cliente:
+            respuesta = await cliente.post("/api/auth/login", json={"email": email, "password": password})
+            respuesta.raise_for_status()
+            cliente.headers["Authorization"] = f"Bearer {respuesta.json()['access_token']}"
+
+            # La bolsa debe existir antes de lanzar las operaciones
+            total_soat = tarifa_soat(TIPO_MOTO) + settings.COMISION_FIJA
+            if await _recargar(cliente, total_soat) is None:
+                raise RuntimeError("No se pudo hacer la recarga inicial")
+            saldo_inicial, id_inicial = _estado()
+
+            # Las placas son nuevas en cada ejecución para no chocar con SOATs vigentes
+            azar = random.Random(semilla)
+            prefijo = uuid.uuid4().hex[:4].upper()
+            pdf = _pdf()
+            limite = asyncio.Semaphore(concurrencia)
+            saldos_observados = []
+            terminado = asyncio.Event()
+
+            def operacion(indice: int):
+                # Tres expediciones por cada recarga: una parte se queda sin saldo
+                if azar.random() < 3 / 4:
+                    return _expedir(cliente, f"{prefijo}{indice:05d}", pdf)
+                return _recargar(cliente, total_soat * azar.randint(1, 3))
+
+            async def con_limite(corrutina):
+                async with limite:
+                    return await corrutina
+
+            async def observar_saldo():
+                # El saldo que ve un cliente durante la carga nunca es negativo
+                while not terminado.is_set():
+                    respuesta = await cliente.get("/api/bolsa/saldo")
+                    saldos_observados.append(respuesta.json()["saldo_actual"])
+                    await asyncio.sleep(0.01)
+
+            inicio = time.monotonic()
+            observador = asyncio.create_task(observar_saldo())
+            # Primero una ráfaga de expediciones a la vez, sin recargas: el saldo
+            # alcanza exactamente para saldo_inicial // total_soat de ellas
+            rafaga = min(concurrencia, operaciones)
+            alcanzan = min(rafaga, saldo_inicial // total_soat)
+            variaciones = await asyncio.gather(
+                *(_expedir(cliente, f"{prefijo}{indice:05d}", pdf) for indice in range(rafaga))
+            )
+            aplicadas_rafaga = sum(1 for variacion in variaciones if variacion)
+            # Luego expediciones y recargas mezcladas
+            variaciones += await asyncio.gather(
+                *(con_limite(operacion(indice)) for indice in range(rafaga, operaciones))
+            )
+            duracion = time.monotonic() - inicio
+            terminado.set()
+            await observador
+    finally:
+        await cerrar_pool()
+        await async_engine.dispose()
+
+    db = SessionLocal()
+    try:
+        saldo_final = db.query(Bolsa.saldo_actual).order_by(Bolsa.id).limit(1).scalar()
+        movimientos = db.query(MovimientoBolsa.monto, MovimientoBolsa.saldo_resultante).filter(
+            MovimientoBolsa.id > id_inicial
+        ).order_by(MovimientoBolsa.id).all()
+        suma_libro = db.query(func.coalesce(func.sum(MovimientoBolsa.monto), 0)).scalar()
+    finally:
+        db.close()
+
+    inesperadas = sum(1 for variacion in variaciones if variacion is None)
+    aplicadas = sum(1 for variacion in variaciones if variacion)
+    resultado = Resultado(
+        operaciones=operaciones,
+        duracion=duracion,
+        aplicadas=aplicadas,
+        rechazadas=len(variaciones) - aplicadas - inesperadas,
+        saldo_inicial=saldo_inicial,
+        saldo_final=saldo_final,
+    )
+    errores = resultado.errores
+
+    if aplicadas_rafaga != alcanzan:
+        errores.append(f"Se aplicaron {aplicadas_rafaga} expediciones de la ráfaga y el saldo alcanzaba para {alcanzan}")
+    if inesperadas:
+        errores.append(f"{inesperadas} solicitudes respondieron con un error distinto de saldo insuficiente")
+    creditos = sum(variacion for variacion in variaciones if variacion and variacion > 0)
+    debitos = -sum(variacion for variacion in variaciones if variacion and variacion < 0)
+    esperado = saldo_inicial + creditos - debitos
+    if saldo_final != esperado:
+        errores.append(f"El saldo final es ${saldo_final:,} y se esperaba ${esperado:,}")
+    if any(saldo < 0 for saldo in saldos_observados):
+        errores.append(f"GET /api/bolsa/saldo devolvió un saldo negativo: ${min(saldos_observados):,}")
+    if len(movimientos) != aplicadas:
+        errores.append(f"Hay {len(movimientos)} movimientos nuevos para {aplicadas} operaciones aplicadas")
+    if saldo_inicial + sum(monto for monto, _ in movimientos) != saldo_final:
+        errores.append("La suma de los movimientos nuevos no coincide con la variación del saldo")
+    if suma_libro != saldo_final:
+        errores.append(f"La suma de movimientos_bolsa es ${suma_libro:,} y el saldo ${saldo_final:,}")
+
+    # En orden de id, cada saldo resultante es el anterior más el monto y nunca es negativo
+    saldo = saldo_inicial
+    for monto, saldo_resultante in movimientos:
+        saldo += monto
+        if saldo_resultante != saldo or saldo_resultante < 0:
+            errores.append(f"Saldo resultante ${saldo_resultante:,} fuera de secuencia (se esperaba ${saldo:,})")
+            break
+
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operaciones", type=int, default=2000)
+    parser.add_argument("--concurrencia", type=int, default=32, help="Solicitudes en curso a la vez")
+    parser.add_argument("--email", default="admin@soat.com")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--confirmar", action="store_true", help="Confirmar que la base de datos es de pruebas")
+    args = parser.parse_args()
+
+    if not args.confirmar:
+        sys.exit("❌ La prueba modifica la bolsa: ejecútela sobre una base de pruebas con --confirmar")
+
+    # Las esperas por el bloqueo de la bolsa son lo que se mide: no se reportan como consultas lentas
+    logging.getLogger("app.db").setLevel(logging.ERROR)
+
+    resultado = asyncio.run(ejecutar_prueba(args.operaciones, args.concurrencia, args.email, args.password))
+
+    print(f"Operaciones: {resultado.operaciones} en {resultado.duracion:.1f} s "
+          f"({resultado.operaciones / resultado.duracion:.0f}/s) con {args.concurrencia} concurrentes, "
+          f"expediciones rechazadas por saldo: {resultado.rechazadas}")
+    print(f"Saldo inicial: ${resultado.saldo_inicial:,}, final: ${resultado.saldo_final:,}")
+
+    if resultado.errores:
+        for error in resultado.errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ El saldo final y el libro de movimientos son exactos")
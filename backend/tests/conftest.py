@@ -0,0 +1,48 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# Las pruebas se ejecutan desde backend/ (python -m pytest) con el mismo paquete app
+# que la API. La configuración exige DATABASE_URL y SECRET_KEY aunque la prueba no
+# use la base; las que sí la necesitan se saltan si no hay TEST_DATABASE_URL. La base
+# de pruebas reemplaza siempre a DATABASE_URL: nunca se toca la configurada en .env.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "pruebas")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", "postgresql://localhost/soat_pruebas")
+os.environ.pop("DATABASE_READ_URL", None)
+
+
+@pytest.fixture
+def base_de_datos():
+    """Tablas recién creadas en la base de TEST_DATABASE_URL."""
+    if not os.environ.get("TEST_DATABASE_URL"):
+        pytest.skip("Requiere TEST_DATABASE_URL (PostgreSQL de pruebas)")
+    from app.core.database import Base, engine
+    import app.models.models  # noqa: F401 (registra las tablas)
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(base_de_datos):
+    from app.core.database import SessionLocal
+
+    sesion = SessionLocal()
+    yield sesion
+    sesion.close()
+
+
+@pytest.fixture
+def almacen_local(tmp_path, monkeypatch):
+    """LocalStorage con uploads/ dentro de tmp_path."""
+    from app.core import storage
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage.settings, "STORAGE_BACKEND", "local")
+    storage.get_storage.cache_clear()
+    yield storage.get_storage()
+    storage.get_storage.cache_clear()
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from sqlalchemy import func
+from app.models.models import Bolsa, CorteBolsa, MovimientoBolsa, TipoMovimientoEnum
+from app.services.bolsa import acreditar_bolsa, debitar_bolsa, saldo_a_fecha
+
+MIGRACION = Path(__file__).resolve().parent.parent / "migrations" / "create_movimientos_bolsa.sql"
+
+
+def _ejecutar_migracion(engine):
+    conexion = engine.raw_connection()
+    try:
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute(MIGRACION.read_text())
+    finally:
+        conexion.close()
+
+
+def _suma_libro(db) -> int:
+    return db.query(func.coalesce(func.sum(MovimientoBolsa.monto), 0)).scalar()
+
+
+def _saldo(db) -> int:
+    return db.query(Bolsa.saldo_actual).scalar()
+
+
+def test_primer_movimiento_abre_el_libro_con_el_saldo_previo(db):
+    # Bolsa con saldo anterior al libro de movimientos
+    db.add(Bolsa(saldo_actual=1_000_000))
+    db.commit()
+
+    debitar_bolsa(db, 300_000, TipoMovimientoEnum.EXPEDICION)
+    db.commit()
+
+    movimientos = db.query(MovimientoBolsa.tipo, MovimientoBolsa.monto, MovimientoBolsa.saldo_resultante).order_by(
+        MovimientoBolsa.id
+    ).all()
+    assert movimientos == [
+        (TipoMovimientoEnum.APERTURA, 1_000_000, 1_000_000),
+        (TipoMovimientoEnum.EXPEDICION, -300_000, 700_000),
+    ]
+    assert _suma_libro(db) == _saldo(db) == 700_000
+    assert db.query(CorteBolsa.saldo).all() == [(1_000_000,)]
+    apertura = db.query(MovimientoBolsa.fecha).filter(MovimientoBolsa.tipo == TipoMovimientoEnum.APERTURA).scalar()
+    assert saldo_a_fecha(db, apertura) == 1_000_000
+    assert saldo_a_fecha(db, datetime.now(timezone.utc)) == 700_000
+
+    # Los siguientes movimientos no vuelven a abrirlo
+    acreditar_bolsa(db, 50_000, TipoMovimientoEnum.RECARGA)
+    db.commit()
+    assert db.query(MovimientoBolsa).filter(MovimientoBolsa.tipo == TipoMovimientoEnum.APERTURA).count() == 1
+    assert _suma_libro(db) == _saldo(db) == 750_000
+
+
+def test_migracion_despues_del_primer_movimiento(db, base_de_datos):
+    # Movimientos registrados por una versión que no abría el libro, antes de la migración
+    db.add(Bolsa(saldo_actual=1_200_000))
+    db.commit()
+    primero = datetime.now(timezone.utc) - timedelta(days=2)
+    segundo = primero + timedelta(days=1)
+    db.add_all([
+        MovimientoBolsa(tipo=TipoMovimientoEnum.RECARGA, monto=200_000, saldo_resultante=1_200_000, fecha=primero),
+        MovimientoBolsa(tipo=TipoMovimientoEnum.EXPEDICION, monto=-100_000, saldo_resultante=1_100_000, fecha=segundo),
+    ])
+    db.query(Bolsa).update({Bolsa.saldo_actual: 1_100_000})
+    db.commit()
+
+    _ejecutar_migracion(base_de_datos)
+    _ejecutar_migracion(base_de_datos)  # Ejecutarla de nuevo no cambia nada
+
+    apertura = db.query(MovimientoBolsa).filter(MovimientoBolsa.tipo == TipoMovimientoEnum.APERTURA).one()
+    assert apertura.monto == apertura.saldo_resultante == 1_000_000
+    assert _suma_libro(db) == _saldo(db) == 1_100_000
+    assert db.query(CorteBolsa.saldo).all() == [(1_100_000,)]
+
+    # Los saldos históricos parten de la apertura, no de 0
+    assert saldo_a_fecha(db, primero - timedelta(hours=1)) == 0
+    assert saldo_a_fecha(db, primero) == 1_200_000
+    assert saldo_a_fecha(db, segundo - timedelta(hours=1)) == 1_200_000
+    assert saldo_a_fecha(db, segundo) == 1_100_000
+
+    debitar_bolsa(db, 300_000, TipoMovimientoEnum.EXPEDICION)
+    db.commit()
+    assert _suma_libro(db) == _saldo(db) == 800_000
+    assert saldo_a_fecha(db, datetime.now(timezone.utc)) == 800_000
+    assert saldo_a_fecha(db, segundo) == 1_100_000
@@ -0,0 +1,21 @@
+import asyncio
+from app.core.security import get_password_hash
+from app.models.models import RolEnum, Usuario
+
+
+def test_expediciones_y_recargas_concurrentes_por_la_api(db, almacen_local):
+    # app.main crea las tablas al importarse: solo se importa con la base de pruebas
+    from prueba_carga_bolsa import ejecutar_prueba
+
+    db.add(Usuario(
+        email="admin@soat.com", nombre_completo="Administrador",
+        hashed_password=get_password_hash("admin123"), rol=RolEnum.ADMIN, activo=1
+    ))
+    db.commit()
+
+    resultado = asyncio.run(ejecutar_prueba(operaciones=150, concurrencia=16))
+
+    assert resultado.errores == []
+    assert resultado.aplicadas > 0
+    assert resultado.rechazadas > 0
+    assert resultado.saldo_final >= 0
@@ -0,0 +1,61 @@
+import os
+import pytest
+from app.core import compresion
+from app.core.compresion import comprimir
+
+Image = pytest.importorskip("PIL.Image")
+pypdf = pytest.importorskip("pypdf")
+
+
+@pytest.fixture
+def pdf_escaneado(tmp_path):
+    """PDF de una página con una imagen escaneada grande, como los que suben los asesores."""
+    imagen = Image.linear_gradient("L").resize((2400, 3200)).convert("RGB")
+    ruta = tmp_path / "escaneo.pdf"
+    imagen.save(ruta, "PDF", quality=95)
+    return ruta
+
+
+@pytest.fixture(autouse=True)
+def tmp_en_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(compresion, "TMP_ROOT", tmp_path / "tmp")
+
+
+def test_comprimir_pdf_reduce_el_tamano(pdf_escaneado):
+    resultado = comprimir(str(pdf_escaneado), "pdf", max_px=800, calidad=70)
+
+    assert resultado is not None
+    destino, tipo, sha256, tamano = resultado
+    assert tipo == "pdf"
+    assert os.path.exists(destino)
+    assert tamano == os.path.getsize(destino) < os.path.getsize(pdf_escaneado)
+    assert len(sha256) == 64
+
+    lector = pypdf.PdfReader(destino)
+    assert len(lector.pages) == 1
+    assert max(lector.pages[0].images[0].image.size) <= 800
+
+
+def test_comprimir_pdf_es_determinista(pdf_escaneado):
+    primero = comprimir(str(pdf_escaneado), "pdf", max_px=800, calidad=70)
+    segundo = comprimir(str(pdf_escaneado), "pdf", max_px=800, calidad=70)
+
+    assert primero[2] == segundo[2]
+
+
+def test_comprimir_archivo_danado_retorna_none(tmp_path):
+    ruta = tmp_path / "danado.pdf"
+    ruta.write_bytes(b"%PDF-1.4\nesto no es un pdf")
+
+    assert comprimir(str(ruta), "pdf", max_px=800, calidad=70) is None
+    assert not any((tmp_path / "tmp").iterdir())
+
+
+def test_comprimir_no_oculta_errores_de_programacion(pdf_escaneado, monkeypatch):
+    def roto(*args):
+        raise AttributeError("metodo inexistente")
+
+    monkeypatch.setattr(compresion, "_comprimir_pdf", roto)
+
+    with pytest.raises(AttributeError):
+        comprimir(str(pdf_escaneado), "pdf", max_px=800, calidad=70)
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import date
+import pytest
+from fastapi.testclient import TestClient
+from app.api import dashboard
+from app.core import cache_respuestas
+from app.core.database import async_engine
+from app.core.security import get_password_hash
+from app.models.models import Bolsa, ResumenDiario, RolEnum, Usuario
+
+AYER = date(2026, 10, 16)
+HOY = date(2026, 10, 17)
+
+
+@pytest.fixture
+def cliente(db, monkeypatch):
+    db.add_all([
+        Usuario(
+            email="admin@soat.com", nombre_completo="Administrador",
+            hashed_password=get_password_hash("admin123"), rol=RolEnum.ADMIN, activo=1
+        ),
+        Bolsa(saldo_actual=0),
+        ResumenDiario(fecha=AYER, soats_expedidos=3, total_valor_soat=0, total_comisiones=0,
+                      recargas=0, total_recargas=0),
+    ])
+    db.commit()
+    monkeypatch.setattr(cache_respuestas.settings, "RESPUESTAS_CACHE_BACKEND", "memoria")
+    cache_respuestas.get_cache.cache_clear()
+    # app.main crea las tablas al importarse: solo se importa con la base de pruebas
+    from app.main import app
+
+    with TestClient(app) as cliente:
+        respuesta = cliente.post("/api/auth/login", json={"email": "admin@soat.com", "password": "admin123"})
+        cliente.headers["Authorization"] = f"Bearer {respuesta.json()['access_token']}"
+        yield cliente
+    cache_respuestas.get_cache.cache_clear()
+    asyncio.run(async_engine.dispose())
+
+
+def test_soats_hoy_cambia_con_el_dia_aunque_este_en_cache(cliente, monkeypatch):
+    monkeypatch.setattr(dashboard, "dia_resumen", lambda fecha: AYER)
+    assert cliente.get("/api/dashboard/stats").json()["soats_hoy"] == 3
+    assert cliente.get("/api/dashboard/stats").json()["soats_hoy"] == 3
+
+    # Pasada la medianoche no se sirve la respuesta guardada del día anterior
+    monkeypatch.setattr(dashboard, "dia_resumen", lambda fecha: HOY)
+    estadisticas = cliente.get("/api/dashboard/stats").json()
+    assert estadisticas["soats_hoy"] == 0
+    assert estadisticas["total_soats_expedidos"] == 3
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from app.core.storage import DocumentoRecibido, TMP_ROOT, publicar_blob, ruta_blob
+from app.models.models import Documento
+from app.services.documentos import _sumar_referencias, purgar_documentos
+
+CONTENIDO = b"%PDF-1.4 documento de prueba"
+SHA256 = hashlib.sha256(CONTENIDO).hexdigest()
+HACE_DOS_HORAS = time.time() - 7200
+
+
+def _recibido() -> DocumentoRecibido:
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    temporal = TMP_ROOT / "subida"
+    temporal.write_bytes(CONTENIDO)
+    return DocumentoRecibido(temporal=temporal, sha256=SHA256, tamano=len(CONTENIDO), extension="pdf")
+
+
+def _documento_sin_referencias(db) -> str:
+    """Documento cuyo último SOAT se eliminó hace tiempo: registro en 0 y blob viejo."""
+    asyncio.run(publicar_blob(_recibido()))
+    clave = ruta_blob(SHA256, "pdf")
+    os.utime(clave, (HACE_DOS_HORAS, HACE_DOS_HORAS))
+    db.add(Documento(sha256=SHA256, extension="pdf", tamano=len(CONTENIDO), referencias=0))
+    db.commit()
+    return clave
+
+
+def test_purgar_elimina_documento_sin_referencias(db, almacen_local):
+    clave = _documento_sin_referencias(db)
+
+    eliminados = purgar_documentos(db)
+
+    assert clave in eliminados
+    assert not Path(clave).exists()
+    assert db.query(Documento).count() == 0
+
+
+def test_subida_concurrente_con_purgar_conserva_el_blob(db, almacen_local):
+    clave = _documento_sin_referencias(db)
+
+    # 1. Una subida del mismo contenido encuentra el blob publicado y lo reusa
+    recibido = _recibido()
+    assert asyncio.run(publicar_blob(recibido)) == clave
+    assert not recibido.temporal.exists()
+
+    # 2. y 3. purgar borra el registro en 0 y revisa el blob antes de que la subida confirme
+    eliminados = purgar_documentos(db)
+    assert clave not in eliminados
+    assert db.query(Documento).count() == 0
+
+    # 4. La subida confirma su referencia: el blob al que apunta sigue ahí
+    _sumar_referencias(db, recibido, "pdf", 1)
+    db.commit()
+    assert Path(clave).read_bytes() == CONTENIDO
+    assert db.query(Documento.referencias).scalar() == 1
+
+    # Con la referencia confirmada, purgar ya no lo elimina aunque envejezca
+    os.utime(clave, (HACE_DOS_HORAS, HACE_DOS_HORAS))
+    assert purgar_documentos(db) == []
+    assert Path(clave).exists()
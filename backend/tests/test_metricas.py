@@ -0,0 +1,31 @@
+import pytest
+from prometheus_client import CollectorRegistry
+from app.services import metricas
+from app.services.metricas import MetricasDocumentos, MetricasNegocio, MetricasTrabajos
+
+
+def test_registrar_collectors_no_consulta_la_base(monkeypatch):
+    sesiones = []
+
+    def sin_base():
+        sesiones.append(1)
+        raise ConnectionRefusedError("sin base de datos")
+
+    monkeypatch.setattr(metricas, "ReadSessionLocal", sin_base)
+    # Como el REGISTRY global, que llama a collect() si el collector no tiene describe()
+    registro = CollectorRegistry(auto_describe=True)
+
+    for collector in (MetricasNegocio(), MetricasTrabajos(), MetricasDocumentos()):
+        registro.register(collector)
+
+    assert sesiones == []
+
+
+@pytest.mark.parametrize("collector", [MetricasNegocio, MetricasTrabajos, MetricasDocumentos])
+def test_collect_sin_base_no_emite_metricas(collector, monkeypatch):
+    def sin_base():
+        raise ConnectionRefusedError("sin base de datos")
+
+    monkeypatch.setattr(metricas, "ReadSessionLocal", sin_base)
+
+    assert list(collector().collect()) == []
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import time
+from urllib.parse import parse_qs, urlparse
+import pytest
+from app.core import storage
+from app.core.storage import (
+    BLOB_ROOT, DocumentoRecibido, TMP_ROOT, eliminar_documento, existe_documento, publicar_blob, ruta_blob
+)
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "soat-pruebas"
+CONTENIDO = b"%PDF-1.4 documento en S3"
+SHA256 = hashlib.sha256(CONTENIDO).hexdigest()
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    """S3Storage contra un S3 simulado con moto; los temporales quedan en tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    for variable in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(variable, "pruebas")
+    for nombre, valor in {
+        "STORAGE_BACKEND": "s3",
+        "S3_BUCKET": BUCKET,
+        "S3_ENDPOINT_URL": None,
+        "S3_REGION": "us-east-1",
+        "S3_ACCESS_KEY_ID": "pruebas",
+        "S3_SECRET_ACCESS_KEY": "pruebas",
+    }.items():
+        monkeypatch.setattr(storage.settings, nombre, valor)
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        storage.get_storage.cache_clear()
+        yield storage.get_storage()
+    storage.get_storage.cache_clear()
+
+
+def _temporal(contenido: bytes = CONTENIDO):
+    TMP_ROOT.mkdir(parents=True, exist_ok=True)
+    temporal = TMP_ROOT / hashlib.sha256(contenido).hexdigest()
+    temporal.write_bytes(contenido)
+    return temporal
+
+
+def test_publicar_existe_abrir_y_eliminar(s3):
+    assert isinstance(s3, storage.S3Storage)
+    clave = ruta_blob(SHA256, "pdf")
+    temporal = _temporal()
+
+    s3.publicar(temporal, clave)
+
+    assert not temporal.exists()
+    assert s3.existe(clave)
+    assert s3.abrir(clave).read() == CONTENIDO
+    s3.eliminar(clave)
+    assert not s3.existe(clave)
+    # Eliminar una clave inexistente no falla
+    s3.eliminar(clave)
+
+
+def test_tocar_renueva_la_fecha(s3):
+    clave = ruta_blob(SHA256, "pdf")
+    assert s3.tocar(clave) is False
+
+    s3.publicar(_temporal(), clave)
+    [(_, antes)] = s3.listar(str(BLOB_ROOT))
+    time.sleep(1.1)
+
+    assert s3.tocar(clave) is True
+    [(_, despues)] = s3.listar(str(BLOB_ROOT))
+    assert despues > antes
+    assert s3.abrir(clave).read() == CONTENIDO
+
+
+def test_listar_por_prefijo(s3):
+    otro = b"otro documento"
+    claves = {ruta_blob(SHA256, "pdf"), ruta_blob(hashlib.sha256(otro).hexdigest(), "jpg")}
+    s3.publicar(_temporal(), ruta_blob(SHA256, "pdf"))
+    s3.publicar(_temporal(otro), ruta_blob(hashlib.sha256(otro).hexdigest(), "jpg"))
+    s3.publicar(_temporal(b"original"), "uploads/originales/aa/bb/original.pdf")
+
+    listados = dict(s3.listar(str(BLOB_ROOT)))
+
+    assert set(listados) == claves
+    assert all(isinstance(modificado, float) for modificado in listados.values())
+
+
+def test_url_descarga_prefirmada(s3):
+    requests = pytest.importorskip("requests")
+    clave = ruta_blob(SHA256, "pdf")
+    s3.publicar(_temporal(), clave)
+
+    url = s3.url_descarga(clave, "factura.pdf", "application/pdf")
+
+    partes = urlparse(url)
+    assert partes.path.endswith(clave)
+    assert BUCKET in partes.netloc + partes.path
+    assert "inline; filename=factura.pdf" in parse_qs(partes.query)["response-content-disposition"]
+    # moto atiende la URL firmada como lo haría S3
+    respuesta = requests.get(url)
+    assert respuesta.status_code == 200
+    assert respuesta.content == CONTENIDO
+    assert respuesta.headers["Content-Type"] == "application/pdf"
+
+
+def test_publicar_blob_y_eliminar_documento(s3):
+    recibido = DocumentoRecibido(temporal=_temporal(), sha256=SHA256, tamano=len(CONTENIDO), extension="pdf")
+
+    clave = asyncio.run(publicar_blob(recibido))
+
+    assert clave == recibido.clave == ruta_blob(SHA256, "pdf")
+    assert not recibido.temporal.exists()
+    assert asyncio.run(existe_documento(clave))
+
+    # Una copia idéntica reusa el objeto publicado y descarta su temporal
+    repetido = DocumentoRecibido(temporal=_temporal(), sha256=SHA256, tamano=len(CONTENIDO), extension="pdf")
+    assert asyncio.run(publicar_blob(repetido)) == clave
+    assert not repetido.temporal.exists()
+    assert [k for k, _ in s3.listar(str(BLOB_ROOT))] == [clave]
+
+    asyncio.run(eliminar_documento(clave))
+    assert not asyncio.run(existe_documento(clave))
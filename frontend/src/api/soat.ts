@@ -8,6 +8,13 @@ import type {
   DashboardStats,
 } from '../types/index.js';
 
+// Versión de un documento para la URL de descarga: el hash del contenido si el
+// documento está guardado por contenido (la URL se puede cachear), si no la hora actual.
+const versionDocumento = (ruta?: string): string => {
+  const nombre = ruta?.split('/').pop()?.split('.')[0] ?? '';
+  return /^[0-9a-f]{64}$/.test(nombre) ? nombre : Date.now().toString();
+};
+
 export const soatAPI = {
   // Bolsa
   getSaldo: async (): Promise<Bolsa> => {
@@ -92,9 +99,39 @@ export const soatAPI = {
     return response.data;
   },
 
-  listarSoats: async (): Promise<SoatExpedido[]> => {
-    const response = await apiClient.get<SoatExpedido[]>('/api/soats/');
-    return response.data;
+  // Una página del listado; el cursor de la siguiente viene en X-Next-Cursor.
+  // La placa se filtra en el servidor por prefijo, sin importar espacios ni guiones.
+  listarSoats: async (
+    cursor?: string | null,
+    placa?: string
+  ): Promise<{ soats: SoatExpedido[]; siguiente: string | null }> => {
+    const params: Record<string, string | boolean> = {};
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    if (placa) {
+      params.placa = placa;
+      params.prefijo = true;
+    }
+    const response = await apiClient.get<SoatExpedido[]>('/api/soats/', { params });
+    return { soats: response.data, siguiente: response.headers['x-next-cursor'] ?? null };
+  },
+
+  // Todos los SOATs que cumplen el filtro (no solo las páginas cargadas), desde /export en NDJSON
+  exportarSoats: async (placa?: string): Promise<SoatExpedido[]> => {
+    const params: Record<string, string | boolean> = { formato: 'ndjson' };
+    if (placa) {
+      params.placa = placa;
+      params.prefijo = true;
+    }
+    const response = await apiClient.get<string>('/api/soats/export', {
+      params,
+      responseType: 'text',
+    });
+    return response.data
+      .split('\n')
+      .filter((linea) => linea.trim() !== '')
+      .map((linea) => JSON.parse(linea) as SoatExpedido);
   },
 
   obtenerSoat: async (id: number): Promise<SoatExpedido> => {
@@ -163,22 +200,19 @@ export const soatAPI = {
   },
 
   // Obtener URLs de documentos con token
-  getDocumentoFacturaUrl: (soatId: number): string => {
+  getDocumentoFacturaUrl: (soatId: number, documento?: string): string => {
     const token = localStorage.getItem('token');
-    const cacheBuster = Date.now();
-    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-factura?token=${token}&v=${cacheBuster}`;
+    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-factura?token=${token}&v=${versionDocumento(documento)}`;
   },
 
-  getDocumentoSoatUrl: (soatId: number): string => {
+  getDocumentoSoatUrl: (soatId: number, documento?: string): string => {
     const token = localStorage.getItem('token');
-    const cacheBuster = Date.now();
-    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-soat?token=${token}&v=${cacheBuster}`;
+    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-soat?token=${token}&v=${versionDocumento(documento)}`;
   },
 
-  getDocumentoPolizaUrl: (soatId: number): string => {
+  getDocumentoPolizaUrl: (soatId: number, documento?: string): string => {
     const token = localStorage.getItem('token');
-    const cacheBuster = Date.now();
-    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-poliza?token=${token}&v=${cacheBuster}`;
+    return `${import.meta.env.VITE_API_URL}/api/soats/${soatId}/documento-poliza?token=${token}&v=${versionDocumento(documento)}`;
   },
 
   // Dashboard
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { soatAPI } from '../api/soat';
 import type { SoatExpedido, Bolsa } from '../types/index.js';
 import { formatCurrency, formatDate } from '../utils/format';
@@ -10,11 +10,16 @@ const SALDO_MINIMO = 2000000;
 const SoatsList: React.FC = () => {
   const { isAdmin } = useAuth();
   const [soats, setSoats] = useState<SoatExpedido[]>([]);
+  const [siguienteCursor, setSiguienteCursor] = useState<string | null>(null);
+  const [cargandoMas, setCargandoMas] = useState(false);
   const [bolsa, setBolsa] = useState<Bolsa | null>(null);
   const [loading, setLoading] = useState(true);
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage] = useState(10);
   const [searchPlaca, setSearchPlaca] = useState('');
+  const [busqueda, setBusqueda] = useState(''); // Placa ya aplicada en el servidor
+  const [exportando, setExportando] = useState(false);
+  const consultaActual = useRef(0); // Descarta respuestas de búsquedas anteriores
   const [showPolizaModal, setShowPolizaModal] = useState(false);
   const [showPdfModal, setShowPdfModal] = useState(false);
   const [showEditModal, setShowEditModal] = useState(false);
@@ -36,17 +41,27 @@ const SoatsList: React.FC = () => {
   const [error, setError] = useState('');
   const [fileInputKey, setFileInputKey] = useState(0); // Para resetear inputs
 
+  // La placa se busca en el servidor 300 ms después de la última tecla
+  useEffect(() => {
+    const espera = setTimeout(() => setBusqueda(searchPlaca.trim()), 300);
+    return () => clearTimeout(espera);
+  }, [searchPlaca]);
+
+  // Cada búsqueda empieza de nuevo desde la primera página
   useEffect(() => {
     loadData();
-  }, []);
+  }, [busqueda]);
 
   const loadData = async () => {
+    const consulta = ++consultaActual.current;
     try {
       const [soatsData, bolsaData] = await Promise.all([
-        soatAPI.listarSoats(),
+        soatAPI.listarSoats(null, busqueda),
         soatAPI.getSaldo(),
       ]);
-      setSoats(soatsData);
+      if (consulta !== consultaActual.current) return;
+      setSoats(soatsData.soats);
+      setSiguienteCursor(soatsData.siguiente);
       setBolsa(bolsaData);
     } catch (error) {
       console.error('Error al cargar datos:', error);
@@ -55,18 +70,35 @@ const SoatsList: React.FC = () => {
     }
   };
 
+  // Traer la siguiente página del servidor y agregarla a las ya cargadas
+  const cargarMas = async () => {
+    if (!siguienteCursor) return;
+    const consulta = consultaActual.current;
+    setCargandoMas(true);
+    try {
+      const data = await soatAPI.listarSoats(siguienteCursor, busqueda);
+      if (consulta !== consultaActual.current) return;
+      setSoats((actuales) => [...actuales, ...data.soats]);
+      setSiguienteCursor(data.siguiente);
+    } catch (error) {
+      console.error('Error al cargar más SOATs:', error);
+    } finally {
+      setCargandoMas(false);
+    }
+  };
+
   const handleVerDocumento = (soat: SoatExpedido, tipo: 'factura' | 'soat' | 'poliza') => {
     let url = '';
     let title = '';
     
     if (tipo === 'factura' && soat.documento_factura) {
-      url = soatAPI.getDocumentoFacturaUrl(soat.id);
+      url = soatAPI.getDocumentoFacturaUrl(soat.id, soat.documento_factura);
       title = `Factura - SOAT ${soat.id}`;
     } else if (tipo === 'soat' && soat.documento_soat) {
-      url = soatAPI.getDocumentoSoatUrl(soat.id);
+      url = soatAPI.getDocumentoSoatUrl(soat.id, soat.documento_soat);
       title = `SOAT - ${soat.placa}`;
     } else if (tipo === 'poliza' && soat.documento_poliza) {
-      url = soatAPI.getDocumentoPolizaUrl(soat.id);
+      url = soatAPI.getDocumentoPolizaUrl(soat.id, soat.documento_poliza);
       title = `Póliza - SOAT ${soat.id}`;
     }
 
@@ -219,16 +251,11 @@ const SoatsList: React.FC = () => {
     return <div className="text-center py-10">Cargando...</div>;
   }
 
-  // Filtrar SOATs por placa
-  const filteredSoats = soats.filter(soat =>
-    soat.placa.toLowerCase().includes(searchPlaca.toLowerCase())
-  );
-
   // Lógica de paginación
   const indexOfLastItem = currentPage * itemsPerPage;
   const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentSoats = filteredSoats.slice(indexOfFirstItem, indexOfLastItem);
-  const totalPages = Math.ceil(filteredSoats.length / itemsPerPage);
+  const currentSoats = soats.slice(indexOfFirstItem, indexOfLastItem);
+  const totalPages = Math.ceil(soats.length / itemsPerPage);
 
   const handlePageChange = (pageNumber: number) => {
     setCurrentPage(pageNumber);
@@ -241,9 +268,20 @@ const SoatsList: React.FC = () => {
     setCurrentPage(1);
   };
 
-  // Exportar a Excel
-  const exportToExcel = () => {
-    const dataToExport = filteredSoats.map(soat => ({
+  // Exportar a Excel todos los SOATs de la búsqueda, no solo las páginas cargadas
+  const exportToExcel = async () => {
+    setExportando(true);
+    let todos: SoatExpedido[];
+    try {
+      todos = await soatAPI.exportarSoats(busqueda);
+    } catch (error) {
+      console.error('Error al exportar SOATs:', error);
+      setExportando(false);
+      return;
+    }
+    setExportando(false);
+
+    const dataToExport = todos.map(soat => ({
       'ID': soat.id,
       'Placa': soat.placa,
       'Cédula': soat.cedula || 'N/A',
@@ -260,8 +298,8 @@ const SoatsList: React.FC = () => {
     const workbook = XLSX.utils.book_new();
     XLSX.utils.book_append_sheet(workbook, worksheet, 'SOATs');
     
-    const fileName = searchPlaca 
-      ? `SOATs_${searchPlaca}_${new Date().toISOString().split('T')[0]}.xlsx`
+    const fileName = busqueda
+      ? `SOATs_${busqueda}_${new Date().toISOString().split('T')[0]}.xlsx`
       : `SOATs_${new Date().toISOString().split('T')[0]}.xlsx`;
     
     XLSX.writeFile(workbook, fileName);
@@ -273,13 +311,13 @@ const SoatsList: React.FC = () => {
         <h1 className="text-4xl font-bold text-gray-900 flex-1 text-center tracking-tight">SOATs Expedidos</h1>
         <button
           onClick={exportToExcel}
-          disabled={filteredSoats.length === 0}
+          disabled={soats.length === 0 || exportando}
           className="bg-gradient-to-r from-green-600 to-green-700 text-white px-6 py-3 rounded-xl hover:from-green-700 hover:to-green-800 shadow-lg hover:shadow-xl transition-all duration-300 font-semibold disabled:opacity-50 disabled:cursor-not-allowed flex items-center space-x-2"
         >
           <svg className="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
             <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 10v6m0 0l-3-3m3 3l3-3m2 8H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" />
           </svg>
-          <span>📈 Exportar a Excel</span>
+          <span>{exportando ? 'Exportando...' : '📈 Exportar a Excel'}</span>
         </button>
       </div>
 
@@ -349,12 +387,12 @@ const SoatsList: React.FC = () => {
             </button>
           )}
         </div>
-        {searchPlaca && (
+        {busqueda && (
           <p className="mt-2 text-sm text-gray-600">
-            {filteredSoats.length === 0 ? (
-              <span className="text-red-600 font-semibold">❌ No se encontraron SOATs con la placa "{searchPlaca}"</span>
+            {soats.length === 0 ? (
+              <span className="text-red-600 font-semibold">❌ No se encontraron SOATs con la placa "{busqueda}"</span>
             ) : (
-              <span className="text-green-600 font-semibold">✓ Se encontraron {filteredSoats.length} SOAT(s)</span>
+              <span className="text-green-600 font-semibold">✓ Se encontraron {soats.length}{siguienteCursor && '+'} SOAT(s)</span>
             )}
           </p>
         )}
@@ -460,8 +498,8 @@ const SoatsList: React.FC = () => {
         <div className="mt-6 flex items-center justify-between">
           <div className="text-sm text-gray-700">
             Mostrando <span className="font-semibold">{indexOfFirstItem + 1}</span> a{' '}
-            <span className="font-semibold">{Math.min(indexOfLastItem, filteredSoats.length)}</span> de{' '}
-            <span className="font-semibold">{filteredSoats.length}</span> SOATs{searchPlaca && ' (filtrados)'}
+            <span className="font-semibold">{Math.min(indexOfLastItem, soats.length)}</span> de{' '}
+            <span className="font-semibold">{soats.length}</span> SOATs{busqueda && ' (filtrados)'}
           </div>
           <div className="flex space-x-2">
             <button
@@ -514,6 +552,18 @@ const SoatsList: React.FC = () => {
         </div>
       )}
 
+      {siguienteCursor && (
+        <div className="mt-6 text-center">
+          <button
+            onClick={cargarMas}
+            disabled={cargandoMas}
+            className="px-6 py-3 bg-white border-2 border-gray-300 rounded-xl text-gray-700 font-semibold hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed transition-all duration-200"
+          >
+            {cargandoMas ? 'Cargando...' : 'Cargar SOATs anteriores'}
+          </button>
+        </div>
+      )}
+
       {/* Modal para Ver PDF */}
       {showPdfModal && (
         <div className="fixed z-[60] inset-0 overflow-y-auto">